@@ -0,0 +1,186 @@
+import os
+import re
+import time
+import logging
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+SLOT_FIELDS = ("name", "email", "phone", "address", "date", "time")
+# Longest one LLM request may take (both engines), so a slow model cannot stall the turn indefinitely
+AGENT_BUDGET_S = float(os.getenv("AGENT_BUDGET_S", "15"))
+# "react" (LangChain conversational ReAct agent) or "function_calling" (one structured tool call per turn)
+AGENT_ENGINE = os.getenv("AGENT_ENGINE", "react")
+_JSON_ESCAPES = {"n": "\n", "t": "\t", "r": "", "b": "", "f": "", '"': '"', "\\": "\\", "/": "/"}
+
+
+class TurnCancelled(Exception):
+    """Raised inside an agent turn whose result is no longer wanted, e.g. a discarded speculative turn."""
+
+
+class AgentTurn:
+    """
+    Result of one agent turn.
+    `slots` and `ready_to_book` are only set by engines that return structured output;
+    for the free-text ReAct engine they are None and the caller falls back to parsing `reply`.
+    """
+
+    def __init__(self, reply, slots=None, ready_to_book=None):
+        self.reply = reply
+        self.slots = slots
+        self.ready_to_book = ready_to_book
+
+    @property
+    def structured(self) -> bool:
+        return self.slots is not None
+
+
+class JsonStringExtractor:
+    """
+    Incrementally decodes one JSON string value out of streamed model output.
+    `start` matches everything up to and including the value's opening quote; text before the
+    match is ignored, and decoding stops at the closing quote.
+    """
+
+    def __init__(self, start):
+        self.start = re.compile(start) if isinstance(start, str) else start
+        self.reset()
+
+    def reset(self):
+        self._raw = ""
+        self._pos = None
+        self._done = False
+
+    @property
+    def raw(self) -> str:
+        return self._raw
+
+    def feed(self, token: str) -> str:
+        """Adds a token and returns any newly decoded text."""
+        if self._done:
+            return ""
+        self._raw += token
+        if self._pos is None:
+            match = self.start.search(self._raw)
+            if not match:
+                return ""
+            self._pos = match.end()
+
+        raw = self._raw
+        out = []
+        i = self._pos
+        while i < len(raw):
+            char = raw[i]
+            if char == "\\":
+                if i + 1 >= len(raw):
+                    break # Wait for the rest of the escape sequence
+                escaped = raw[i + 1]
+                if escaped == "u":
+                    if i + 6 > len(raw):
+                        break
+                    try:
+                        out.append(chr(int(raw[i + 2:i + 6], 16)))
+                    except ValueError:
+                        pass
+                    i += 6
+                    continue
+                out.append(_JSON_ESCAPES.get(escaped, escaped))
+                i += 2
+                continue
+            if char == '"':
+                self._done = True
+                i += 1
+                break
+            out.append(char)
+            i += 1
+        self._pos = i
+        return "".join(out)
+
+
+class AgentSessions:
+    """
+    Conversation state keyed by call/stream SID, so concurrent callers never share history.
+    `factory` builds the per-call state on first use. Sessions are released by `end` when the
+    call hangs up; idle ones are expired after `ttl` seconds as a safety net.
+    """
+
+    def __init__(self, factory, ttl):
+        self.factory = factory
+        self.ttl = ttl
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def get(self, session_id):
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = self._sessions[session_id] = self.factory()
+                logger.info(f"Agent session started: {session_id} ({len(self._sessions)} active)")
+            session.last_used = now
+            return session
+
+    def peek(self, session_id):
+        """Returns the session if it exists, without creating or refreshing it."""
+        with self._lock:
+            return self._sessions.get(session_id)
+
+    def export(self, session_id):
+        """The session's state as JSON-ready data (see SessionStore), or None if there is no session."""
+        session = self.peek(session_id)
+        return session.export_state() if session is not None else None
+
+    def restore(self, session_id, state):
+        """Replaces the session's state with one exported by `export`, possibly on another worker."""
+        self.get(session_id).restore_state(state)
+
+    def end(self, session_id):
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+        if session is not None:
+            logger.info(f"Agent session ended: {session_id} ({len(self)} active)")
+
+    def _expire(self, now):
+        expired = [sid for sid, session in self._sessions.items() if now - session.last_used > self.ttl]
+        for sid in expired:
+            del self._sessions[sid]
+            logger.warning(f"Agent session expired without being ended: {sid}")
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
+
+
+class EngineStats:
+    """Per-engine turn statistics over a sliding window: LLM round trips, tokens and latency."""
+
+    def __init__(self, name, window=500):
+        self.name = name
+        self._turns = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, round_trips, prompt_tokens, completion_tokens, latency):
+        with self._lock:
+            self._turns.append((round_trips, prompt_tokens, completion_tokens, latency))
+
+    def summary(self) -> dict:
+        with self._lock:
+            turns = list(self._turns)
+        if not turns:
+            return {"engine": self.name, "turns": 0}
+        count = len(turns)
+        latencies = sorted(turn[3] for turn in turns)
+        return {
+            "engine": self.name,
+            "turns": count,
+            "round_trips_per_turn": round(sum(turn[0] for turn in turns) / count, 2),
+            "prompt_tokens_per_turn": round(sum(turn[1] for turn in turns) / count, 1),
+            "completion_tokens_per_turn": round(sum(turn[2] for turn in turns) / count, 1),
+            "p50_ms": round(latencies[count // 2] * 1000),
+            "p95_ms": round(latencies[min(count - 1, int(count * 0.95))] * 1000),
+        }
+
+
+engine_stats = {"react": EngineStats("react"), "function_calling": EngineStats("function_calling")}
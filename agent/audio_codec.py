@@ -0,0 +1,165 @@
+import struct
+import logging
+from math import gcd
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+logger = logging.getLogger(__name__)
+
+# In-process replacements for audioop (removed in Python 3.13) and the per-utterance
+# pydub/ffmpeg conversions. Everything works on NumPy views of the input buffers.
+
+_ULAW_BIAS = 0x84
+
+
+def _build_decode_table() -> np.ndarray:
+    codes = ~np.arange(256, dtype=np.int32) & 0xFF
+    sign = codes & 0x80
+    exponent = (codes >> 4) & 0x07
+    mantissa = codes & 0x0F
+    magnitude = (((mantissa << 3) + _ULAW_BIAS) << exponent) - _ULAW_BIAS
+    return np.where(sign != 0, -magnitude, magnitude).astype(np.int16)
+
+
+def _build_encode_table() -> np.ndarray:
+    # Indexed by every int16 sample value reinterpreted as uint16.
+    # Same 14-bit G.711 algorithm as audioop.lin2ulaw, so output is bit-identical.
+    samples = np.arange(65536, dtype=np.uint16).view(np.int16).astype(np.int32) >> 2
+    mask = np.where(samples < 0, 0x7F, 0xFF)
+    magnitude = np.minimum(np.abs(samples), 8159) + (_ULAW_BIAS >> 2)
+    segment = np.searchsorted(np.array([0x3F, 0x7F, 0xFF, 0x1FF, 0x3FF, 0x7FF, 0xFFF, 0x1FFF]), magnitude)
+    code = np.where(segment >= 8, 0x7F, (segment << 4) | ((magnitude >> (segment + 1)) & 0x0F))
+    return ((code ^ mask) & 0xFF).astype(np.uint8)
+
+
+ULAW_DECODE_TABLE = _build_decode_table()
+ULAW_ENCODE_TABLE = _build_encode_table()
+
+
+def as_int16(pcm) -> np.ndarray:
+    """Returns 16-bit PCM (bytes-like or array) as an int16 array, without copying when possible."""
+    if isinstance(pcm, np.ndarray):
+        return pcm.astype(np.int16, copy=False)
+    return np.frombuffer(pcm, dtype="<i2")
+
+
+def ulaw_decode(ulaw) -> np.ndarray:
+    """Decodes μ-law bytes to an int16 PCM array with a 256-entry lookup table."""
+    return ULAW_DECODE_TABLE[np.frombuffer(ulaw, dtype=np.uint8)]
+
+
+def ulaw_encode(pcm) -> bytes:
+    """Encodes 16-bit PCM (bytes-like or int16 array) to μ-law bytes with a 64K-entry lookup table."""
+    return ULAW_ENCODE_TABLE[as_int16(pcm).view(np.uint16)].tobytes()
+
+
+def rms(pcm) -> float:
+    """Root-mean-square energy of 16-bit PCM."""
+    samples = as_int16(pcm)
+    if samples.size == 0:
+        return 0.0
+    return float(np.sqrt(np.mean(samples.astype(np.float32) ** 2)))
+
+
+def to_mono(samples: np.ndarray, channels: int) -> np.ndarray:
+    if channels == 1:
+        return samples
+    return samples.reshape(-1, channels).mean(axis=1).astype(np.int16)
+
+
+class PolyphaseResampler:
+    """
+    Streaming rational-ratio resampler (e.g. 24kHz TTS PCM down to 8kHz).
+    A Kaiser-windowed sinc low-pass is split into `up` polyphase branches, so only the
+    output samples are computed; filter history is carried between chunks.
+    """
+
+    def __init__(self, in_rate: int, out_rate: int, taps_per_phase: int = 24):
+        divisor = gcd(in_rate, out_rate)
+        self.up = out_rate // divisor
+        self.down = in_rate // divisor
+        self.taps = taps_per_phase
+
+        num_taps = taps_per_phase * self.up
+        # Cut off just below the lower Nyquist frequency, normalized to the upsampled rate
+        cutoff = 0.5 * min(1.0, self.up / self.down) / self.up * 0.9
+        n = np.arange(num_taps) - (num_taps - 1) / 2
+        h = 2 * cutoff * np.sinc(2 * cutoff * n) * np.kaiser(num_taps, 6.0)
+        h *= self.up / h.sum() # Unity gain per polyphase branch
+        # _phases[p, j] = h[p + j * up]
+        self._phases = h.reshape(taps_per_phase, self.up).T.astype(np.float32)
+        self._reversed = np.ascontiguousarray(self._phases[:, ::-1]) # Oldest sample first, to match windows
+        self.reset()
+
+    def reset(self):
+        self._history = np.zeros(self.taps - 1, dtype=np.float32)
+        self._base = -(self.taps - 1) # Absolute input index of _history[0]
+        self._next = 0 # Upsampled-domain position of the next output sample
+
+    def process(self, pcm) -> np.ndarray:
+        """Resamples a chunk of 16-bit PCM and returns the int16 output available so far."""
+        samples = as_int16(pcm)
+        if self.up == self.down:
+            return samples
+        buffer = np.concatenate((self._history, samples.astype(np.float32)))
+        last = self._base + len(buffer) - 1
+        if self._next // self.up > last:
+            return np.zeros(0, dtype=np.int16)
+
+        count = ((last + 1) * self.up - 1 - self._next) // self.down + 1
+        # windows[i] is buffer[i:i + taps]; a strided view, nothing is copied
+        windows = sliding_window_view(buffer, self.taps)
+        out = np.empty(count, dtype=np.float32)
+        # Output k uses phase (next + k * down) % up, so every up-th output shares a phase and
+        # its input window advances by `down` samples: one strided matrix-vector product per phase.
+        for first in range(min(self.up, count)):
+            position = self._next + first * self.down
+            start = position // self.up - self._base - (self.taps - 1)
+            out[first::self.up] = windows[start::self.down][:len(range(first, count, self.up))] @ self._reversed[position % self.up]
+
+        self._next += count * self.down
+        self._history = buffer[len(buffer) - (self.taps - 1):]
+        self._base = last - (self.taps - 1) + 1
+        return np.clip(np.rint(out), -32768, 32767).astype(np.int16)
+
+
+def resample(pcm, in_rate: int, out_rate: int) -> np.ndarray:
+    """Resamples a complete 16-bit PCM buffer in one call."""
+    return PolyphaseResampler(in_rate, out_rate).process(pcm)
+
+
+def parse_wav(data):
+    """
+    Splits a PCM WAV buffer into (samples view, sample_rate, channels, sample_width)
+    without copying. Tolerates streamed WAVs whose size fields are not filled in.
+    """
+    view = memoryview(data)
+    if bytes(view[:4]) != b"RIFF" or bytes(view[8:12]) != b"WAVE":
+        raise ValueError("Not a RIFF/WAVE buffer")
+    pos = 12
+    fmt = None
+    while pos + 8 <= len(view):
+        chunk_id = bytes(view[pos:pos + 4])
+        chunk_size = struct.unpack("<I", view[pos + 4:pos + 8])[0]
+        body = pos + 8
+        if chunk_id == b"fmt ":
+            audio_format, channels, sample_rate = struct.unpack("<HHI", view[body:body + 8])
+            sample_width = struct.unpack("<H", view[body + 14:body + 16])[0] // 8
+            if audio_format not in (1, 0xFFFE):
+                raise ValueError(f"Unsupported WAV encoding: {audio_format}")
+            fmt = (sample_rate, channels, sample_width)
+        elif chunk_id == b"data":
+            if fmt is None:
+                raise ValueError("WAV data chunk before fmt chunk")
+            end = len(view) if chunk_size in (0, 0xFFFFFFFF) else min(len(view), body + chunk_size)
+            return (view[body:end],) + fmt
+        pos = body + chunk_size + (chunk_size & 1)
+    raise ValueError("WAV buffer has no data chunk")
+
+
+def pcm_to_ulaw(pcm, in_rate: int, channels: int = 1) -> bytes:
+    """Converts 16-bit PCM at any rate to Twilio's 8kHz mono μ-law in one pass."""
+    samples = to_mono(as_int16(pcm), channels)
+    if in_rate != 8000:
+        samples = resample(samples, in_rate, 8000)
+    return ulaw_encode(samples)
@@ -0,0 +1,376 @@
+import os
+import csv
+import json
+import time
+import heapq
+import random
+import asyncio
+import logging
+import argparse
+from collections import Counter
+from xml.sax.saxutils import quoteattr
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+TWILIO_ACCOUNT_SID = os.getenv("TWILIO_ACCOUNT_SID")
+TWILIO_AUTH_TOKEN = os.getenv("TWILIO_AUTH_TOKEN")
+FROM_NUMBER = os.getenv("TWILIO_PHONE_NUMBER")
+AGENT_MEDIA_URL = os.getenv("AGENT_MEDIA_URL", "wss://your-server.com/media")
+# Overridable so the dialer can run against a local fake (benchmarks/dial_test.py)
+TWILIO_API_BASE = os.getenv("TWILIO_API_BASE", "https://api.twilio.com")
+# Public URL Twilio posts call progress to; must reach the dialer's callback server
+DIALER_STATUS_CALLBACK_URL = os.getenv("DIALER_STATUS_CALLBACK_URL")
+
+DIALER_CONCURRENCY = int(os.getenv("DIALER_CONCURRENCY", "10"))
+# Twilio's default outbound limit is 1 call per second per account
+DIALER_CPS = float(os.getenv("DIALER_CPS", "1"))
+DIALER_MAX_ATTEMPTS = int(os.getenv("DIALER_MAX_ATTEMPTS", "3"))
+# A call with no final status callback after this long is given up on and its slot freed
+DIALER_CALL_TIMEOUT_S = float(os.getenv("DIALER_CALL_TIMEOUT_S", "900"))
+
+# Seconds before the next attempt, by outcome; outcomes not listed are not retried
+RETRY_DELAYS = {
+    "busy": float(os.getenv("DIALER_RETRY_BUSY_S", "300")),
+    "no-answer": float(os.getenv("DIALER_RETRY_NO_ANSWER_S", "1800")),
+    "failed": float(os.getenv("DIALER_RETRY_FAILED_S", "600")),
+    "timeout": float(os.getenv("DIALER_RETRY_TIMEOUT_S", "600")),
+}
+FINAL_STATUSES = {"completed", "busy", "no-answer", "failed", "canceled"}
+
+
+def stream_twiml(media_url=AGENT_MEDIA_URL):
+    """Same TwiML as make_outbound_call: stream the call's audio to the agent and hold the line."""
+    return (
+        "<Response><Start><Stream url=" + quoteattr(media_url) + " /></Start>"
+        '<Pause length="300"/></Response>'
+    )
+
+
+class TokenBucket:
+    """Async token bucket: `acquire` waits until a token is available. Refills at `rate` per second up to `burst`."""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        # The lock keeps waiters in order, so one slow refill does not let later callers jump ahead
+        async with self._lock:
+            self._refill()
+            while self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= 1
+
+    def penalize(self, seconds):
+        """Empties the bucket for `seconds`, e.g. after the API reported a rate limit."""
+        self.tokens = min(self.tokens, 0) - seconds * self.rate
+
+
+class TwilioAPIError(Exception):
+    def __init__(self, status, code=None, message=""):
+        super().__init__(f"Twilio API error {status} ({code}): {message}")
+        self.status = status
+        self.code = code
+
+    @property
+    def rate_limited(self) -> bool:
+        return self.status == 429 or self.code == 20429
+
+
+class TwilioCallsClient:
+    """
+    Minimal async client for the Calls resource. The REST API is called directly (the twilio
+    helper library's async client cannot be pointed at another host), so a local fake can stand
+    in for Twilio in tests.
+    """
+
+    def __init__(self, account_sid=TWILIO_ACCOUNT_SID, auth_token=TWILIO_AUTH_TOKEN, base_url=TWILIO_API_BASE, timeout=10.0):
+        self.account_sid = account_sid
+        self._http = httpx.AsyncClient(base_url=base_url, auth=(account_sid or "", auth_token or ""), timeout=timeout)
+
+    async def create_call(self, to, from_, twiml, status_callback=None, record=True) -> str:
+        """Places a call and returns its SID."""
+        data = {"To": to, "From": from_, "Twiml": twiml, "Record": "true" if record else "false"}
+        if status_callback:
+            data["StatusCallback"] = status_callback
+            data["StatusCallbackMethod"] = "POST"
+            # Form fields may repeat; httpx sends a list value as repeated fields
+            data["StatusCallbackEvent"] = ["initiated", "ringing", "answered", "completed"]
+        response = await self._http.post(f"/2010-04-01/Accounts/{self.account_sid}/Calls.json", data=data)
+        if response.status_code >= 400:
+            try:
+                body = response.json()
+            except ValueError:
+                body = {}
+            raise TwilioAPIError(response.status_code, body.get("code"), body.get("message", response.text[:200]))
+        return response.json()["sid"]
+
+    async def close(self):
+        await self._http.aclose()
+
+
+class Lead:
+    __slots__ = ("phone", "name", "fields", "attempts", "outcome", "call_sid", "outcomes")
+
+    def __init__(self, phone, name="", fields=None):
+        self.phone = phone
+        self.name = name
+        self.fields = fields or {}
+        self.attempts = 0
+        self.outcome = None  # Last call outcome
+        self.call_sid = None
+        self.outcomes = []
+
+    def __repr__(self):
+        return f"Lead({self.phone!r}, attempts={self.attempts}, outcome={self.outcome!r})"
+
+
+def load_leads(path):
+    """Reads leads from a CSV (with a header row) or JSONL file. Each needs a phone (or "to") field."""
+    with open(path, encoding="utf-8", newline="") as f:
+        if path.endswith(".jsonl"):
+            rows = [json.loads(line) for line in f if line.strip()]
+        else:
+            rows = list(csv.DictReader(f))
+    leads = []
+    for row in rows:
+        phone = (row.get("phone") or row.get("to") or "").strip()
+        if not phone:
+            logger.warning(f"Skipping lead without a phone number: {row}")
+            continue
+        leads.append(Lead(phone, (row.get("name") or "").strip(), row))
+    return leads
+
+
+class CampaignDialer:
+    """
+    Dials a list of leads, keeping up to `concurrency` calls in flight and starting at most
+    `cps` calls per second (token bucket). Outcomes arrive through Twilio status callbacks
+    (`on_status`) rather than by polling each call. Busy, no-answer and failed calls are
+    rescheduled per RETRY_DELAYS until `max_attempts`; a rate-limited create is retried after
+    backing off without counting as an attempt.
+    """
+
+    def __init__(self, leads, client, from_number=FROM_NUMBER, status_callback=DIALER_STATUS_CALLBACK_URL,
+                 concurrency=DIALER_CONCURRENCY, cps=DIALER_CPS, max_attempts=DIALER_MAX_ATTEMPTS,
+                 retry_delays=None, call_timeout=DIALER_CALL_TIMEOUT_S, twiml=None):
+        self.leads = list(leads)
+        self.client = client
+        self.from_number = from_number
+        self.status_callback = status_callback
+        self.concurrency = concurrency
+        self.bucket = TokenBucket(cps, burst=1)
+        self.max_attempts = max_attempts
+        self.retry_delays = retry_delays if retry_delays is not None else RETRY_DELAYS
+        self.call_timeout = call_timeout
+        self.twiml = twiml or stream_twiml()
+        self._due = []  # Heap of (due time, sequence, lead)
+        self._seq = 0
+        self._in_flight = {}  # call SID -> (lead, future resolved with the final status)
+        self._early = {}  # Final statuses that arrived before the create response was handled
+        self._slots = None
+        self._wakeup = None
+        self._active = 0  # Attempts in progress, including ones still waiting for a token
+        self._tasks = set()
+        self.outcomes = Counter()
+        self.created = 0
+        self.create_errors = 0
+        self.rate_limited = 0
+        self.max_in_flight = 0
+        self.create_latencies = []
+        self.started_at = None
+        self.finished_at = None
+
+    def _schedule(self, lead, delay=0.0):
+        self._seq += 1
+        heapq.heappush(self._due, (time.monotonic() + delay, self._seq, lead))
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def on_status(self, params):
+        """Handles one status callback (form fields from Twilio). Returns True if the call was ours."""
+        sid = params.get("CallSid")
+        status = params.get("CallStatus", "")
+        entry = self._in_flight.get(sid)
+        if entry is None:
+            if sid and status in FINAL_STATUSES and len(self._early) < 1000:
+                self._early[sid] = status
+            return False
+        logger.debug(f"Call {sid} to {entry[0].phone}: {status}")
+        if status in FINAL_STATUSES and not entry[1].done():
+            entry[1].set_result(status)
+        return True
+
+    async def _call(self, lead):
+        """One attempt on `lead`; holds a concurrency slot until the call ends."""
+        loop = asyncio.get_running_loop()
+        try:
+            await self.bucket.acquire()
+            started = time.monotonic()
+            try:
+                sid = await self.client.create_call(lead.phone, self.from_number, self.twiml, self.status_callback)
+            except TwilioAPIError as e:
+                if e.rate_limited:
+                    # Back off and requeue; Twilio did not place the call, so it is not an attempt
+                    self.rate_limited += 1
+                    self.bucket.penalize(1.0)
+                    self._schedule(lead, random.uniform(0.5, 1.5))
+                    return
+                self.create_errors += 1
+                lead.attempts += 1
+                logger.error(f"Could not call {lead.phone}: {e}")
+                # A request Twilio rejected (e.g. an invalid number) will not succeed on retry
+                self._finish(lead, "rejected" if e.status < 500 else "failed")
+                return
+            except httpx.HTTPError as e:
+                self.create_errors += 1
+                lead.attempts += 1
+                logger.error(f"Could not reach Twilio to call {lead.phone}: {e}")
+                self._finish(lead, "failed")
+                return
+            self.create_latencies.append(time.monotonic() - started)
+            self.created += 1
+            lead.attempts += 1
+            lead.call_sid = sid
+            ended = loop.create_future()
+            if sid in self._early:
+                ended.set_result(self._early.pop(sid))
+            self._in_flight[sid] = (lead, ended)
+            self.max_in_flight = max(self.max_in_flight, len(self._in_flight))
+            logger.info(f"Calling {lead.phone} (attempt {lead.attempts}): {sid}")
+            try:
+                status = await asyncio.wait_for(ended, self.call_timeout)
+            except asyncio.TimeoutError:
+                status = "timeout"
+            finally:
+                del self._in_flight[sid]
+            self._finish(lead, status)
+        finally:
+            self._active -= 1
+            self._slots.release()
+            self._wakeup.set()
+
+    def _finish(self, lead, status):
+        lead.outcome = status
+        lead.outcomes.append(status)
+        self.outcomes[status] += 1
+        delay = self.retry_delays.get(status)
+        if delay is not None and lead.attempts < self.max_attempts:
+            logger.info(f"Call to {lead.phone} ended {status}; retrying in {delay:.0f} s")
+            self._schedule(lead, delay * random.uniform(0.9, 1.1))
+        else:
+            logger.info(f"Lead {lead.phone} done after {lead.attempts} attempt(s): {status}")
+
+    async def run(self):
+        """Dials until every lead is finished. Returns `summary()`."""
+        self._slots = asyncio.Semaphore(self.concurrency)
+        self._wakeup = asyncio.Event()
+        self.started_at = time.monotonic()
+        for lead in self.leads:
+            self._schedule(lead)
+        while self._due or self._active:
+            self._wakeup.clear()
+            if self._due and self._due[0][0] <= time.monotonic() and not self._slots.locked():
+                await self._slots.acquire()
+                lead = heapq.heappop(self._due)[2]
+                self._active += 1
+                task = asyncio.ensure_future(self._call(lead))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+                continue
+            timeout = None
+            if self._due and not self._slots.locked():
+                timeout = max(0.0, self._due[0][0] - time.monotonic())
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        self.finished_at = time.monotonic()
+        return self.summary()
+
+    def summary(self) -> dict:
+        elapsed = (self.finished_at or time.monotonic()) - (self.started_at or time.monotonic())
+        latencies = sorted(self.create_latencies)
+        summary = {
+            "leads": len(self.leads),
+            "calls_created": self.created,
+            "elapsed_s": round(elapsed, 2),
+            "dial_rate_cps": round(self.created / elapsed, 3) if elapsed else 0.0,
+            "max_in_flight": self.max_in_flight,
+            "outcomes": dict(self.outcomes),
+            "leads_by_outcome": dict(Counter(lead.outcome for lead in self.leads)),
+            "rate_limited": self.rate_limited,
+            "create_errors": self.create_errors,
+        }
+        if latencies:
+            summary["create_ms_p50"] = round(latencies[len(latencies) // 2] * 1000, 1)
+            summary["create_ms_max"] = round(latencies[-1] * 1000, 1)
+        return summary
+
+
+def status_app(dialer):
+    """Small app receiving Twilio status callbacks for `dialer`; unsigned callbacks are refused."""
+    from fastapi import FastAPI, Request, Depends
+    from services.Auth import verify_twilio_signature
+
+    app = FastAPI()
+
+    @app.post("/dialer/status", dependencies=[Depends(verify_twilio_signature)])
+    async def status(request: Request):
+        form = await request.form()
+        dialer.on_status(dict(form))
+        return {"status": "received"}
+
+    return app
+
+
+async def run_campaign(leads, callback_port, **kwargs):
+    """Runs `leads` to completion with a status callback server on `callback_port`."""
+    import uvicorn
+
+    client = TwilioCallsClient()
+    status_callback = DIALER_STATUS_CALLBACK_URL or f"http://127.0.0.1:{callback_port}/dialer/status"
+    dialer = CampaignDialer(leads, client, status_callback=status_callback, **kwargs)
+    server = uvicorn.Server(uvicorn.Config(status_app(dialer), host="0.0.0.0", port=callback_port, log_level="warning"))
+    serving = asyncio.ensure_future(server.serve())
+    try:
+        while not server.started:
+            await asyncio.sleep(0.05)
+        return await dialer.run()
+    finally:
+        server.should_exit = True
+        await serving
+        await client.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    parser = argparse.ArgumentParser(description="Dial a list of leads with the voice agent.")
+    parser.add_argument("leads", help="CSV with a header row, or JSONL; each lead needs a phone field")
+    parser.add_argument("--concurrency", type=int, default=DIALER_CONCURRENCY)
+    parser.add_argument("--cps", type=float, default=DIALER_CPS, help="Calls started per second")
+    parser.add_argument("--max-attempts", type=int, default=DIALER_MAX_ATTEMPTS)
+    parser.add_argument("--callback-port", type=int, default=int(os.getenv("DIALER_CALLBACK_PORT", "8001")))
+    args = parser.parse_args()
+    if not TWILIO_ACCOUNT_SID or not TWILIO_AUTH_TOKEN or not FROM_NUMBER:
+        parser.error("TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN and TWILIO_PHONE_NUMBER must be set")
+    if not DIALER_STATUS_CALLBACK_URL:
+        logger.warning("DIALER_STATUS_CALLBACK_URL is not set; Twilio cannot reach a localhost callback, so outcomes will time out.")
+    summary = asyncio.run(run_campaign(
+        load_leads(args.leads), args.callback_port,
+        concurrency=args.concurrency, cps=args.cps, max_attempts=args.max_attempts,
+    ))
+    print(json.dumps(summary, indent=2))
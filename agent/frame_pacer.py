@@ -0,0 +1,75 @@
+import os
+import time
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+FRAME_MS = 20 # One Twilio media frame: 160 bytes of 8kHz μ-law
+
+
+class FramePacer:
+    """
+    Paces outbound media frames against a monotonic clock.
+    Frame n is due at start + n * 20 ms - lead, and every wait is computed from that
+    schedule rather than from the previous send, so scheduler jitter never accumulates
+    into drift. The lead keeps a small, bounded amount of audio buffered at Twilio.
+
+    underruns: frames sent after they should already have been playing (audible gap);
+               the schedule is re-based so the sender does not burst to catch up.
+    overruns:  sends after which more audio is queued at Twilio than the lead plus a
+               tolerance, e.g. because too many frames are packed into one message. A sender
+               that is merely ahead of real time is held back, which is normal, not an overrun.
+    """
+
+    def __init__(self, lead_ms=None, frame_ms=FRAME_MS, clock=time.monotonic, sleep=asyncio.sleep, tolerance_ms=None):
+        self.lead = (lead_ms if lead_ms is not None else int(os.getenv("PACER_LEAD_MS", "100"))) / 1000
+        self.tolerance = (tolerance_ms if tolerance_ms is not None else int(os.getenv("PACER_OVERRUN_TOLERANCE_MS", "40"))) / 1000
+        self.frame = frame_ms / 1000
+        self._clock = clock
+        self._sleep = sleep
+        self.underruns = 0
+        self.overruns = 0
+        self.late_seconds = 0.0
+        self.frames_sent = 0
+        self.reset()
+
+    def reset(self):
+        """Starts a new schedule; call when outbound audio starts after the buffer has drained."""
+        self._start = None
+        self._scheduled = 0
+
+    @property
+    def buffered_ms(self) -> float:
+        """Audio sent but not yet played according to the schedule, in ms."""
+        if self._start is None:
+            return 0.0
+        return max(0.0, (self._start + self._scheduled * self.frame - self._clock()) * 1000)
+
+    async def wait(self, frames: int = 1):
+        """Waits until the next `frames` frames may be sent, then accounts for them."""
+        now = self._clock()
+        if self._start is None:
+            self._start = now
+        due = self._start + self._scheduled * self.frame - self.lead
+        if due > now:
+            await self._sleep(due - now)
+        else:
+            play_time = self._start + self._scheduled * self.frame
+            if now > play_time:
+                # Twilio ran out of audio before this frame arrived
+                self.underruns += 1
+                self.late_seconds += now - play_time
+                self._start = now - self._scheduled * self.frame
+        self._scheduled += frames
+        self.frames_sent += frames
+        if self._start + self._scheduled * self.frame - self._clock() > self.lead + self.tolerance:
+            self.overruns += 1
+
+    def stats(self) -> dict:
+        return {
+            "frames_sent": self.frames_sent,
+            "underruns": self.underruns,
+            "overruns": self.overruns,
+            "late_ms": round(self.late_seconds * 1000, 1),
+        }
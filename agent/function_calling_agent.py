@@ -0,0 +1,255 @@
+import os
+import re
+import json
+import time
+import logging
+from collections import deque
+from agent.agent_engine import AgentTurn, AgentSessions, JsonStringExtractor, TurnCancelled, SLOT_FIELDS, AGENT_BUDGET_S, engine_stats
+from services.Metrics import PROVIDER_ERRORS
+from services.Resilience import breakers
+from services.Availability import availability, describe_availability
+
+logger = logging.getLogger(__name__)
+
+AGENT_MODEL = os.getenv("OPENAI_AGENT_MODEL", "gpt-4o")
+# Recent messages sent with each turn; collected details travel separately as structured state
+AGENT_HISTORY_MESSAGES = int(os.getenv("AGENT_HISTORY_MESSAGES", "12"))
+
+_REPLY_START = re.compile(r'"reply"\s*:\s*"')
+_READY_TO_BOOK = re.compile(r'"ready_to_book"\s*:\s*(true|false)')
+
+SYSTEM_PROMPT = (
+    "You are a friendly and professional real estate appointment assistant on a phone call. "
+    "Ask for the caller's name and the property they want to view, then collect their email, "
+    "phone number and preferred appointment date and time. Only offer times the calendar line shows as open, "
+    "and suggest its open slots when the requested one is taken. Confirm the details back to them. "
+    "Keep replies to one or two short spoken sentences without markdown or lists. "
+    "Always answer by calling the respond function. Put only details the caller stated or corrected "
+    "in this turn into slots, with dates as YYYY-MM-DD and times as HH:MM (24-hour). "
+    "Set ready_to_book only when every detail is known and the caller explicitly confirmed the booking. "
+    "If the caller declines, thank them and say goodbye."
+)
+
+RESPOND_TOOL = {
+    "type": "function",
+    "function": {
+        "name": "respond",
+        "description": "Speak to the caller and record the appointment details from this turn.",
+        "parameters": {
+            "type": "object",
+            # Slots and the booking flag come first so the reply can stream as it is written; models
+            # do not always keep this order, and a reply written first is held until the flag arrives
+            "properties": {
+                "slots": {
+                    "type": "object",
+                    "description": "Details the caller stated or corrected in this turn. Omit anything not mentioned.",
+                    "properties": {
+                        "name": {"type": "string"},
+                        "email": {"type": "string"},
+                        "phone": {"type": "string"},
+                        "address": {"type": "string", "description": "Address of the property to view"},
+                        "date": {"type": "string", "description": "YYYY-MM-DD"},
+                        "time": {"type": "string", "description": "HH:MM, 24-hour"},
+                    },
+                },
+                "ready_to_book": {"type": "boolean"},
+                "reply": {"type": "string", "description": "What to say to the caller next"},
+            },
+            "required": ["slots", "ready_to_book", "reply"],
+        },
+    },
+}
+_TOOL_CHOICE = {"type": "function", "function": {"name": "respond"}}
+
+
+class FunctionCallingSession:
+    """One call's state: the details collected so far plus a short window of recent messages."""
+
+    def __init__(self):
+        self.slots = {field: "" for field in SLOT_FIELDS}
+        self.history = deque(maxlen=AGENT_HISTORY_MESSAGES)
+        self.last_used = time.monotonic()
+
+    def export_state(self) -> dict:
+        return {"slots": dict(self.slots), "history": list(self.history)}
+
+    def restore_state(self, state):
+        self.slots.update(state.get("slots", {}))
+        self.history.clear()
+        self.history.extend(state.get("history", []))
+
+
+class FunctionCallingAgent:
+    """
+    Agent engine built on native tool calling.
+    Every turn is a single model call with the respond function forced, which returns the spoken
+    reply together with typed slot updates and a booking flag. There is no Thought/Action
+    scaffolding to generate and no second round trip to read a tool result; booking itself is
+    done by the caller once ready_to_book is set.
+    """
+
+    def __init__(self, model=AGENT_MODEL, ttl=3600):
+        self.model = model
+        self.sessions = AgentSessions(FunctionCallingSession, ttl)
+        self.stats = engine_stats["function_calling"]
+
+    def _messages(self, slots, history, user_input):
+        known = {field: value for field, value in slots.items() if value}
+        state = f"Details collected so far: {json.dumps(known) if known else 'none'}."
+        if availability.loaded:
+            # The respond function is forced, so availability travels with the state instead of as a tool
+            state += f" Calendar: {describe_availability(availability, slots.get('date'), slots.get('time'))}"
+        return (
+            [{"role": "system", "content": f"{SYSTEM_PROMPT}\n{state}"}]
+            + list(history)
+            + [{"role": "user", "content": user_input}]
+        )
+
+    def _request(self, messages, **kwargs):
+        import openai # Deferred to the first turn; the SDK is slow to import
+        return openai.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            tools=[RESPOND_TOOL],
+            tool_choice=_TOOL_CHOICE,
+            temperature=0,
+            timeout=AGENT_BUDGET_S,
+            **kwargs,
+        )
+
+    def _call(self, messages):
+        response = self._request(messages)
+        tool_calls = response.choices[0].message.tool_calls or []
+        arguments = tool_calls[0].function.arguments if tool_calls else "{}"
+        return arguments, response.usage
+
+    def _call_streaming(self, messages, on_text, cancelled=None):
+        if cancelled is not None and cancelled.is_set():
+            raise TurnCancelled()
+        stream = self._request(messages, stream=True, stream_options={"include_usage": True})
+        extractor = JsonStringExtractor(_REPLY_START)
+        usage = None
+        booking = None # Unknown until the model has written the flag
+        held = []
+        arguments = "" # The extractor stops recording at the end of the reply; slots may follow it
+        for chunk in stream:
+            if cancelled is not None and cancelled.is_set():
+                stream.close() # Drops the connection rather than reading a reply nobody will hear
+                raise TurnCancelled()
+            if chunk.usage is not None:
+                usage = chunk.usage
+            if not chunk.choices or not chunk.choices[0].delta.tool_calls:
+                continue
+            fragment = chunk.choices[0].delta.tool_calls[0].function.arguments or ""
+            arguments += fragment
+            text = extractor.feed(fragment)
+            if text:
+                held.append(text)
+            if booking is None:
+                flag = _READY_TO_BOOK.search(arguments)
+                if flag is None:
+                    continue # The reply may come first; hold it back until the flag says whether to speak it
+                booking = flag.group(1) == "true"
+            # A booking turn is not spoken; the handler confirms once the calendar call succeeds
+            if held and not booking:
+                on_text("".join(held))
+            held.clear()
+        if held and not booking:
+            on_text("".join(held)) # The model never wrote the flag, which _parse reads as false
+        return arguments, usage
+
+    @staticmethod
+    def _parse(arguments) -> AgentTurn:
+        try:
+            data = json.loads(arguments)
+        except (TypeError, ValueError):
+            logger.warning(f"Agent returned malformed function arguments: {arguments!r}")
+            data = {}
+        slots = {
+            field: str(value).strip()
+            for field, value in (data.get("slots") or {}).items()
+            if field in SLOT_FIELDS and value not in (None, "")
+        }
+        return AgentTurn(str(data.get("reply") or ""), slots, bool(data.get("ready_to_book")))
+
+    def run_turn(self, user_input: str, session_id: str, on_text=None, known=None, commit=True, cancelled=None) -> AgentTurn:
+        """
+        Runs one turn. With `on_text`, the reply is streamed to it as the model writes it.
+        `known` holds details already extracted outside the model; they are merged into the
+        session state the model sees.
+        With commit=False the session is left untouched (speculative turns); pass the result
+        to `commit_turn` to apply it later. Such turns do not count towards the agent breaker or
+        engine stats, and a streamed one stops with TurnCancelled once `cancelled` (an Event) is set.
+        Returns the AgentTurn with this turn's slot updates; `slots` on the session hold all of them.
+        """
+        session = self.sessions.get(session_id)
+        slots = dict(session.slots)
+        if known:
+            slots.update({field: value for field, value in known.items() if field in SLOT_FIELDS and value})
+        messages = self._messages(slots, session.history, user_input)
+        started = time.monotonic()
+        try:
+            if on_text is None:
+                arguments, usage = self._call(messages)
+            else:
+                arguments, usage = self._call_streaming(messages, on_text, cancelled)
+        except TurnCancelled:
+            raise
+        except Exception as e:
+            PROVIDER_ERRORS.inc(provider="agent")
+            if not commit:
+                raise # A failed speculative turn is simply discarded
+            breakers["agent"].failure()
+            logger.error(f"Error running function-calling agent: {e}")
+            return AgentTurn("Sorry, I encountered an error. Could you please try again?", {}, False)
+
+        turn = self._parse(arguments)
+        if commit:
+            breakers["agent"].success()
+            self.stats.record(
+                1,
+                getattr(usage, "prompt_tokens", 0),
+                getattr(usage, "completion_tokens", 0),
+                time.monotonic() - started,
+            )
+            self.commit_turn(user_input, turn, session_id, known)
+        return turn
+
+    def commit_turn(self, user_input: str, turn: AgentTurn, session_id: str, known=None):
+        """Applies a turn's slot updates and messages to the session."""
+        session = self.sessions.get(session_id)
+        if known:
+            session.slots.update({field: value for field, value in known.items() if field in SLOT_FIELDS and value})
+        session.slots.update(turn.slots)
+        if turn.ready_to_book:
+            # Hand the complete set to the booking step, not just this turn's updates
+            turn.slots = dict(session.slots)
+        session.history.append({"role": "user", "content": user_input})
+        session.history.append({"role": "assistant", "content": turn.reply})
+
+    def remember_turn(self, user_input: str, reply: str, session_id: str):
+        """Adds an exchange answered outside the model to the session history."""
+        session = self.sessions.get(session_id)
+        session.history.append({"role": "user", "content": user_input})
+        session.history.append({"role": "assistant", "content": reply})
+
+    def record_interruption(self, heard_text: str, session_id: str):
+        session = self.sessions.peek(session_id)
+        if session is None:
+            return
+        for message in reversed(session.history):
+            if message["role"] == "assistant":
+                if heard_text:
+                    message["content"] = f"{heard_text} [interrupted by the caller]"
+                else:
+                    message["content"] = "[interrupted by the caller before hearing the reply]"
+                break
+
+    def export_session(self, session_id: str):
+        return self.sessions.export(session_id)
+
+    def restore_session(self, session_id: str, state):
+        self.sessions.restore(session_id, state)
+
+    def end_session(self, session_id: str):
+        self.sessions.end(session_id)
@@ -14,6 +14,8 @@ TWILIO_AUTH_TOKEN = os.getenv("TWILIO_AUTH_TOKEN")
 FROM_NUMBER = os.getenv("TWILIO_PHONE_NUMBER")
 TO_NUMBER = os.getenv("CALL_TO_NUMBER") # Ensure this matches your .env
 AGENT_MEDIA_URL = os.getenv("AGENT_MEDIA_URL", "wss://your-server.com/media")
+# Public URL of the server's /status endpoint; call progress is pushed there instead of polled
+STATUS_CALLBACK_URL = os.getenv("STATUS_CALLBACK_URL")
 
 # Set up logging (ensure this doesn't duplicate handlers if main.py sets it up)
 # logging.basicConfig(
@@ -58,6 +60,10 @@ def make_call():
         "twiml": twiml,
         "record": True # Add this line to enable recording
     }
+    if STATUS_CALLBACK_URL:
+        payload["status_callback"] = STATUS_CALLBACK_URL
+        payload["status_callback_method"] = "POST"
+        payload["status_callback_event"] = ["initiated", "ringing", "answered", "completed"]
 
     logger.info("Payload to Twilio:")
     print(json.dumps(payload, indent=2))
@@ -70,7 +76,11 @@ def make_call():
         logger.info(f"Call initiated. SID: {call.sid}")
         logger.info(f"Call status: {call.status}")
 
-        # Poll for call status updates (optional, but good for monitoring)
+        if STATUS_CALLBACK_URL:
+            logger.info(f"Call progress will be posted to {STATUS_CALLBACK_URL}; see /call-stats.")
+            return
+
+        # Without a status callback, poll for call status updates
         logger.info("Polling for call status updates...")
         # Poll for a reasonable time, e.g., 60 seconds (12 * 5s)
         for _ in range(12):
@@ -3,9 +3,13 @@ import logging
 import sys
 import base64
 import asyncio
-import audioop # Import audioop for ulaw conversion
-from pydub import AudioSegment
+import time
+from io import BytesIO
 from fastapi import WebSocket # Import WebSocket for type hinting
+from services.Executor import audio_stage, tts_stage
+from agent.frame_pacer import FramePacer
+from agent.audio_codec import PolyphaseResampler, parse_wav, pcm_to_ulaw, ulaw_encode
+from services.Metrics import FRAMES_OUT, PROVIDER_ERRORS, current_turn, observe_stage, span
 
 # Set up proper console logging (ensure this is only done once)
 # Consider moving this to main.py or server.py
@@ -20,87 +24,371 @@ logger = logging.getLogger(__name__)
 SAMPLE_RATE = 8000
 SAMPLE_WIDTH = 2  # 16-bit
 CHANNELS = 1
-CHUNK_SIZE = 160 # Bytes per chunk (8kHz * 16-bit * 1 channel * 0.01 seconds)
+CHUNK_SIZE = 160 # Bytes per 20 ms frame of 8kHz 8-bit μ-law
+# Frames packed into each outbound media message (fewer, larger WebSocket messages)
+FRAMES_PER_MESSAGE = int(os.getenv("PACER_FRAMES_PER_MESSAGE", "1"))
 
-async def send_audio_to_twilio(ws: WebSocket, audio_file_path: str):
+def convert_audio_to_ulaw(audio) -> bytes:
     """
-    Reads an audio file, converts it to Twilio's required format (8kHz, 16-bit, mono, μ-law),
-    and streams it over the WebSocket.
+    Decodes audio (bytes, memoryview, BytesIO or a file path) and converts it to
+    Twilio's required format (8kHz, mono, μ-law).
+    WAV input (what TextToSpeech.speak returns) is converted in-process with the NumPy codec;
+    other formats such as mp3 fall back to pydub/ffmpeg.
     """
-    if not audio_file_path or not os.path.exists(audio_file_path):
-        logger.error(f"[AUDIO → TWILIO] Error: Audio file not found or path is invalid: {audio_file_path}")
+    if isinstance(audio, str):
+        with open(audio, "rb") as f:
+            audio = f.read()
+    elif isinstance(audio, BytesIO):
+        audio = audio.getbuffer()
+
+    if bytes(audio[:4]) == b"RIFF":
+        samples, rate, channels, width = parse_wav(audio)
+        if width == SAMPLE_WIDTH:
+            return pcm_to_ulaw(samples, rate, channels)
+    return convert_audio_to_ulaw_pydub(audio)
+
+
+def convert_audio_to_ulaw_pydub(audio) -> bytes:
+    """
+    Converts any ffmpeg-readable audio to 8kHz μ-law through pydub.
+    This spawns ffmpeg and is only used for compressed formats; async callers run it in the audio stage.
+    """
+    from pydub import AudioSegment # Optional; only needed for compressed input
+
+    if isinstance(audio, (bytes, bytearray, memoryview)):
+        audio = BytesIO(audio)
+
+    # Load audio using pydub
+    # pydub requires ffmpeg installed to read mp3
+    audio = AudioSegment.from_file(audio)
+
+    # Convert to 8kHz, 16-bit, mono
+    audio = audio.set_frame_rate(SAMPLE_RATE)
+    audio = audio.set_sample_width(SAMPLE_WIDTH)
+    audio = audio.set_channels(CHANNELS)
+
+    # Export as raw PCM data
+    # Use export(format="wav") to get a WAV file object, then read its data
+    # This is a common way to get raw PCM from pydub
+    wav_buffer = BytesIO()
+    audio.export(wav_buffer, format="wav")
+    wav_buffer.seek(0)
+    # Read the WAV header (44 bytes) and then the raw PCM data
+    wav_buffer.read(44) # Skip WAV header
+    raw_audio_data = wav_buffer.read()
+
+    # Convert PCM to μ-law
+    return ulaw_encode(raw_audio_data)
+
+
+async def send_audio_to_twilio(ws, audio):
+    """
+    Converts audio (in-memory bytes/BytesIO, or a file path) to Twilio's required
+    format (8kHz, 16-bit, mono, μ-law) and streams it over the WebSocket.
+    Returns the monotonic time the first frame went out, or None if nothing was sent.
+    """
+    if isinstance(audio, str) and not os.path.exists(audio):
+        logger.error(f"[AUDIO → TWILIO] Error: Audio file not found or path is invalid: {audio}")
+        return
+    if audio is None or (not isinstance(audio, (str, BytesIO)) and len(audio) == 0):
+        logger.error("[AUDIO → TWILIO] Error: No audio to send.")
         return
 
-    logger.info(f"[AUDIO → TWILIO] Processing audio file: {audio_file_path}")
+    logger.info(f"[AUDIO → TWILIO] Processing audio: {audio if isinstance(audio, str) else type(audio).__name__}")
 
     try:
-        # Load audio file using pydub
-        # pydub requires ffmpeg installed to read mp3
-        audio = AudioSegment.from_file(audio_file_path)
-
-        # Convert to 8kHz, 16-bit, mono
-        audio = audio.set_frame_rate(SAMPLE_RATE)
-        audio = audio.set_sample_width(SAMPLE_WIDTH)
-        audio = audio.set_channels(CHANNELS)
-
-        # Export as raw PCM data
-        # Use export(format="wav") to get a WAV file object, then read its data
-        # This is a common way to get raw PCM from pydub
-        from io import BytesIO
-        wav_buffer = BytesIO()
-        audio.export(wav_buffer, format="wav")
-        wav_buffer.seek(0)
-        # Read the WAV header (44 bytes) and then the raw PCM data
-        wav_buffer.read(44) # Skip WAV header
-        raw_audio_data = wav_buffer.read()
-
-
-        # Convert PCM to μ-law
-        # Ensure audioop is imported
-        ulaw_audio_data = audioop.lin2ulaw(raw_audio_data, SAMPLE_WIDTH)
+        # Decode off the event loop so other calls keep streaming meanwhile
+        with span("transcode"):
+            ulaw_audio_data = await audio_stage.run(convert_audio_to_ulaw, audio)
 
         logger.info(f"[AUDIO → TWILIO] Converted audio to μ-law. Total bytes: {len(ulaw_audio_data)}")
+        return await send_ulaw_to_twilio(ws, ulaw_audio_data)
 
-        # --- Add a small delay before streaming starts ---
-        logger.info("[AUDIO → TWILIO] Waiting briefly before streaming...")
-        await asyncio.sleep(0.1) # Wait 100ms
+    except Exception as e:
+        logger.error(f"[AUDIO → TWILIO] Error processing or streaming audio: {e}", exc_info=True) # Log exception details
 
-        # Stream in chunks
-        chunks_sent = 0
-        for i in range(0, len(ulaw_audio_data), CHUNK_SIZE):
-            chunk = ulaw_audio_data[i:i + CHUNK_SIZE]
-            payload = base64.b64encode(chunk).decode('utf-8')
-
-            message = {
-                "event": "media",
-                "media": {
-                    "payload": payload
-                }
-            }
-            try:
-                # Check if WebSocket is still open before sending
-                # Note: This check might not catch immediate closure before the send call itself
-                if ws.application_state.name != "CONNECTED" or ws.client_state.name != "CONNECTED":
-                    logger.warning("[AUDIO → TWILIO] WebSocket is closed before sending chunk, stopping stream.")
-                    break
 
-                # --- Add more specific error handling around send_json ---
-                try:
-                    await ws.send_json(message)
-                    # logger.debug(f"[AUDIO → TWILIO] Sent chunk {chunks_sent + 1}") # Use debug for less verbose logs
-                    chunks_sent += 1
-                    await asyncio.sleep(0.01) # Small delay to simulate real-time streaming (10ms per chunk)
-                except Exception as send_error:
-                    logger.error(f"[AUDIO → TWILIO] Error sending chunk {chunks_sent + 1}: {send_error}", exc_info=True) # Log exception details
-                    break # Stop streaming on error
+class TwilioPlayback:
+    """
+    Outbound side of one Twilio media stream.
+    Sends media frames, and `mark` messages after each spoken piece so we learn what the caller
+    actually heard. The receive side can interrupt playback (barge-in), which stops sending and
+    sends Twilio's `clear` event to flush audio it has buffered but not played yet.
+    """
+
+    def __init__(self, ws: WebSocket, stream_sid: str = None, frames_per_message: int = FRAMES_PER_MESSAGE):
+        self.ws = ws
+        self.stream_sid = stream_sid
+        self.call_sid = None # From Twilio's start event, for the call record
+        self.ended = False # The call is over (Twilio sent "stop" or we hung up), not just this connection
+        self.pacer = FramePacer()
+        self.message_bytes = CHUNK_SIZE * max(1, frames_per_message)
+        self.interrupted = asyncio.Event()
+        self.heard = [] # Pieces of the current turn the caller heard in full
+        self._turn = 0
+        self._mark_seq = 0
+        self._pending_marks = {} # mark name -> (turn, text)
+        self._sending = 0
+        self.turn_first_frame_at = None # When the current turn's first frame went out
+
+    @property
+    def is_playing(self) -> bool:
+        """True while we are sending audio or Twilio still has unplayed audio buffered."""
+        return self._sending > 0 or bool(self._pending_marks)
+
+    def begin_turn(self):
+        """Starts a new agent turn: clears the interruption flag and the heard pieces."""
+        self._turn += 1
+        self.heard = []
+        self.interrupted.clear()
+        self.turn_first_frame_at = None
+
+    def heard_text(self) -> str:
+        return " ".join(self.heard)
+
+    def export_state(self) -> dict:
+        return {"turn": self._turn, "mark_seq": self._mark_seq}
+
+    def restore_state(self, state):
+        """Continues turn and mark numbering from a previous connection for the same call."""
+        self._turn = state.get("turn", 0)
+        self._mark_seq = state.get("mark_seq", 0)
+
+    def _message(self, event: str, **fields) -> dict:
+        message = {"event": event}
+        if self.stream_sid:
+            message["streamSid"] = self.stream_sid
+        message.update(fields)
+        return message
+
+    def begin_audio(self):
+        if self._sending == 0 and not self._pending_marks:
+            # Twilio's buffer has drained, so pacing starts a fresh schedule
+            self.pacer.reset()
+        self._sending += 1
+
+    def end_audio(self):
+        self._sending -= 1
+
+    async def send_chunk(self, chunk: bytes) -> bool:
+        """
+        Sends one μ-law chunk (up to message_bytes) as a Twilio media message, paced to real time.
+        Returns False if streaming should stop.
+        """
+        if self.interrupted.is_set():
+            return False
+
+        # Check if WebSocket is still open before sending
+        # Note: This check might not catch immediate closure before the send call itself
+        if self.ws.application_state.name != "CONNECTED" or self.ws.client_state.name != "CONNECTED":
+            logger.warning("[AUDIO → TWILIO] WebSocket is closed before sending chunk, stopping stream.")
+            return False
+
+        await self.pacer.wait(-(-len(chunk) // CHUNK_SIZE))
+        if self.interrupted.is_set():
+            return False
+        payload = base64.b64encode(chunk).decode('utf-8')
+        try:
+            await self.ws.send_json(self._message("media", media={"payload": payload}))
+            FRAMES_OUT.inc(-(-len(chunk) // CHUNK_SIZE))
+            if self.turn_first_frame_at is None:
+                self.turn_first_frame_at = time.monotonic()
+            return True
+        except Exception as send_error:
+            logger.error(f"[AUDIO → TWILIO] Error sending chunk: {send_error}", exc_info=True) # Log exception details
+            return False # Stop streaming on error
+
+    async def send_mark(self, text: str):
+        """Queues a mark after the audio sent so far; Twilio echoes it once that audio has played."""
+        if self.interrupted.is_set():
+            return
+        self._mark_seq += 1
+        name = f"seg-{self._mark_seq}"
+        self._pending_marks[name] = (self._turn, text)
+        try:
+            await self.ws.send_json(self._message("mark", mark={"name": name}))
+        except Exception as e:
+            logger.error(f"[AUDIO → TWILIO] Error sending mark: {e}")
+            self._pending_marks.pop(name, None)
+
+    def on_mark(self, name: str):
+        """Handles a mark echoed by Twilio: the piece before it was heard in full."""
+        turn, text = self._pending_marks.pop(name, (None, None))
+        if turn == self._turn:
+            self.heard.append(text)
+
+    async def interrupt(self):
+        """Barge-in: stops outbound audio and flushes what Twilio has buffered."""
+        if self.interrupted.is_set():
+            return
+        self.interrupted.set()
+        self.pacer.reset()
+        # Twilio echoes the marks it discards on clear; forget them so they don't count as heard
+        self._pending_marks.clear()
+        try:
+            await self.ws.send_json(self._message("clear"))
+            logger.info("[AUDIO → TWILIO] Sent clear event to flush buffered audio.")
+        except Exception as e:
+            logger.error(f"[AUDIO → TWILIO] Error sending clear event: {e}")
 
-            except Exception as outer_error:
-                 # This catch is less likely but good practice
-                 logger.error(f"[AUDIO → TWILIO] Unexpected error in streaming loop: {outer_error}", exc_info=True)
-                 break # Stop streaming on error
 
+def as_playback(ws) -> TwilioPlayback:
+    """Accepts either a bare WebSocket or a call's TwilioPlayback."""
+    return ws if isinstance(ws, TwilioPlayback) else TwilioPlayback(ws)
+
+
+async def send_ulaw_to_twilio(ws, ulaw_audio_data: bytes):
+    """
+    Streams audio that is already 8kHz μ-law (e.g. from the prompt cache) over the WebSocket.
+    No synthesis or transcoding happens here.
+    Returns the monotonic time the first frame went out, or None if nothing was sent.
+    """
+    playback = as_playback(ws)
+    first_frame_at = None
+    playback.begin_audio()
+    try:
+        # Stream in paced chunks
+        chunks_sent = 0
+        step = playback.message_bytes
+        for i in range(0, len(ulaw_audio_data), step):
+            if not await playback.send_chunk(ulaw_audio_data[i:i + step]):
+                break
+            if first_frame_at is None:
+                first_frame_at = time.monotonic()
+            chunks_sent += 1
 
         logger.info(f"[AUDIO → TWILIO] Streaming complete! Sent {chunks_sent} chunks.")
 
     except Exception as e:
-        logger.error(f"[AUDIO → TWILIO] Error processing or streaming audio: {e}", exc_info=True) # Log exception details
+        logger.error(f"[AUDIO → TWILIO] Error streaming audio: {e}", exc_info=True) # Log exception details
+    finally:
+        playback.end_audio()
+    return first_frame_at
+
+
+class PcmToUlawStream:
+    """
+    Incremental converter from 16-bit mono PCM at any rate to 8kHz μ-law.
+    Keeps the resampler state and any odd trailing byte between chunks,
+    so audio can be converted piece by piece as it arrives.
+    """
+
+    def __init__(self, input_rate: int):
+        self.input_rate = input_rate
+        self._resampler = PolyphaseResampler(input_rate, SAMPLE_RATE)
+        self._carry = b""
+
+    def convert(self, pcm_chunk: bytes) -> bytes:
+        data = self._carry + pcm_chunk
+        usable = len(data) - len(data) % SAMPLE_WIDTH
+        self._carry = data[usable:]
+        if not usable:
+            return b""
+        return ulaw_encode(self._resampler.process(memoryview(data)[:usable]))
+
+
+class UlawStream:
+    """
+    Converts a blocking PCM iterator (e.g. TextToSpeech.stream_pcm) into a queue of
+    8kHz μ-law chunks in the background. Synthesis starts as soon as the stream is created,
+    so a stream can be prepared while earlier audio is still playing.
+    """
+
+    def __init__(self, pcm_chunks, input_rate: int):
+        self._loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue()
+        self._cancelled = False
+        # The producer thread does not inherit the turn context, so capture it here
+        self._turn = current_turn()
+        self._task = asyncio.ensure_future(tts_stage.run(self._produce, pcm_chunks, input_rate))
+
+    def _produce(self, pcm_chunks, input_rate):
+        converter = PcmToUlawStream(input_rate)
+        started = time.monotonic()
+        first_audio = True
+        transcode_seconds = 0.0
+        try:
+            for chunk in pcm_chunks:
+                if self._cancelled:
+                    break
+                if first_audio:
+                    # Only the turn's first segment delays the reply; later ones overlap playback
+                    turn = self._turn if self._turn and "tts_first_audio" not in self._turn.stages else None
+                    observe_stage("tts_first_audio", time.monotonic() - started, turn)
+                    first_audio = False
+                converted_at = time.monotonic()
+                ulaw_chunk = converter.convert(chunk)
+                transcode_seconds += time.monotonic() - converted_at
+                if ulaw_chunk:
+                    self._loop.call_soon_threadsafe(self.queue.put_nowait, ulaw_chunk)
+        except Exception as e:
+            PROVIDER_ERRORS.inc(provider="tts")
+            logger.error(f"[AUDIO → TWILIO] TTS stream failed: {e}", exc_info=True)
+        finally:
+            observe_stage("transcode", transcode_seconds, self._turn)
+            self._loop.call_soon_threadsafe(self.queue.put_nowait, None)
+
+    def cancel(self):
+        """Stops synthesis after the current chunk."""
+        self._cancelled = True
+
+    async def wait(self):
+        await self._task
+
+
+async def play_ulaw_stream(ws, stream: UlawStream):
+    """
+    Sends μ-law audio from a UlawStream as 20 ms frames as soon as it arrives.
+    Returns the monotonic time the first frame went out, or None if nothing was sent.
+    """
+    playback = as_playback(ws)
+    playback.begin_audio()
+    try:
+        return await _play_ulaw_stream(playback, stream)
+    finally:
+        playback.end_audio()
+
+
+async def _play_ulaw_stream(playback: TwilioPlayback, stream: UlawStream):
+    step = playback.message_bytes
+    pending = b""
+    first_frame_at = None
+    chunks_sent = 0
+    streaming = True
+
+    while True:
+        chunk = await stream.queue.get()
+        if chunk is None:
+            break
+        if not streaming:
+            continue # Drain the producer after a send failure
+        pending += chunk
+        usable = len(pending) - len(pending) % step
+        for i in range(0, usable, step):
+            if not await playback.send_chunk(pending[i:i + step]):
+                streaming = False
+                stream.cancel()
+                break
+            if first_frame_at is None:
+                first_frame_at = time.monotonic()
+            chunks_sent += 1
+        pending = pending[usable:]
+
+    if streaming and pending and await playback.send_chunk(pending):
+        chunks_sent += 1
+        if first_frame_at is None:
+            first_frame_at = time.monotonic()
+    await stream.wait()
+
+    logger.info(f"[AUDIO → TWILIO] Streaming TTS complete! Sent {chunks_sent} chunks.")
+    return first_frame_at
+
+
+async def stream_tts_to_twilio(ws, pcm_chunks, input_rate: int):
+    """
+    Streams speech to Twilio while it is still being synthesized.
+    pcm_chunks is a blocking iterator of raw PCM (e.g. TextToSpeech.stream_pcm); it is driven
+    from the TTS stage and each chunk is converted to μ-law and sent as soon as it arrives.
+    Returns the monotonic time the first frame went out, or None if nothing was sent.
+    """
+    return await play_ulaw_stream(ws, UlawStream(pcm_chunks, input_rate))
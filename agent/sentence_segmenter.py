@@ -0,0 +1,56 @@
+import re
+
+# A sentence ends at . ! or ? followed by whitespace; clauses may also end at , ; or :
+_SENTENCE_END = re.compile(r'[.!?]+["\')\]]*\s')
+_CLAUSE_END = re.compile(r'[,;:]\s')
+# Short words ending in a period that do not end a sentence
+_ABBREVIATIONS = {"mr.", "mrs.", "ms.", "dr.", "st.", "ave.", "e.g.", "i.e.", "etc.", "apt.", "no."}
+
+
+class SentenceSegmenter:
+    """
+    Cuts a stream of LLM tokens into speakable segments for TTS.
+    Complete sentences are emitted as soon as they end; long sentences are also cut at clause
+    boundaries once they exceed `max_chars`, so speech can start before the model finishes.
+    """
+
+    def __init__(self, min_chars=12, max_chars=120):
+        self.min_chars = min_chars
+        self.max_chars = max_chars
+        self._buffer = ""
+
+    def push(self, token: str) -> list:
+        """Adds a token and returns the segments it completed (possibly none)."""
+        self._buffer += token
+        segments = []
+        while True:
+            cut = self._find_cut()
+            if cut is None:
+                break
+            segment = self._buffer[:cut].strip()
+            self._buffer = self._buffer[cut:]
+            if segment:
+                segments.append(segment)
+        return segments
+
+    def flush(self):
+        """Returns whatever text is left at the end of the stream, or None."""
+        segment = self._buffer.strip()
+        self._buffer = ""
+        return segment or None
+
+    def _find_cut(self):
+        for match in _SENTENCE_END.finditer(self._buffer):
+            end = match.end()
+            candidate = self._buffer[:end].strip()
+            if len(candidate) < self.min_chars:
+                continue
+            last_word = candidate.rsplit(None, 1)[-1].lower()
+            if last_word in _ABBREVIATIONS:
+                continue
+            return end
+        if len(self._buffer) > self.max_chars:
+            clauses = [m.end() for m in _CLAUSE_END.finditer(self._buffer) if m.end() >= self.min_chars]
+            if clauses:
+                return clauses[-1]
+        return None
@@ -0,0 +1,405 @@
+import re
+import logging
+from datetime import date, timedelta
+from agent.agent_engine import SLOT_FIELDS
+
+logger = logging.getLogger(__name__)
+
+# Deterministic parsers for the lead fields, run on every transcript before the agent.
+# They only need to handle how people say these things on the phone; anything they miss
+# is still collected by the agent.
+
+_DIGIT_WORDS = {
+    "zero": "0", "oh": "0", "o": "0", "one": "1", "two": "2", "three": "3", "four": "4",
+    "five": "5", "six": "6", "seven": "7", "eight": "8", "nine": "9",
+}
+_REPEAT_WORDS = {"double": 2, "triple": 3}
+_HOUR_WORDS = {
+    "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7, "eight": 8,
+    "nine": 9, "ten": 10, "eleven": 11, "twelve": 12,
+}
+_MINUTE_WORDS = {
+    "o'clock": 0, "oh five": 5, "ten": 10, "fifteen": 15, "twenty": 20, "twenty five": 25,
+    "thirty": 30, "thirty five": 35, "forty": 40, "forty five": 45, "fifty": 50, "fifty five": 55,
+}
+_WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+_MONTHS = {
+    name: number for number, names in enumerate(
+        [("january", "jan"), ("february", "feb"), ("march", "mar"), ("april", "apr"), ("may",),
+         ("june", "jun"), ("july", "jul"), ("august", "aug"), ("september", "sep", "sept"),
+         ("october", "oct"), ("november", "nov"), ("december", "dec")], start=1)
+    for name in names
+}
+_ORDINAL_UNITS = ["first", "second", "third", "fourth", "fifth", "sixth", "seventh", "eighth", "ninth"]
+_ORDINALS = dict(zip(_ORDINAL_UNITS, range(1, 10)))
+_ORDINALS.update(zip(
+    ["tenth", "eleventh", "twelfth", "thirteenth", "fourteenth", "fifteenth", "sixteenth",
+     "seventeenth", "eighteenth", "nineteenth", "twentieth", "thirtieth"],
+    list(range(10, 21)) + [30]))
+for _unit, _value in zip(_ORDINAL_UNITS, range(1, 10)):
+    _ORDINALS[f"twenty {_unit}"] = 20 + _value
+_ORDINALS["thirty first"] = 31
+
+_TLDS = "com|net|org|edu|gov|io|co|us|uk|ca|info|biz|me|ai"
+_EMAIL = re.compile(r"\b[\w.+-]+@[\w-]+(?:\.[\w-]+)+\b")
+_SPOKEN_EMAIL = re.compile(
+    r"\b((?:[a-z0-9]+(?:\s+(?:dot|underscore|dash|hyphen)\s+|[._-]))*[a-z0-9]+)"
+    r"\s+at\s+([a-z0-9-]+(?:(?:\s+dot\s+|\.)[a-z0-9-]+)*(?:\s+dot\s+|\.)(?:" + _TLDS + r"))\b"
+)
+_SPELLED = re.compile(r"\b(?:[a-z]\s+){2,}[a-z]\b") # "j o h n" -> "john"
+
+_STREET_TYPES = (
+    "street|st|avenue|ave|road|rd|boulevard|blvd|drive|dr|lane|ln|court|ct|way|place|pl|"
+    "terrace|circle|parkway|highway|hwy"
+)
+_ADDRESS = re.compile(
+    r"\b(\d{1,6}\s+(?:[A-Za-z0-9'.-]+\s+){0,4}?(?:" + _STREET_TYPES + r"))\b\.?"
+    r"((?:,?\s+(?:apartment|apt|unit|suite)\s+\w+)?)",
+    re.IGNORECASE,
+)
+
+_ISO_DATE = re.compile(r"\b(\d{4})-(\d{1,2})-(\d{1,2})\b")
+_RELATIVE_DAY = re.compile(r"\b(the day after tomorrow|day after tomorrow|tomorrow|today|tonight)\b")
+_WEEKDAY = re.compile(r"\b(?:(next|this|coming|on)\s+)?(" + "|".join(_WEEKDAYS) + r")\b")
+_IN_DAYS = re.compile(r"\bin\s+(a|one|two|three|four|five|six|\d+)\s+(day|days|week|weeks)\b")
+_ORDINAL_PATTERN = "|".join(sorted(_ORDINALS, key=len, reverse=True))
+_DAY_NUMBER = r"(\d{1,2})(?:st|nd|rd|th)?|(" + _ORDINAL_PATTERN + r")"
+_MONTH_NAMES = "|".join(sorted(_MONTHS, key=len, reverse=True))
+_MONTH_DAY = re.compile(r"\b(" + _MONTH_NAMES + r")\.?\s+(?:the\s+)?(?:" + _DAY_NUMBER + r")\b(?:,?\s+(\d{4}))?")
+_DAY_MONTH = re.compile(r"\b(?:the\s+)?(?:" + _DAY_NUMBER + r")\s+of\s+(" + _MONTH_NAMES + r")\b(?:,?\s+(\d{4}))?")
+
+_MERIDIEM = r"(a\.?\s?m\.?|p\.?\s?m\.?|in the morning|in the afternoon|in the evening|at night|tonight)"
+_CLOCK_TIME = re.compile(r"\b(\d{1,2})(?::(\d{2}))?\s*" + _MERIDIEM)
+_COLON_TIME = re.compile(r"\b(\d{1,2}):(\d{2})\b")
+_HOUR_WORD = "|".join(_HOUR_WORDS)
+_MINUTE_WORD = "|".join(sorted(_MINUTE_WORDS, key=len, reverse=True))
+_SPOKEN_TIME = re.compile(
+    r"\b(at|around|about|by|make it|say)?\s*(" + _HOUR_WORD + r"|\d{1,2})"
+    r"(?:\s+(" + _MINUTE_WORD + r"))?(?:\s*" + _MERIDIEM + r")?(?=\W|$)"
+)
+_NEXT_WORD = re.compile(r"\s*([a-z']+)")
+# A bare "at four" is only read as a time where the clause ends, or a day or a new clause follows
+_CLAUSE_FOLLOWERS = {
+    "and", "but", "or", "so", "then", "if", "please", "works", "would", "could", "should", "is",
+    "sounds", "suits", "that", "this", "next", "on", "tomorrow", "today", "tonight", "instead",
+    "sharp", "latest", "maybe", "ok", "okay", "i", "we", "for",
+} | set(_WEEKDAYS)
+# A number followed by these is a quantity ("one of the units", "two hundred thousand"), not a time
+_QUANTITY_FOLLOWERS = {
+    "of", "hundred", "thousand", "million", "k", "grand", "percent", "dollars", "bucks", "people",
+    "bedroom", "bedrooms", "bed", "beds", "bathroom", "bathrooms", "bath", "baths", "units", "houses",
+    "homes", "rooms", "floors", "square", "feet", "foot", "acres", "minutes", "hours", "days",
+    "weeks", "months", "years", "times", "kids", "cars",
+}
+_PAST_TO = re.compile(r"\b(half|quarter)\s+(past|after|to)\s+(" + _HOUR_WORD + r"|\d{1,2})(?:\s*" + _MERIDIEM + r")?")
+_NOON = re.compile(r"\b(noon|midday)\b")
+
+_STRONG_NAME = re.compile(r"\b(?:my name is|my name's|name is|call me)\s+([a-z][a-z'-]*(?:\s+[a-z][a-z'-]*){0,2})", re.IGNORECASE)
+_WEAK_NAME = re.compile(r"\b(?:[Tt]his is|I'm|I am|[Ii]t's)\s+([A-Z][a-z'-]+(?:\s+[A-Z][a-z'-]+){0,2})")
+_NAME_STOPWORDS = {
+    "and", "i", "im", "my", "from", "calling", "looking", "interested", "here", "not", "just", "so",
+    "sorry", "okay", "ok", "fine", "good", "great", "well", "the", "a", "an", "about", "available",
+    "free", "busy", "sure", "yes", "no", "actually", "but", "with", "at", "in", "on", "is",
+}
+
+_PHONE_TOKEN = re.compile(r"\+|\d+|[a-z']+|[^\s\w]")
+
+
+def _mask(text, span):
+    """Blanks out a matched span so later parsers do not read the same words again."""
+    start, end = span
+    return text[:start] + " " * (end - start) + text[end:]
+
+
+def _join_spelled(match):
+    return match.group(0).replace(" ", "")
+
+
+def parse_email(text):
+    """Returns (email, span) for a written or spoken ("john at example dot com") address, or None."""
+    match = _EMAIL.search(text)
+    if match:
+        return match.group(0).lower().rstrip("."), match.span()
+    lowered = text.lower()
+    # Join letters spelled out one by one; keep the text length so spans still line up
+    spelled = _SPELLED.sub(lambda m: _join_spelled(m).ljust(len(m.group(0))), lowered)
+    match = _SPOKEN_EMAIL.search(spelled)
+    if not match:
+        return None
+    local = re.sub(r"\s+dot\s+", ".", match.group(1))
+    local = re.sub(r"\s+underscore\s+", "_", local)
+    local = re.sub(r"\s+(?:dash|hyphen)\s+", "-", local)
+    domain = re.sub(r"\s+dot\s+", ".", match.group(2))
+    return f"{local.replace(' ', '')}@{domain.replace(' ', '')}", match.span()
+
+
+def parse_address(text):
+    """Returns (address, span) for a street address such as "42 Elm Street, apt 3", or None."""
+    match = _ADDRESS.search(text)
+    if not match:
+        return None
+    street = " ".join(word if word.isupper() or word[:1].isdigit() else word.capitalize() for word in match.group(1).split())
+    unit = match.group(2).strip(" ,")
+    return (f"{street}, {unit[:1].upper()}{unit[1:]}" if unit else street), match.span()
+
+
+def _next_weekday(today, weekday, include_today=False):
+    days = (weekday - today.weekday()) % 7
+    if days == 0 and not include_today:
+        days = 7
+    return today + timedelta(days=days)
+
+
+def _day_number(digits, ordinal):
+    return int(digits) if digits else _ORDINALS[ordinal]
+
+
+def _month_date(today, month, day, year):
+    try:
+        result = date(int(year) if year else today.year, month, day)
+    except ValueError:
+        return None
+    if not year and result < today:
+        # Dates without a year that already passed mean next year
+        result = result.replace(year=result.year + 1)
+    return result
+
+
+def parse_date(text, today=None):
+    """
+    Returns (date, span) for an ISO, calendar ("July 10th", "the tenth of July") or relative
+    ("tomorrow", "next Tuesday", "in three days") date, or None.
+    A bare or "this"/"coming" weekday is the nearest upcoming one; "next <weekday>" skips to the
+    following week when the nearest one is still in the current week.
+    """
+    today = today or date.today()
+    lowered = text.lower()
+
+    match = _ISO_DATE.search(lowered)
+    if match:
+        try:
+            return date(*map(int, match.groups())), match.span()
+        except ValueError:
+            pass
+
+    match = _MONTH_DAY.search(lowered)
+    if match:
+        result = _month_date(today, _MONTHS[match.group(1)], _day_number(match.group(2), match.group(3)), match.group(4))
+        if result:
+            return result, match.span()
+    match = _DAY_MONTH.search(lowered)
+    if match:
+        result = _month_date(today, _MONTHS[match.group(3)], _day_number(match.group(1), match.group(2)), match.group(4))
+        if result:
+            return result, match.span()
+
+    match = _RELATIVE_DAY.search(lowered)
+    if match:
+        offset = {"today": 0, "tonight": 0, "tomorrow": 1}.get(match.group(1), 2)
+        return today + timedelta(days=offset), match.span()
+
+    match = _WEEKDAY.search(lowered)
+    if match:
+        qualifier, name = match.groups()
+        weekday = _WEEKDAYS.index(name)
+        result = _next_weekday(today, weekday, include_today=qualifier == "this")
+        if qualifier == "next" and result.isocalendar()[1] == today.isocalendar()[1]:
+            result += timedelta(days=7)
+        return result, match.span()
+
+    match = _IN_DAYS.search(lowered)
+    if match:
+        count, unit = match.groups()
+        count = 1 if count in ("a", "one") else int(_HOUR_WORDS.get(count, count))
+        days = count * 7 if unit.startswith("week") else count
+        return today + timedelta(days=days), match.span()
+    return None
+
+
+def _to_24h(hour, minute, meridiem):
+    if not 0 <= minute < 60:
+        return None
+    if meridiem:
+        if hour < 1 or hour > 12:
+            return None
+        evening = meridiem.startswith("p") or meridiem in ("in the afternoon", "in the evening", "at night", "tonight")
+        hour = hour % 12 + (12 if evening else 0)
+    elif hour > 23:
+        return None
+    elif 1 <= hour <= 7:
+        # Viewings happen during the day: "at four" means 4 PM
+        hour += 12
+    return f"{hour:02d}:{minute:02d}"
+
+
+def _meridiem(value):
+    return value.replace(".", "").replace(" ", "") if value and value[0] in "ap" else value
+
+
+def parse_time(text):
+    """Returns ("HH:MM", span) for a clock time ("3:30 pm", "half past four", "at three thirty"), or None."""
+    lowered = text.lower()
+
+    match = _NOON.search(lowered)
+    if match:
+        return "12:00", match.span()
+
+    match = _PAST_TO.search(lowered)
+    if match:
+        amount, direction, hour, meridiem = match.groups()
+        hour = int(_HOUR_WORDS.get(hour, hour))
+        minutes = 30 if amount == "half" else 15
+        if direction == "to":
+            hour, minutes = (hour - 1) or 12, 60 - minutes
+        result = _to_24h(hour, minutes, _meridiem(meridiem))
+        if result:
+            return result, match.span()
+
+    match = _CLOCK_TIME.search(lowered)
+    if match:
+        hour, minute, meridiem = match.groups()
+        result = _to_24h(int(hour), int(minute or 0), _meridiem(meridiem))
+        if result:
+            return result, match.span()
+
+    match = _COLON_TIME.search(lowered)
+    if match:
+        result = _to_24h(int(match.group(1)), int(match.group(2)), None)
+        if result:
+            return result, match.span()
+
+    for match in _SPOKEN_TIME.finditer(lowered):
+        trigger, hour, minute, meridiem = match.groups()
+        # A bare number is only a time when introduced ("at four") or qualified ("four thirty pm")
+        if not (trigger or meridiem or (minute and hour in _HOUR_WORDS)):
+            continue
+        if not (meridiem or minute == "o'clock"):
+            following = _NEXT_WORD.match(lowered, match.end())
+            following = following.group(1) if following else None
+            if following in _QUANTITY_FOLLOWERS:
+                continue
+            # "at three" must end its clause; "at three thirty" only has to avoid a quantity
+            if not minute and following is not None and following not in _CLAUSE_FOLLOWERS:
+                continue
+        result = _to_24h(int(_HOUR_WORDS.get(hour, hour)), _MINUTE_WORDS.get(minute, 0) if minute else 0, _meridiem(meridiem))
+        if result:
+            return result, match.span()
+    return None
+
+
+def parse_phone(text):
+    """Returns (digits, span) for a phone number said as digits or digit words ("five five five, double two ..."), or None."""
+    best = None
+    run, start, end, repeat = [], None, None, 1
+    for match in _PHONE_TOKEN.finditer(text.lower()):
+        token = match.group(0)
+        if token.isdigit() or token in _DIGIT_WORDS:
+            digits = token if token.isdigit() else _DIGIT_WORDS[token]
+            run.append(digits * repeat)
+            repeat = 1
+            start = match.start() if start is None else start
+            end = match.end()
+        elif token in _REPEAT_WORDS:
+            repeat = _REPEAT_WORDS[token]
+        elif token in "+-.()," or token == "dash":
+            continue
+        else:
+            best = _longer(best, run, start, end)
+            run, start, end, repeat = [], None, None, 1
+    best = _longer(best, run, start, end)
+    return best
+
+
+def _longer(best, run, start, end):
+    digits = "".join(run)
+    if 7 <= len(digits) <= 15 and (best is None or len(digits) > len(best[0])):
+        return digits, (start, end)
+    return best
+
+
+def parse_name(text):
+    """Returns (name, span) from "my name is ...", "call me ..." or a capitalized "this is ..."/"I'm ...", or None."""
+    for pattern in (_STRONG_NAME, _WEAK_NAME):
+        for match in pattern.finditer(text):
+            words, end = [], match.start(1)
+            for word in match.group(1).split():
+                if word.lower().strip("'") in _NAME_STOPWORDS:
+                    break
+                words.append(word[:1].upper() + word[1:])
+                end = text.index(word, end) + len(word)
+            if words:
+                return " ".join(words), (match.start(), end)
+    return None
+
+
+class SlotExtractor:
+    """
+    Local, incremental extraction of lead fields from each caller utterance.
+    `extract` returns only the fields found in that utterance; later utterances override
+    earlier values, which covers corrections like "actually, make it four".
+    """
+
+    def __init__(self):
+        self.extractions = 0
+        self.fields_found = 0
+
+    def extract(self, text: str, today=None) -> dict:
+        return self.parse(text, today)[0]
+
+    def parse(self, text: str, today=None):
+        """Returns (fields, rest): the fields found and the utterance with their words blanked out."""
+        if not text:
+            return {}, ""
+        found = {}
+        # Order matters: each parser masks what it consumed, so the digits of an address or a
+        # date are never read again as a phone number or a time
+        email = parse_email(text)
+        if email:
+            found["email"] = email[0]
+            text = _mask(text, email[1])
+        address = parse_address(text)
+        if address:
+            found["address"] = address[0]
+            text = _mask(text, address[1])
+        day = parse_date(text, today)
+        if day:
+            found["date"] = day[0].isoformat()
+            text = _mask(text, day[1])
+        clock = parse_time(text)
+        if clock:
+            found["time"] = clock[0]
+            text = _mask(text, clock[1])
+        phone = parse_phone(text)
+        if phone:
+            found["phone"] = phone[0]
+            text = _mask(text, phone[1])
+        name = parse_name(text)
+        if name:
+            found["name"] = name[0]
+            text = _mask(text, name[1])
+
+        self.extractions += 1
+        self.fields_found += len(found)
+        if found:
+            logger.info(f"Extracted slots locally: {found}")
+        return found, text
+
+
+def summarize_slots(slots: dict) -> str:
+    """Compact state line for the agent: what is already known and what is still missing."""
+    known = []
+    for field in SLOT_FIELDS:
+        value = slots.get(field)
+        if not value:
+            continue
+        if field == "date":
+            try:
+                value = f"{value} ({date.fromisoformat(value).strftime('%A')})"
+            except ValueError:
+                pass
+        known.append(f"{field}={value}")
+    missing = [field for field in SLOT_FIELDS if not slots.get(field)]
+    summary = f"Known details: {'; '.join(known) if known else 'none'}."
+    if missing:
+        summary += f" Still needed: {', '.join(missing)}."
+    return summary
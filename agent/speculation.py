@@ -0,0 +1,228 @@
+import os
+import re
+import time
+import asyncio
+import logging
+import threading
+from collections import deque, Counter
+from agent.sentence_segmenter import SentenceSegmenter
+from services.Executor import agent_stage
+from services.Metrics import SPECULATIONS, SPECULATION_SAVED_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# A partial transcript unchanged for this long starts a speculative agent turn
+# (longer than the gap between words, so it does not fire mid-sentence)
+SPECULATIVE_STABLE_MS = int(os.getenv("SPECULATIVE_STABLE_MS", "300"))
+
+_NON_WORD = re.compile(r"[^\w@.]+|\.(?=\s|$)")
+
+
+def normalize_transcript(text: str) -> str:
+    """Case, punctuation and spacing-insensitive form used to match a partial to the final."""
+    return " ".join(_NON_WORD.sub(" ", (text or "").lower()).split())
+
+
+class SpeculationStats:
+    """
+    Outcomes of speculative turns: hit (final matched, result used), miss (final differed),
+    unusable (the agent could not run ahead, e.g. it wanted to book), superseded (a newer
+    partial replaced it) and abandoned (not needed after all, or the call ended). Saved time is
+    how long the agent had been running when the final transcript arrived.
+    """
+
+    def __init__(self, window=500):
+        self.outcomes = Counter()
+        self._saved = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, outcome, saved=None):
+        SPECULATIONS.inc(outcome=outcome)
+        with self._lock:
+            self.outcomes[outcome] += 1
+            if saved is not None:
+                self._saved.append(saved)
+        if saved is not None:
+            SPECULATION_SAVED_SECONDS.observe(saved)
+
+    def summary(self) -> dict:
+        with self._lock:
+            outcomes = dict(self.outcomes)
+            saved = sorted(self._saved)
+        decided = outcomes.get("hit", 0) + outcomes.get("miss", 0) + outcomes.get("unusable", 0)
+        summary = {
+            "started": sum(outcomes.values()),
+            **outcomes,
+            "hit_rate": round(outcomes.get("hit", 0) / decided, 3) if decided else 0.0,
+        }
+        if saved:
+            summary["saved_ms_mean"] = round(sum(saved) / len(saved) * 1000)
+            summary["saved_ms_p50"] = round(saved[len(saved) // 2] * 1000)
+        return summary
+
+
+speculation_stats = SpeculationStats()
+
+
+class Speculation:
+    """
+    One speculative agent turn for a partial transcript. Reply pieces collect in `tokens` (ending
+    with `done`) until the turn is kept; `prepared` maps segment text to audio synthesized early.
+    `cancelled` is set by `cancel` and tells the agent thread to stop its model request.
+    """
+
+    def __init__(self, text, known):
+        self.text = text
+        self.key = normalize_transcript(text)
+        self.known = known
+        self.started_at = time.monotonic()
+        self.finished_at = None
+        self.turn = None
+        self.tokens = asyncio.Queue()
+        self.done = object()
+        self.ready = asyncio.Event()  # Set on the first reply piece or when the turn ends
+        self.prepared = {}
+        self.task = None
+        self.cancelled = threading.Event()
+
+    def cancel(self):
+        # Cancelling the task only stops the await; the agent stage thread watches the event
+        self.cancelled.set()
+        self.task.cancel()
+        for stream in self.prepared.values():
+            stream.cancel()
+        self.prepared.clear()
+
+
+class Speculator:
+    """
+    Starts the agent ahead of the final transcript. Each call feeds it partial hypotheses;
+    once one has been stable for `stable_ms` and the conversation loop is not busy with an
+    earlier utterance (`armed`, cleared by `take` and `discard`), `speculate(text, known, on_text,
+    cancelled)` runs in the agent stage and streams its reply into the Speculation; it should
+    return promptly once `cancelled` is set. With `prepare`, the
+    reply's first segment is handed to it (e.g. to start TTS) as soon as it is complete.
+    `take(final_text)` returns the Speculation when the final transcript matches, and discards
+    it otherwise.
+
+    Speculative turns never touch agent memory or lead info; the caller commits a kept one.
+    """
+
+    def __init__(self, speculate, known_for, prepare=None, stable_ms=None, stats=None):
+        self.speculate = speculate
+        self.known_for = known_for
+        self.prepare = prepare
+        self.stable_s = (stable_ms if stable_ms is not None else SPECULATIVE_STABLE_MS) / 1000
+        self.stats = stats or speculation_stats
+        self.armed = False
+        self._candidate = None
+        self._timer = None
+        self._active = None
+
+    def on_partial(self, hypothesis):
+        key = normalize_transcript(hypothesis.text)
+        if not key or (self._candidate is not None and key == self._candidate[0]):
+            return
+        self._candidate = (key, hypothesis.text)
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = asyncio.get_running_loop().call_later(self.stable_s, self._on_stable, key)
+
+    def _on_stable(self, key):
+        self._timer = None
+        if not self.armed or self._candidate is None or self._candidate[0] != key:
+            return
+        if self._active is not None:
+            if self._active.key == key:
+                return
+            self._discard(self._active, "superseded")
+        text = self._candidate[1]
+        speculation = Speculation(text, self.known_for(text))
+        speculation.task = asyncio.ensure_future(self._run(speculation))
+        self._active = speculation
+        logger.debug(f"Speculating on partial transcript: {text!r}")
+
+    async def _run(self, speculation):
+        loop = asyncio.get_running_loop()
+        segmenter = SentenceSegmenter() if self.prepare is not None else None
+        streamed = []
+
+        def deliver(piece):
+            speculation.tokens.put_nowait(piece)
+            speculation.ready.set()
+
+        def on_text(piece):
+            nonlocal segmenter
+            streamed.append(piece)
+            if segmenter is not None:
+                segments = segmenter.push(piece)
+                if segments:
+                    # Only the first segment is prepared ahead, before the piece completing it is delivered
+                    segmenter = None
+                    loop.call_soon_threadsafe(self._prepare, speculation, segments[0])
+            loop.call_soon_threadsafe(deliver, piece)
+
+        def run():
+            turn = self.speculate(speculation.text, speculation.known, on_text, speculation.cancelled)
+            if turn is not None and not turn.ready_to_book:
+                # Emit whatever the stream missed, as stream_agent does
+                so_far = "".join(streamed)
+                if not so_far:
+                    on_text(turn.reply)
+                elif turn.reply.startswith(so_far) and len(turn.reply) > len(so_far):
+                    on_text(turn.reply[len(so_far):])
+            return turn
+
+        try:
+            speculation.turn = await agent_stage.run(run)
+        finally:
+            speculation.finished_at = time.monotonic()
+            speculation.tokens.put_nowait(speculation.done)
+            speculation.ready.set()
+
+    def _prepare(self, speculation, segment):
+        if not speculation.task.cancelled():
+            speculation.prepared[segment] = self.prepare(segment)
+
+    def _discard(self, speculation, outcome):
+        speculation.cancel()
+        self.stats.record(outcome)
+
+    async def take(self, final_text):
+        """
+        Returns the Speculation if it matches `final_text`, once its reply has started (or the
+        turn has ended); otherwise discards it and returns None.
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._candidate = None
+        self.armed = False
+        speculation, self._active = self._active, None
+        if speculation is None:
+            return None
+        if speculation.key != normalize_transcript(final_text):
+            self._discard(speculation, "miss")
+            return None
+        final_at = time.monotonic()
+        await speculation.ready.wait()
+        if speculation.task.done() and speculation.turn is None:
+            if not speculation.task.cancelled() and speculation.task.exception() is not None:
+                logger.warning(f"Speculative turn failed: {speculation.task.exception()}")
+            self._discard(speculation, "unusable")
+            return None
+        saved = min(speculation.finished_at or final_at, final_at) - speculation.started_at
+        self.stats.record("hit", saved)
+        logger.info(f"Speculative turn kept; the agent started {saved * 1000:.0f} ms before the final transcript")
+        return speculation
+
+    def discard(self):
+        """Drops any pending or running speculation (the turn was answered another way, or the call ended)."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._candidate = None
+        self.armed = False
+        if self._active is not None:
+            self._discard(self._active, "abandoned")
+            self._active = None
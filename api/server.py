@@ -1,7 +1,19 @@
 import os
 from dotenv import load_dotenv
-from fastapi import FastAPI, WebSocket, Request
-from handlers.twilio_pipeline_handler import handle_twilio_websocket
+from fastapi import FastAPI, WebSocket, Request, Depends
+from fastapi.responses import PlainTextResponse, JSONResponse
+from handlers.twilio_pipeline_handler import handle_twilio_websocket, warm_prompt_cache, admission_prompts_ready, prompt_cache, response_cache
+from services.Availability import availability
+from services.BookingQueue import booking_queue
+from services.CallRecords import call_records
+from services.CallEvents import call_events, LIVE_STATUSES
+from services.SessionStore import session_store
+from services.Providers import providers, calendar_service
+from services.Resilience import call_gate, breakers
+from services.Executor import stt_stage, agent_stage, tts_stage, calendar_stage, audio_stage, storage_stage
+from services.Metrics import registry
+from services.Auth import verify_twilio_signature, require_admin
+import asyncio
 import logging
 
 # Load environment variables (redundant if loaded in main.py, but safe)
@@ -11,18 +23,134 @@ logger = logging.getLogger(__name__)
 
 app = FastAPI()
 
+async def warm_up():
+    """Builds provider clients and opens their connections, then renders fixed prompts."""
+    await providers.warm()
+    # Keep the local availability index in step with the calendar's free/busy
+    if calendar_service.loaded and calendar_service.service is not None:
+        app.state.availability_task = asyncio.create_task(availability.refresh_forever(calendar_service))
+    await warm_prompt_cache()
+
+@app.on_event("startup")
+async def warm_caches():
+    # Warm up in the background so the server accepts connections at once; a call that arrives
+    # first builds the clients it needs on demand
+    app.state.warmup_task = asyncio.create_task(warm_up())
+    # Calendar writes for bookings accepted during calls, including any left pending by a restart
+    app.state.booking_task = asyncio.create_task(booking_queue.run_forever(calendar_service))
+
+@app.on_event("shutdown")
+async def flush_call_records():
+    # Calls that ended since the last batch would otherwise be lost
+    await call_records.close()
+
 @app.get("/")
 async def read_root():
     return {"message": "AI Agent is running"}
 
+@app.get("/ready")
+async def ready():
+    """
+    200 once the startup warm-up has finished and, with a call limit, the hold and busy prompts
+    are cached; 503 before. For load balancer readiness checks.
+    """
+    warmup = getattr(app.state, "warmup_task", None)
+    if warmup is None or not warmup.done() or not admission_prompts_ready():
+        return JSONResponse({"ready": False}, status_code=503)
+    return {"ready": True, "warm_ms": providers.stats()["warm_ms"]}
+
+@app.get("/cache-stats")
+async def cache_stats():
+    """Hit rates of the agent response cache and the prompt audio cache, availability index, booking queue, provider and admission state, for tuning."""
+    return {
+        # Caches are per worker process; with several workers each request sees one of them
+        "worker": os.getpid(),
+        "session_store": session_store.name,
+        "response_cache": response_cache.stats(),
+        "prompt_cache": {"hits": prompt_cache.hits, "disk_hits": prompt_cache.disk_hits, "misses": prompt_cache.misses},
+        "availability": availability.stats(),
+        "bookings": await storage_stage.run(booking_queue.stats),
+        "providers": providers.stats(),
+        "resilience": {
+            "admission": call_gate.stats(),
+            "breakers": {name: breaker.stats() for name, breaker in breakers.items()},
+        },
+    }
+
+@app.get("/bookings/{booking_id}", dependencies=[Depends(require_admin)])
+async def booking_status(booking_id: str):
+    """Status of a queued booking and, once written, its calendar_link. Admin only."""
+    booking = await storage_stage.run(booking_queue.lookup, booking_id)
+    if booking is None:
+        return JSONResponse({"error": "unknown booking"}, status_code=404)
+    return booking
+
+@app.get("/calls", dependencies=[Depends(require_admin)])
+async def find_calls(call_sid: str = None, phone: str = None, email: str = None, date: str = None,
+                     since: str = None, until: str = None, limit: int = 50, transcripts: bool = False):
+    """Stored calls matching every given filter, newest first. Dates are YYYY-MM-DD. Admin only."""
+    return await storage_stage.run(call_records.find, call_sid, phone, email, date, since, until, min(limit, 500), transcripts)
+
+@app.get("/calls/{record_id}", dependencies=[Depends(require_admin)])
+async def get_call(record_id: str):
+    """One stored call, with its transcript, by call SID. Admin only."""
+    record = await storage_stage.run(call_records.get, record_id)
+    if record is None:
+        return JSONResponse({"error": "unknown call"}, status_code=404)
+    return record
+
+_stages = (stt_stage, agent_stage, tts_stage, calendar_stage, audio_stage, storage_stage)
+registry.callback_gauge("voice_stage_in_flight", "Blocking calls running per executor stage",
+                        lambda: {stage.name: stage.in_flight for stage in _stages}, label="stage")
+registry.callback_gauge("voice_stage_waiting", "Calls queued for a free executor slot per stage",
+                        lambda: {stage.name: stage.waiting for stage in _stages}, label="stage")
+registry.callback_counter("voice_response_cache_hits_total", "Agent response cache hits since start", lambda: response_cache.hits)
+registry.callback_counter("voice_response_cache_misses_total", "Agent response cache misses since start", lambda: response_cache.misses)
+registry.callback_gauge("voice_calls_by_status", "Calls currently in each live Twilio status",
+                        lambda: {status: call_events.live[status] for status in LIVE_STATUSES}, label="status")
+registry.callback_counter("voice_prompt_cache_misses_total", "Prompt audio cache misses since start", lambda: prompt_cache.misses)
+registry.callback_gauge("voice_circuit_open", "1 while a provider's circuit breaker is open",
+                        lambda: {name: int(breaker.is_open) for name, breaker in breakers.items()}, label="provider")
+registry.callback_gauge("voice_admission_waiting", "Calls on hold for a free call slot", lambda: call_gate.stats()["waiting"])
+registry.callback_counter("voice_admission_rejected_total", "Calls turned away at the call limit since start", lambda: call_gate.rejected)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus text exposition of call, turn and stage metrics."""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
 @app.websocket("/media")
 async def media_ws(websocket: WebSocket):
     logger.info("Received incoming WebSocket connection on /media")
     await handle_twilio_websocket(websocket)
 
-# Optional: Add a webhook endpoint for Twilio status updates if needed
-# @app.post("/status")
+@app.post("/status", dependencies=[Depends(verify_twilio_signature)])
 async def handle_status_update(request: Request):
+    """
+    Twilio status callback. Updates the live aggregates and queues the event for the call
+    record store; nothing here waits on disk, so bursts do not hold up media streams.
+    Requests without a valid X-Twilio-Signature are refused with 403.
+    """
     form_data = await request.form()
-    logger.info(f"Twilio Status Update: {form_data}")
+    event = call_events.ingest(form_data)
+    if event is not None:
+        call_records.submit_event(event)
+        logger.debug(f"Twilio Status Update: {event[0]} {event[1]}")
     return {"status": "received"}
+
+@app.get("/call-stats")
+async def call_stats(request: Request, recent: int = 0):
+    """
+    Live call counts, outcomes, answer rate and average duration from status callbacks.
+    The recent events carry phone numbers, so asking for them needs the admin key.
+    """
+    stats = call_events.snapshot()
+    if recent:
+        await require_admin(request)
+        stats["recent"] = call_events.recent(min(recent, 1000))
+    return stats
+
+@app.get("/calls/{record_id}/events", dependencies=[Depends(require_admin)])
+async def get_call_events(record_id: str):
+    """A call's stored status events, oldest first. Admin only."""
+    return await storage_stage.run(call_records.events, record_id)
@@ -0,0 +1,52 @@
+"""
+Compares the two agent engines on the same scripted booking conversation.
+
+Reports LLM round trips per turn, prompt/completion tokens per turn and p50/p95 turn
+latency for the LangChain ReAct agent and the function-calling agent. Calls the real
+OpenAI API, so OPENAI_API_KEY must be set; the calendar tool is never invoked because the
+function-calling engine leaves booking to the caller and the script stops before the
+ReAct agent would book.
+
+Run from the repo root:
+    python -m benchmarks.bench_agent_engines [--calls 3]
+"""
+import os
+import json
+import argparse
+
+# The ReAct engine is built by langchain_agent; the function-calling engine is created directly
+os.environ["AGENT_ENGINE"] = "react"
+
+import langchain_agent
+from agent.agent_engine import engine_stats
+from agent.function_calling_agent import FunctionCallingAgent
+
+SCRIPT = [
+    "Hi, my name is Sarah Connor and I'd like to see the two bedroom apartment on 42 Elm Street.",
+    "My email is sarah.connor@example.com.",
+    "Phone number is 555 201 3344.",
+    "Could we do next Tuesday at three in the afternoon?",
+    "Actually make it four instead.",
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=3, help="Times to replay the script per engine")
+    args = parser.parse_args()
+
+    function_agent = FunctionCallingAgent()
+    for call in range(args.calls):
+        session_id = f"bench-{call}"
+        for line in SCRIPT:
+            langchain_agent.run_agent(line, session_id)
+            function_agent.run_turn(line, session_id)
+        langchain_agent.end_session(session_id)
+        function_agent.end_session(session_id)
+
+    for stats in engine_stats.values():
+        print(json.dumps(stats.summary()))
+
+
+if __name__ == "__main__":
+    main()
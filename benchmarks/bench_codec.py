@@ -0,0 +1,122 @@
+"""
+Micro-benchmark for the audio conversion hot paths.
+
+Compares the in-process NumPy codec (agent/audio_codec.py) against the audioop/pydub
+path it replaced, on synthetic speech-like audio, and reports per-call latency and the
+real-time factor. audioop and pydub/ffmpeg are optional; their rows are skipped when
+they are not available (audioop was removed in Python 3.13).
+
+Run from the repo root:
+    python -m benchmarks.bench_codec [--seconds 5] [--repeat 50]
+"""
+import io
+import time
+import wave
+import argparse
+import statistics
+import numpy as np
+
+from agent.audio_codec import PolyphaseResampler, rms, ulaw_decode, ulaw_encode
+from agent.send_audio_to_twilio import PcmToUlawStream, convert_audio_to_ulaw
+
+try:
+    import audioop
+except ImportError:
+    audioop = None
+
+
+def make_pcm(seconds, rate):
+    """A few harmonics plus noise, roughly speech-band, as 16-bit PCM bytes."""
+    t = np.arange(int(seconds * rate)) / rate
+    signal = sum(np.sin(2 * np.pi * f * t) / (i + 1) for i, f in enumerate((180, 360, 720, 1400, 2900)))
+    signal += np.random.default_rng(0).normal(0, 0.05, t.size)
+    return (signal / np.abs(signal).max() * 12000).astype(np.int16).tobytes()
+
+
+def make_wav(pcm, rate):
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(pcm)
+    return buffer.getvalue()
+
+
+def timeit(func, repeat):
+    func() # Warm-up
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def audioop_stream(pcm, chunk):
+    state = None
+    out = []
+    for i in range(0, len(pcm), chunk):
+        resampled, state = audioop.ratecv(pcm[i:i + chunk], 2, 1, 24000, 8000, state)
+        out.append(audioop.lin2ulaw(resampled, 2))
+    return b"".join(out)
+
+
+def codec_stream(pcm, chunk):
+    stream = PcmToUlawStream(24000)
+    return b"".join(stream.convert(pcm[i:i + chunk]) for i in range(0, len(pcm), chunk))
+
+
+def pydub_convert(wav):
+    from pydub import AudioSegment
+    segment = AudioSegment.from_file(io.BytesIO(wav), format="wav")
+    segment = segment.set_frame_rate(8000).set_channels(1).set_sample_width(2)
+    return audioop.lin2ulaw(segment.raw_data, 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=5.0, help="Length of the test audio")
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    pcm_24k = make_pcm(args.seconds, 24000)
+    pcm_8k = make_pcm(args.seconds, 8000)
+    wav_24k = make_wav(pcm_24k, 24000)
+    ulaw_8k = ulaw_encode(pcm_8k)
+    tts_chunk = 4800 # TextToSpeech.stream_pcm chunk size (100 ms)
+    frame = ulaw_8k[:160]
+
+    cases = [
+        ("ulaw decode (inbound utterance)", lambda: ulaw_decode(ulaw_8k),
+         audioop and (lambda: audioop.ulaw2lin(ulaw_8k, 2))),
+        ("ulaw encode 8kHz", lambda: ulaw_encode(pcm_8k),
+         audioop and (lambda: audioop.lin2ulaw(pcm_8k, 2))),
+        ("VAD frame energy (20 ms)", lambda: rms(ulaw_decode(frame)),
+         audioop and (lambda: audioop.rms(audioop.ulaw2lin(frame, 2), 2))),
+        ("24k->8k one shot", lambda: PolyphaseResampler(24000, 8000).process(pcm_24k),
+         audioop and (lambda: audioop.ratecv(pcm_24k, 2, 1, 24000, 8000, None))),
+        ("24k PCM stream -> ulaw (100 ms chunks)", lambda: codec_stream(pcm_24k, tts_chunk),
+         audioop and (lambda: audioop_stream(pcm_24k, tts_chunk))),
+        ("24k WAV file -> ulaw", lambda: convert_audio_to_ulaw(wav_24k),
+         audioop and (lambda: pydub_convert(wav_24k))),
+    ]
+
+    print(f"{args.seconds:.1f}s of audio, median of {args.repeat} runs")
+    print(f"{'case':42} {'codec ms':>10} {'legacy ms':>10} {'speedup':>8} {'codec RTF':>10}")
+    for name, codec, legacy in cases:
+        codec_s = timeit(codec, args.repeat)
+        legacy_s = None
+        if legacy:
+            try:
+                legacy_s = timeit(legacy, args.repeat)
+            except Exception as e: # e.g. pydub or ffmpeg missing
+                print(f"  ({name}: legacy path unavailable: {e})")
+        legacy_ms = f"{legacy_s * 1000:10.3f}" if legacy_s else f"{'n/a':>10}"
+        speedup = f"{legacy_s / codec_s:7.1f}x" if legacy_s else f"{'n/a':>8}"
+        audio_s = 0.02 if "frame" in name else args.seconds
+        print(f"{name:42} {codec_s * 1000:10.3f} {legacy_ms} {speedup} {codec_s / audio_s:10.5f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""
+Offline throughput test for the campaign dialer.
+
+Runs agent.campaign_dialer against a local fake of Twilio's Calls REST resource. The fake
+enforces an account calls-per-second limit (answering 429 / error 20429 above it, as Twilio
+does), then plays each call out: ringing, then busy, no-answer or answered with a random
+talk time, posting status callbacks to the dialer like Twilio would. Times are scaled down so
+a campaign runs in seconds.
+
+Reports the dialer's summary (achieved dial rate, peak concurrent calls, outcomes, retries)
+plus what the fake saw: calls accepted, rate-limit rejections and peak live calls.
+
+No network access or credentials are needed. Run from the repo root:
+    python -m benchmarks.dial_test [--leads 200] [--concurrency 20] [--cps 5] [--twilio-cps 5]
+"""
+import json
+import time
+import uuid
+import random
+import socket
+import asyncio
+import logging
+import argparse
+from collections import deque, Counter
+
+logger = logging.getLogger(__name__)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class FakeTwilio:
+    """Fake Calls resource with an account CPS limit and scripted call outcomes."""
+
+    def __init__(self, cps, ring_s, talk_s, busy_rate, no_answer_rate, seed=0, auth_token="token"):
+        self.cps = cps
+        self.auth_token = auth_token  # Status callbacks are signed with it, as Twilio signs them
+        self.ring_s = ring_s
+        self.talk_s = talk_s
+        self.busy_rate = busy_rate
+        self.no_answer_rate = no_answer_rate
+        self.random = random.Random(seed)
+        self._recent = deque()  # Accept times in the last second
+        self.accepted = 0
+        self.rejected = 0
+        self.live = 0
+        self.max_live = 0
+        self.outcomes = Counter()
+        self.callbacks_failed = 0
+        self._tasks = set()
+        self._http = None
+
+    def app(self):
+        import httpx
+        from fastapi import FastAPI, Request
+        from fastapi.responses import JSONResponse
+
+        app = FastAPI()
+        self._http = httpx.AsyncClient(timeout=5.0)
+
+        @app.post("/2010-04-01/Accounts/{account_sid}/Calls.json")
+        async def create_call(account_sid: str, request: Request):
+            form = await request.form()
+            now = time.monotonic()
+            while self._recent and now - self._recent[0] >= 1.0:
+                self._recent.popleft()
+            if len(self._recent) >= self.cps:
+                self.rejected += 1
+                return JSONResponse({"code": 20429, "message": "Too Many Requests", "status": 429}, status_code=429)
+            self._recent.append(now)
+            self.accepted += 1
+            sid = "CA" + uuid.uuid4().hex
+            task = asyncio.ensure_future(self._play(sid, form.get("StatusCallback")))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+            return JSONResponse({"sid": sid, "status": "queued", "to": form.get("To"), "from": form.get("From")}, status_code=201)
+
+        return app
+
+    async def _callback(self, url, sid, status):
+        if not url:
+            return
+        try:
+            from twilio.request_validator import RequestValidator
+            data = {"CallSid": sid, "CallStatus": status}
+            signature = RequestValidator(self.auth_token).compute_signature(url, data)
+            response = await self._http.post(url, data=data, headers={"X-Twilio-Signature": signature})
+            response.raise_for_status()
+        except Exception as e:
+            self.callbacks_failed += 1
+            logger.warning(f"Status callback failed: {e}")
+
+    async def _play(self, sid, url):
+        self.live += 1
+        self.max_live = max(self.max_live, self.live)
+        try:
+            await self._callback(url, sid, "initiated")
+            await self._callback(url, sid, "ringing")
+            await asyncio.sleep(self.ring_s * self.random.uniform(0.5, 1.5))
+            roll = self.random.random()
+            if roll < self.busy_rate:
+                status = "busy"
+            elif roll < self.busy_rate + self.no_answer_rate:
+                status = "no-answer"
+            else:
+                await self._callback(url, sid, "in-progress")
+                await asyncio.sleep(self.talk_s * self.random.uniform(0.5, 1.5))
+                status = "completed"
+        finally:
+            self.live -= 1
+        self.outcomes[status] += 1
+        await self._callback(url, sid, status)
+
+    def summary(self) -> dict:
+        return {
+            "accepted": self.accepted,
+            "rate_limited": self.rejected,
+            "max_live_calls": self.max_live,
+            "outcomes": dict(self.outcomes),
+            "callbacks_failed": self.callbacks_failed,
+        }
+
+
+async def serve(app, port):
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    serving = asyncio.ensure_future(server.serve())
+    while not server.started:
+        if serving.done():
+            serving.result()
+        await asyncio.sleep(0.05)
+    return server, serving
+
+
+async def run(args):
+    from agent.campaign_dialer import CampaignDialer, TwilioCallsClient, Lead, status_app
+    from services import Auth
+
+    # The callback app verifies signatures with the account's auth token, like the real deployment
+    Auth.TWILIO_AUTH_TOKEN = "token"
+
+    fake = FakeTwilio(args.twilio_cps, args.ring_s, args.talk_s, args.busy_rate, args.no_answer_rate, args.seed)
+    twilio_port, callback_port = free_port(), free_port()
+    leads = [Lead(f"+1555{index:07d}", f"Lead {index}") for index in range(args.leads)]
+    client = TwilioCallsClient("AC" + "0" * 32, "token", f"http://127.0.0.1:{twilio_port}")
+    dialer = CampaignDialer(
+        leads, client, from_number="+15550000000",
+        status_callback=f"http://127.0.0.1:{callback_port}/dialer/status",
+        concurrency=args.concurrency, cps=args.cps, max_attempts=args.max_attempts,
+        retry_delays={"busy": args.retry_s, "no-answer": args.retry_s, "failed": args.retry_s, "timeout": args.retry_s},
+        call_timeout=args.call_timeout, twiml="<Response/>",
+    )
+    servers = [await serve(fake.app(), twilio_port), await serve(status_app(dialer), callback_port)]
+    try:
+        summary = await dialer.run()
+    finally:
+        for server, serving in servers:
+            server.should_exit = True
+            await serving
+        await client.close()
+    summary["fake_twilio"] = fake.summary()
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--leads", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20, help="Dialer's target calls in flight")
+    parser.add_argument("--cps", type=float, default=5.0, help="Dialer's calls-per-second limit")
+    parser.add_argument("--twilio-cps", type=int, default=5, help="Fake account's calls-per-second limit")
+    parser.add_argument("--max-attempts", type=int, default=3)
+    parser.add_argument("--retry-s", type=float, default=1.0, help="Delay before retrying busy/no-answer/failed calls")
+    parser.add_argument("--ring-s", type=float, default=0.5, help="Mean ringing time")
+    parser.add_argument("--talk-s", type=float, default=2.0, help="Mean length of an answered call")
+    parser.add_argument("--busy-rate", type=float, default=0.1)
+    parser.add_argument("--no-answer-rate", type=float, default=0.3)
+    parser.add_argument("--call-timeout", type=float, default=30.0, help="Give up on a call with no final callback (s)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verbose", action="store_true", help="Show the dialer's INFO logs")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING, format="%(asctime)s [%(levelname)s] %(message)s")
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
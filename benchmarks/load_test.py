@@ -0,0 +1,629 @@
+"""
+Offline load test for the Twilio media stream endpoint.
+
+Starts the FastAPI app in-process on localhost with STT, the agent, TTS and the calendar
+replaced by deterministic local stubs with configurable latency, then opens N concurrent
+WebSocket clients against /media. Each client behaves like a Twilio media stream: it sends
+start, 20 ms media frames at real-time pace (silence between utterances), echoes marks once
+the audio before them has "played", and sends stop at the end. Caller audio is either
+synthesized or read from recorded files (WAV, or raw 8 kHz μ-law), one file per utterance.
+
+Reports, over all calls:
+  - turn latency: end of caller speech to the first reply frame received (includes the
+    endpointer's hangover, so it is what the caller hears as the pause)
+  - outbound pacing: RFC 3550 interarrival jitter and mid-reply playout underruns
+  - memory: process RSS growth per concurrent call (clients share the process)
+
+No network access or provider credentials are needed. Run from the repo root:
+    python -m benchmarks.load_test [--calls 20] [--stt-ms 300] [--agent-ms 600] [--tts-ms 200]
+"""
+import os
+import sys
+import json
+import time
+import base64
+import socket
+import asyncio
+import logging
+import argparse
+import tempfile
+import itertools
+import threading
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+FRAME_BYTES = 160  # 20 ms of 8 kHz μ-law
+FRAME_S = 0.02
+SILENCE = b"\xff" * FRAME_BYTES
+PCM_RATE = 24000  # Matches the OpenAI PCM stream the TTS stub stands in for
+LOAD_TEST_AUTH_TOKEN = "load-test-auth-token"  # Signs the simulated status callbacks
+
+# Caller lines (what the scripted STT backend "hears") and the stub agent's replies, turn by turn
+SCRIPT = [
+    "Hi, my name is Sarah Connor and I'd like to see the apartment on 42 Elm Street.",
+    "My email is sarah.connor@example.com.",
+    "Phone number is 555 201 3344.",
+    "Could we do next Tuesday at three in the afternoon?",
+]
+REPLIES = [
+    "Thanks Sarah, happy to help with that. What email address should I send the confirmation to?",
+    "Got it. And what is the best phone number to reach you on?",
+    "Great. What day and time would you like to view the property?",
+]
+BOOKING_SLOTS = {"name": "Sarah Connor", "email": "sarah.connor@example.com", "date": "2026-11-03", "time": "15:00"}
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+def rss_bytes():
+    """Current resident set size of this process."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+# --- Caller audio ---------------------------------------------------------------------
+
+def synth_utterance(seconds, seed):
+    """Speech-like μ-law audio: voiced harmonics under a syllable-rate envelope."""
+    from agent.audio_codec import ulaw_encode
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * 8000)) / 8000
+    pitch = 140 + 30 * rng.random()
+    voiced = sum(np.sin(2 * np.pi * pitch * k * t) / k for k in range(1, 6))
+    envelope = 0.55 + 0.45 * np.sin(2 * np.pi * 4.0 * t + rng.random() * np.pi)
+    signal = voiced * envelope + rng.normal(0, 0.05, t.size)
+    return ulaw_encode((signal / np.abs(signal).max() * 9000).astype(np.int16))
+
+
+def load_utterance(path):
+    from agent.audio_codec import parse_wav, pcm_to_ulaw
+    with open(path, "rb") as f:
+        data = f.read()
+    if data[:4] == b"RIFF":
+        samples, rate, channels, width = parse_wav(data)
+        if width != 2:
+            raise ValueError(f"{path}: only 16-bit WAV is supported")
+        return pcm_to_ulaw(samples, rate, channels)
+    return data  # Raw 8 kHz μ-law, as Twilio sends it
+
+
+# --- Provider stubs -------------------------------------------------------------------
+
+def _tone(seconds):
+    t = np.arange(int(seconds * PCM_RATE)) / PCM_RATE
+    return (np.sin(2 * np.pi * 220 * t) * 4000).astype(np.int16).tobytes()
+
+
+class StubTTS:
+    """
+    Synthesizes a tone as long as the text would take to speak.
+    `latency` is the time to first audio; streamed chunks then arrive every `chunk_latency`.
+    """
+
+    model = "load-test-stub"
+
+    def __init__(self, latency, chunk_latency, chars_per_second):
+        self.latency = latency
+        self.chunk_latency = chunk_latency
+        self.chars_per_second = chars_per_second
+
+    def _pcm(self, text):
+        return _tone(max(0.2, len(text) / self.chars_per_second))
+
+    def warm(self):
+        """The startup warm-up hook; there is no connection to open."""
+
+    def speak(self, text, output_path=None, voice="alloy", response_format="wav"):
+        from services.STT import pcm_to_wav
+        time.sleep(self.latency)
+        return pcm_to_wav(self._pcm(text), sample_rate=PCM_RATE)
+
+    def stream_pcm(self, text, voice="alloy", chunk_size=4800):
+        pcm = self._pcm(text)
+        time.sleep(self.latency)
+        for i in range(0, len(pcm), chunk_size):
+            if i:
+                time.sleep(self.chunk_latency)
+            yield pcm[i:i + chunk_size]
+
+
+class StubAgent:
+    """
+    Scripted agent: one reply per turn, then a structured booking turn after `turns` turns.
+    The first token arrives after `latency`, later ones every `token_latency`.
+    """
+
+    def __init__(self, latency, token_latency, turns, book=True):
+        self.latency = latency
+        self.token_latency = token_latency
+        self.turns = turns
+        self.book = book
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def _next(self, session_id, advance=True):
+        from agent.agent_engine import AgentTurn
+        with self._lock:
+            number = self._counts.get(session_id, 0)
+            if advance:
+                self._counts[session_id] = number + 1
+        if self.book and number + 1 >= self.turns:
+            return AgentTurn("Booking that for you now.", dict(BOOKING_SLOTS), True)
+        return AgentTurn(REPLIES[number % len(REPLIES)], {}, False)
+
+    def run_agent_turn(self, user_input, session_id, known=None):
+        turn = self._next(session_id)
+        time.sleep(self.latency + self.token_latency * len(turn.reply.split()))
+        return turn
+
+    def _pieces(self, turn):
+        time.sleep(self.latency)
+        for i, word in enumerate(turn.reply.split(" ")):
+            if i:
+                time.sleep(self.token_latency)
+            yield word if i == 0 else " " + word
+
+    def stream_agent(self, user_input, session_id, on_text, known=None):
+        turn = self._next(session_id)
+        if turn.ready_to_book:
+            time.sleep(self.latency)
+        else:
+            for piece in self._pieces(turn):
+                on_text(piece)
+        return turn
+
+    def speculate_turn(self, user_input, session_id, known=None, on_text=None, cancelled=None):
+        turn = self._next(session_id, advance=False)
+        if on_text is None or turn.ready_to_book:
+            time.sleep(self.latency + self.token_latency * len(turn.reply.split()))
+        else:
+            for piece in self._pieces(turn):
+                if cancelled is not None and cancelled.is_set():
+                    return None # Like the real engines, stop streaming once the turn is discarded
+                on_text(piece)
+        return turn
+
+    def commit_turn(self, user_input, turn, session_id, known=None):
+        self._next(session_id)
+
+    def remember_turn(self, user_input, reply, session_id):
+        pass
+
+    def record_interruption(self, heard_text, session_id):
+        pass
+
+    def export_session(self, session_id):
+        with self._lock:
+            return {"turns": self._counts.get(session_id, 0)}
+
+    def restore_session(self, session_id, state):
+        if state:
+            with self._lock:
+                self._counts[session_id] = state.get("turns", 0)
+
+    def end_session(self, session_id):
+        with self._lock:
+            self._counts.pop(session_id, None)
+
+
+class StubCalendar:
+    # No free/busy source: the availability index stays unloaded, so every call books the
+    # scripted slot (which is the same for all of them) instead of being offered alternatives
+    service = None
+
+    def __init__(self, latency):
+        self.latency = latency
+
+    def create_appointment(self, summary, description, start_time, end_time, attendees, event_id=None):
+        time.sleep(self.latency)
+        return f"https://calendar.invalid/event/{abs(hash((summary, start_time))):x}"
+
+
+def install_stubs(args, work_dir):
+    """Swaps the handler's providers for the stubs; must run before the server starts."""
+    from handlers import twilio_pipeline_handler as handler
+    from services.PromptCache import PromptCache
+    from services.StreamingSTT import ScriptedBackend
+    from services.Providers import providers
+    from services import Auth
+
+    agent = StubAgent(args.agent_ms / 1000, args.token_ms / 1000, args.turns, book=not args.no_booking)
+    handler.stt_backend = ScriptedBackend(SCRIPT, latency=args.stt_ms / 1000)
+    handler.tts = StubTTS(args.tts_ms / 1000, args.tts_chunk_ms / 1000, args.chars_per_second)
+    handler.calendar_service = StubCalendar(args.calendar_ms / 1000)
+    handler.prompt_cache = PromptCache(handler.tts, cache_dir=os.path.join(work_dir, "prompt_cache"))
+    # The server's startup warm-up and booking queue use the shared registry; point it at the stubs
+    # The agent engine is registered there too, so the stub also keeps LangChain from being imported
+    for name, stub in (("stt", handler.stt_backend), ("tts", handler.tts), ("calendar", handler.calendar_service), ("agent", agent)):
+        providers[name].override(stub)
+    handler.SPECULATIVE_AGENT = args.speculate
+    # Webhooks are verified against the auth token; the simulated Twilio signs with this one
+    Auth.TWILIO_AUTH_TOKEN = LOAD_TEST_AUTH_TOKEN
+    handler.response_cache.enabled = args.response_cache
+    handler.response_cache.clear()
+    return handler
+
+
+# --- Simulated Twilio media stream ----------------------------------------------------
+
+class CallResult:
+    def __init__(self):
+        self.turn_latencies = []
+        self.jitter = 0.0
+        self.max_jitter = 0.0
+        self.underruns = 0
+        self.underrun_ms = 0.0
+        self.frames_in = 0
+        self.marks = 0
+        self.clears = 0
+        self.error = None
+        self.closed_by_server = False
+
+
+class TwilioStreamClient:
+    """
+    One simulated call. The sender keeps a real-time 20 ms frame clock, like Twilio, sending
+    caller speech when there is some and μ-law silence otherwise. Inbound media is "played"
+    on a virtual playout clock, which drives mark echoes, jitter and underrun accounting.
+    """
+
+    REPLY_GAP_S = 1.0  # Frames further apart than this start a new reply
+
+    def __init__(self, url, index, utterances, pause, turn_timeout):
+        self.url = url
+        self.stream_sid = f"MZloadtest{index:06d}"
+        self.call_sid = f"CAloadtest{index:06d}"
+        self.utterances = utterances
+        self.pause = pause
+        self.turn_timeout = turn_timeout
+        self.result = CallResult()
+        self._speech = bytearray()
+        self._speech_sent = asyncio.Event()
+        self._sequence = itertools.count(1)
+        self._chunk = 0
+        self._speech_end_at = None
+        self._awaiting_reply = False
+        self._playout_end = 0.0
+        self._last_arrival = None
+        self._last_frames = 0
+        self._pending_marks = {}
+        self._ws = None
+
+    async def _send(self, message):
+        message["sequenceNumber"] = str(next(self._sequence))
+        await self._ws.send(json.dumps(message))
+
+    async def _sender(self):
+        started = time.monotonic()
+        deadline = started
+        while True:
+            if self._speech:
+                frame = bytes(self._speech[:FRAME_BYTES]).ljust(FRAME_BYTES, b"\xff")
+                del self._speech[:FRAME_BYTES]
+                if not self._speech:
+                    self._speech_end_at = time.monotonic()
+                    self._awaiting_reply = True
+                    self._speech_sent.set()
+            else:
+                frame = SILENCE
+            self._chunk += 1
+            await self._send({
+                "event": "media",
+                "streamSid": self.stream_sid,
+                "media": {
+                    "track": "inbound",
+                    "chunk": str(self._chunk),
+                    "timestamp": str(int((deadline - started) * 1000)),
+                    "payload": base64.b64encode(frame).decode("ascii"),
+                },
+            })
+            deadline += FRAME_S
+            await asyncio.sleep(max(0.0, deadline - time.monotonic()))
+
+    def _on_media(self, payload):
+        now = time.monotonic()
+        frames = max(1, len(base64.b64decode(payload)) // FRAME_BYTES)
+        result = self.result
+        result.frames_in += frames
+        if self._awaiting_reply and self._speech_end_at is not None:
+            result.turn_latencies.append(now - self._speech_end_at)
+            self._awaiting_reply = False
+        if self._last_arrival is not None and now - self._last_arrival < self.REPLY_GAP_S:
+            # RFC 3550 interarrival jitter against the nominal 20 ms cadence
+            deviation = abs((now - self._last_arrival) - self._last_frames * FRAME_S)
+            result.jitter += (deviation - result.jitter) / 16
+            result.max_jitter = max(result.max_jitter, result.jitter)
+            if now > self._playout_end:
+                result.underruns += 1
+                result.underrun_ms += (now - self._playout_end) * 1000
+        self._playout_end = max(self._playout_end, now) + frames * FRAME_S
+        self._last_arrival = now
+        self._last_frames = frames
+
+    def _on_mark(self, name):
+        # Twilio echoes a mark once the audio sent before it has finished playing
+        delay = max(0.0, self._playout_end - time.monotonic())
+        handle = asyncio.get_running_loop().call_later(delay, self._echo_mark, name)
+        self._pending_marks[name] = handle
+
+    def _echo_mark(self, name):
+        self._pending_marks.pop(name, None)
+        self.result.marks += 1
+        asyncio.ensure_future(self._send({"event": "mark", "streamSid": self.stream_sid, "mark": {"name": name}}))
+
+    def _on_clear(self):
+        # Buffered audio is dropped and its marks are echoed immediately
+        self.result.clears += 1
+        self._playout_end = time.monotonic()
+        for name, handle in list(self._pending_marks.items()):
+            handle.cancel()
+            self._echo_mark(name)
+
+    async def _receiver(self):
+        import websockets
+        try:
+            async for raw in self._ws:
+                msg = json.loads(raw)
+                event = msg.get("event")
+                if event == "media":
+                    self._on_media(msg["media"]["payload"])
+                elif event == "mark":
+                    self._on_mark(msg.get("mark", {}).get("name"))
+                elif event == "clear":
+                    self._on_clear()
+        except websockets.ConnectionClosed:
+            pass
+        self.result.closed_by_server = True
+
+    def _idle(self):
+        return not self._pending_marks and time.monotonic() >= self._playout_end + self.pause
+
+    async def _wait_for_reply(self, receiver):
+        """Waits until a reply started and finished playing, or the server hung up."""
+        deadline = time.monotonic() + self.turn_timeout
+        while time.monotonic() < deadline and not receiver.done():
+            if not self._awaiting_reply and self.result.frames_in and self._idle():
+                return True
+            await asyncio.sleep(FRAME_S)
+        return not receiver.done()
+
+    async def run(self):
+        import websockets
+        try:
+            async with websockets.connect(self.url, max_size=None, open_timeout=10) as ws:
+                self._ws = ws
+                await ws.send(json.dumps({"event": "connected", "protocol": "Call", "version": "1.0.0"}))
+                await self._send({
+                    "event": "start",
+                    "streamSid": self.stream_sid,
+                    "start": {
+                        "streamSid": self.stream_sid,
+                        "callSid": self.call_sid,
+                        "tracks": ["inbound"],
+                        "mediaFormat": {"encoding": "audio/x-mulaw", "sampleRate": 8000, "channels": 1},
+                    },
+                })
+                receiver = asyncio.ensure_future(self._receiver())
+                sender = asyncio.ensure_future(self._sender())
+                try:
+                    # The greeting counts as a reply the caller listens to before speaking
+                    if await self._wait_for_reply(receiver):
+                        for audio in self.utterances:
+                            self._speech_sent.clear()
+                            self._speech.extend(audio)
+                            await self._speech_sent.wait()
+                            if not await self._wait_for_reply(receiver):
+                                break
+                    if not receiver.done():
+                        await self._send({"event": "stop", "streamSid": self.stream_sid, "stop": {"callSid": self.call_sid}})
+                        await asyncio.wait_for(asyncio.shield(receiver), timeout=5)
+                except (asyncio.TimeoutError, websockets.ConnectionClosed):
+                    pass
+                finally:
+                    sender.cancel()
+                    receiver.cancel()
+                    for handle in self._pending_marks.values():
+                        handle.cancel()
+        except Exception as e:
+            self.result.error = f"{type(e).__name__}: {e}"
+        return self.result
+
+
+# --- Driver ---------------------------------------------------------------------------
+
+async def sample_rss(samples, stop):
+    while not stop.is_set():
+        samples.append(rss_bytes())
+        await asyncio.sleep(0.1)
+
+
+async def post_status_events(url, rate, stop, latencies):
+    """
+    Posts Twilio-style status callbacks at `rate` per second, cycling fake calls through their
+    lifecycle. They are signed like Twilio's, with the token install_stubs gives the server.
+    """
+    import httpx
+    from twilio.request_validator import RequestValidator
+
+    validator = RequestValidator(LOAD_TEST_AUTH_TOKEN)
+    statuses = ("initiated", "ringing", "in-progress", "completed")
+    async with httpx.AsyncClient(timeout=10.0) as client:
+        async def post(data):
+            started = time.monotonic()
+            try:
+                response = await client.post(url, data=data, headers={"X-Twilio-Signature": validator.compute_signature(url, data)})
+                response.raise_for_status()
+                latencies.append(time.monotonic() - started)
+            except httpx.HTTPError as e:
+                logger.warning(f"Status callback failed: {e}")
+
+        posts = set()
+        for n in itertools.count():
+            if stop.is_set():
+                break
+            status = statuses[n % len(statuses)]
+            data = {"CallSid": f"CA{n // len(statuses):032x}", "CallStatus": status}
+            if status == "completed":
+                data["CallDuration"] = "60"
+            task = asyncio.ensure_future(post(data))
+            posts.add(task)
+            task.add_done_callback(posts.discard)
+            await asyncio.sleep(1 / rate)
+        if posts:
+            await asyncio.gather(*posts)
+
+
+def ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 1)
+
+
+def summarize(results, baseline_rss, peak_rss, elapsed, calls, status_latencies=()):
+    from services.Metrics import PACER_UNDERRUNS, FRAMES_OUT, BARGE_INS
+    from agent.speculation import speculation_stats
+    from services.BookingQueue import booking_queue
+    from services.CallRecords import call_records
+    from services.CallEvents import call_events
+    latencies = [value for result in results for value in result.turn_latencies]
+    jitters = [result.max_jitter for result in results if result.frames_in]
+    return {
+        "calls": calls,
+        "completed": sum(1 for result in results if result.error is None),
+        "errors": sorted({result.error for result in results if result.error}),
+        "elapsed_s": round(elapsed, 1),
+        "turns": len(latencies),
+        "turn_latency_ms": {
+            "p50": ms(percentile(latencies, 0.50)),
+            "p90": ms(percentile(latencies, 0.90)),
+            "p95": ms(percentile(latencies, 0.95)),
+            "p99": ms(percentile(latencies, 0.99)),
+            "max": ms(max(latencies)) if latencies else None,
+        },
+        "pacing": {
+            "frames_received": sum(result.frames_in for result in results),
+            "jitter_ms_p50": ms(percentile(jitters, 0.50)),
+            "jitter_ms_max": ms(max(jitters)) if jitters else None,
+            "underruns": sum(result.underruns for result in results),
+            "underrun_ms": round(sum(result.underrun_ms for result in results), 1),
+            "server_pacer_underruns": PACER_UNDERRUNS.value(),
+            "server_frames_out": FRAMES_OUT.value(),
+        },
+        "marks_echoed": sum(result.marks for result in results),
+        "barge_ins": BARGE_INS.value(),
+        "speculation": speculation_stats.summary(),
+        "bookings": booking_queue.stats(),
+        "call_records": call_records.stats(),
+        "status_callbacks": {
+            "posted": len(status_latencies),
+            "post_ms_p50": ms(percentile(status_latencies, 0.5)),
+            "post_ms_p99": ms(percentile(status_latencies, 0.99)),
+            "aggregates": call_events.snapshot(),
+        },
+        "memory": {
+            "baseline_mb": round(baseline_rss / 2**20, 1),
+            "peak_mb": round(peak_rss / 2**20, 1),
+            "per_call_kb": round((peak_rss - baseline_rss) / calls / 1024, 1),
+        },
+    }
+
+
+async def run_load(args, utterances):
+    import uvicorn
+    from api.server import app
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", ws_max_size=2**20))
+    serving = asyncio.ensure_future(server.serve())
+    while not server.started:
+        if serving.done():
+            serving.result()
+        await asyncio.sleep(0.05)
+    # Fixed prompts are rendered by the startup hook; wait so the first calls measure cache hits
+    warmup = getattr(app.state, "warmup_task", None)
+    if warmup is not None:
+        await warmup
+
+    url = f"ws://127.0.0.1:{port}/media"
+    samples, stop = [], asyncio.Event()
+    baseline_rss = rss_bytes()
+    sampler = asyncio.ensure_future(sample_rss(samples, stop))
+    status_latencies = []
+    poster = None
+    if args.status_rate:
+        poster = asyncio.ensure_future(post_status_events(f"http://127.0.0.1:{port}/status", args.status_rate, stop, status_latencies))
+
+    async def call(index):
+        await asyncio.sleep(args.ramp * index / max(1, args.calls))
+        client = TwilioStreamClient(url, index, utterances, args.pause, args.turn_timeout)
+        return await client.run()
+
+    started = time.monotonic()
+    results = await asyncio.gather(*(call(index) for index in range(args.calls)))
+    elapsed = time.monotonic() - started
+    stop.set()
+    await sampler
+    if poster is not None:
+        await poster
+    server.should_exit = True
+    await serving
+    return summarize(results, baseline_rss, max(samples + [baseline_rss]), elapsed, args.calls, status_latencies)
+
+
+def default_utterances():
+    """Synthesized caller audio for SCRIPT, sized to the scripted STT backend's speaking rate so partials keep up."""
+    return [synth_utterance(0.25 * len(line.split()), seed) for seed, line in enumerate(SCRIPT)]
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=20, help="Concurrent simulated calls")
+    parser.add_argument("--ramp", type=float, default=2.0, help="Seconds over which call starts are spread")
+    parser.add_argument("--audio", nargs="+", help="Caller utterances, one WAV or raw μ-law file each (default: synthesized)")
+    parser.add_argument("--pause", type=float, default=0.6, help="Caller think time after a reply finishes playing (s)")
+    parser.add_argument("--turn-timeout", type=float, default=30.0, help="Give up on a call if a reply takes longer (s)")
+    parser.add_argument("--stt-ms", type=float, default=300, help="STT stub time from endpoint to final transcript")
+    parser.add_argument("--agent-ms", type=float, default=600, help="Agent stub time to first token")
+    parser.add_argument("--token-ms", type=float, default=30, help="Agent stub time between tokens")
+    parser.add_argument("--tts-ms", type=float, default=200, help="TTS stub time to first audio")
+    parser.add_argument("--tts-chunk-ms", type=float, default=20, help="TTS stub time between 100 ms PCM chunks")
+    parser.add_argument("--chars-per-second", type=float, default=15.0, help="Speaking rate used to size TTS stub audio")
+    parser.add_argument("--calendar-ms", type=float, default=400, help="Calendar stub latency")
+    parser.add_argument("--no-booking", action="store_true", help="Never book; calls end with a stop event after the last utterance")
+    parser.add_argument("--speculate", action="store_true", help="Start the agent on stable partial transcripts")
+    parser.add_argument("--response-cache", action="store_true", help="Leave the agent response cache enabled")
+    parser.add_argument("--status-rate", type=float, default=0, help="Twilio status callbacks posted to /status per second during the run")
+    parser.add_argument("--verbose", action="store_true", help="Show the server's INFO logs")
+    return parser
+
+
+def main():
+    args = build_parser().parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING, format="%(asctime)s [%(levelname)s] %(message)s")
+    if args.audio:
+        utterances = [load_utterance(path) for path in args.audio]
+    else:
+        utterances = default_utterances()
+    args.turns = len(utterances)
+
+    # Transcripts, lead files and rendered prompts go to a scratch directory, not the working tree
+    work_dir = tempfile.mkdtemp(prefix="voice-load-test-")
+    sys.path.insert(0, os.getcwd())
+    os.chdir(work_dir)
+    install_stubs(args, work_dir)
+    print(json.dumps(asyncio.run(run_load(args, utterances)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
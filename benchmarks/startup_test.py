@@ -0,0 +1,203 @@
+"""
+Cold-start benchmark for the server process.
+
+Every run uses a fresh interpreter, as a new deploy or a newly spawned worker would:
+  - import: wall time of `import api.server`, plus the slowest of its direct imports from
+    python -X importtime (a module that starts importing an SDK at load time shows up here).
+    The SDKs in DEFERRED_MODULES, LangChain among them, must not be loaded by the import at all;
+    the run fails if one is.
+  - start: uvicorn is started on the app; measures the time until it answers HTTP requests
+    and until /ready reports the background warm-up (provider clients, prompt audio) done
+  - first call: as soon as the server accepts requests, a Twilio-like client connects to
+    /media and sends the start event; measures the time until the first greeting audio frame.
+    Without provider credentials and a rendered prompt cache no greeting can be produced,
+    and this is reported as null.
+
+Reports the median and worst run. With --max-import-ms / --max-first-call-ms the exit status
+is 1 when a median exceeds its limit, so the benchmark can guard against regressions in CI.
+
+Run from the repo root:
+    python -m benchmarks.startup_test [--runs 5] [--max-import-ms 1500]
+"""
+import os
+import re
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import statistics
+import subprocess
+
+_IMPORTTIME = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)")
+# Built on first use or by the warm-up (services.Providers), never by importing the server
+DEFERRED_MODULES = ("langchain", "langchain_community", "langchain_core", "langchain_agent", "tenacity", "openai", "googleapiclient")
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def measure_import(module):
+    """
+    Imports `module` in a fresh interpreter; returns (wall ms, [(cumulative ms, package)] of the
+    modules it imports, [the DEFERRED_MODULES it loaded]).
+    """
+    code = (
+        f"import sys, time; started = time.perf_counter(); import {module}; elapsed = time.perf_counter() - started; "
+        f"print(','.join(name for name in {DEFERRED_MODULES!r} if name in sys.modules)); print(elapsed)"
+    )
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True, timeout=120,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+    # Children are listed before their parent: a module's own imports are the one-level-deeper
+    # entries (two spaces) between the previous top-level entry and its line
+    children, direct = [], []
+    for line in result.stderr.splitlines():
+        match = _IMPORTTIME.match(line)
+        if not match:
+            continue
+        depth, package = len(match.group(3)), match.group(4)
+        if depth == 2:
+            children.append((int(match.group(2)) / 1000, package))
+        elif depth == 0:
+            if package == module:
+                direct = children
+            children = []
+    lines = result.stdout.splitlines()
+    return float(lines[-1]) * 1000, direct, [name for name in lines[-2].split(",") if name]
+
+
+async def first_greeting_frame(url, timeout):
+    """Opens a media stream and returns the ms from the start event to the first media frame, or None."""
+    import websockets
+
+    stream_sid, call_sid = f"MZstartup{time.time_ns()}", f"CAstartup{time.time_ns()}"
+    async with websockets.connect(url, max_size=None, open_timeout=timeout) as ws:
+        await ws.send(json.dumps({"event": "connected", "protocol": "Call", "version": "1.0.0"}))
+        started = time.perf_counter()
+        await ws.send(json.dumps({
+            "event": "start",
+            "streamSid": stream_sid,
+            "start": {"streamSid": stream_sid, "callSid": call_sid, "tracks": ["inbound"],
+                      "mediaFormat": {"encoding": "audio/x-mulaw", "sampleRate": 8000, "channels": 1}},
+        }))
+        try:
+            while True:
+                message = json.loads(await asyncio.wait_for(ws.recv(), timeout))
+                if message.get("event") == "media":
+                    latency = (time.perf_counter() - started) * 1000
+                    await ws.send(json.dumps({"event": "stop", "streamSid": stream_sid, "stop": {"callSid": call_sid}}))
+                    return latency
+        except (asyncio.TimeoutError, websockets.ConnectionClosed):
+            return None
+
+
+async def measure_start(app, timeout):
+    """Starts uvicorn on `app` in a fresh process; returns accept, first-call and ready times."""
+    import httpx
+
+    port = free_port()
+    base = f"http://127.0.0.1:{port}"
+    launched = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", app, "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+    )
+    run = {"accept_ms": None, "first_call_ms": None, "ready_ms": None}
+    try:
+        async with httpx.AsyncClient(timeout=1.0) as http:
+            deadline = launched + timeout
+            while time.perf_counter() < deadline:
+                if process.poll() is not None:
+                    raise RuntimeError(f"server exited:\n{process.stderr.read().decode()[-2000:]}")
+                try:
+                    await http.get(f"{base}/")
+                    break
+                except httpx.TransportError:
+                    await asyncio.sleep(0.01)
+            else:
+                raise RuntimeError(f"server did not accept requests within {timeout} s")
+            run["accept_ms"] = (time.perf_counter() - launched) * 1000
+            # The first call races the warm-up, as it would right after a deploy
+            run["first_call_ms"] = await first_greeting_frame(f"ws://127.0.0.1:{port}/media", timeout)
+            while time.perf_counter() < deadline:
+                response = await http.get(f"{base}/ready")
+                if response.status_code == 200:
+                    run["ready_ms"] = (time.perf_counter() - launched) * 1000
+                    break
+                await asyncio.sleep(0.05)
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+    return run
+
+
+def summarize(values):
+    values = [value for value in values if value is not None]
+    if not values:
+        return None
+    return {"median": round(statistics.median(values), 1), "max": round(max(values), 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--module", default="api.server", help="Module whose import is timed")
+    parser.add_argument("--app", default="api.server:app", help="ASGI app started for the start and first-call timings")
+    parser.add_argument("--top", type=int, default=10, help="How many of the slowest direct imports to list")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--no-server", action="store_true", help="Only time the import")
+    parser.add_argument("--max-import-ms", type=float, help="Fail if the median import time exceeds this")
+    parser.add_argument("--max-first-call-ms", type=float, help="Fail if the median first-call latency exceeds this")
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.getcwd())
+    imports, slowest, starts, eager = [], {}, [], set()
+    for _ in range(args.runs):
+        wall_ms, direct, loaded = measure_import(args.module)
+        imports.append(wall_ms)
+        eager.update(loaded)
+        for cumulative_ms, package in direct:
+            slowest.setdefault(package, []).append(cumulative_ms)
+        if not args.no_server:
+            starts.append(asyncio.run(measure_start(args.app, args.timeout)))
+
+    report = {
+        "runs": args.runs,
+        "import_ms": summarize(imports),
+        "slowest_imports_ms": {
+            package: round(statistics.median(times), 1)
+            for package, times in sorted(slowest.items(), key=lambda item: -statistics.median(item[1]))[:args.top]
+        },
+        "deferred_modules_loaded": sorted(eager),
+    }
+    if starts:
+        for key in ("accept_ms", "first_call_ms", "ready_ms"):
+            report[key] = summarize(run[key] for run in starts)
+    print(json.dumps(report, indent=2))
+
+    failed = []
+    if eager:
+        failed.append(f"import {args.module} loaded {', '.join(sorted(eager))}")
+    if args.max_import_ms is not None and report["import_ms"]["median"] > args.max_import_ms:
+        failed.append(f"import {report['import_ms']['median']} ms > {args.max_import_ms} ms")
+    if args.max_first_call_ms is not None:
+        first_call = report.get("first_call_ms")
+        if first_call is None or first_call["median"] > args.max_first_call_ms:
+            failed.append(f"first call {first_call and first_call['median']} ms > {args.max_first_call_ms} ms")
+    if failed:
+        print("Startup regression: " + "; ".join(failed), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
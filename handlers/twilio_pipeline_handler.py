@@ -4,15 +4,31 @@ import base64
 import asyncio
 import time
 import logging
-from fastapi import WebSocket
-from services.STT import SpeechToText
-from services.TTS import TextToSpeech
-from agent.send_audio_to_twilio import send_audio_to_twilio
-from langchain_agent import run_agent
-from services.GoogleCalendar import GoogleCalendarService
-import audioop # <-- ADD THIS IMPORT
-from pydub import AudioSegment # <-- ADD THIS IMPORT (needed for WAV header)
-from pydub.utils import ratio_to_db # <-- ADD THIS IMPORT (needed for WAV header)
+from fastapi import WebSocket, WebSocketDisconnect
+from services.StreamingSTT import StreamingTranscriber
+from collections import deque
+from services.TTS import PCM_SAMPLE_RATE
+from agent.send_audio_to_twilio import (
+    send_audio_to_twilio, send_ulaw_to_twilio, stream_tts_to_twilio, UlawStream, play_ulaw_stream, TwilioPlayback
+)
+from agent.sentence_segmenter import SentenceSegmenter
+from agent.agent_engine import AgentTurn, engine_stats, SLOT_FIELDS, AGENT_ENGINE
+from agent.slot_extractor import SlotExtractor
+from agent.speculation import Speculator, speculation_stats
+from services.Providers import stt_backend, tts, calendar_service, agent_service
+from services.Availability import availability, describe_availability
+from services.BookingQueue import booking_queue
+from services.CallRecords import call_records, call_record
+from services.SessionStore import session_store, SessionCheckpoint
+from services.Resilience import call_gate, breakers
+from services.VAD import Endpointer
+from services.Executor import agent_stage, tts_stage, storage_stage
+from services.PromptCache import PromptCache
+from services.ResponseCache import ResponseCache, classify_intent
+from services.Metrics import (
+    ACTIVE_CALLS, CALLS, CALL_SECONDS, FRAMES_IN, BARGE_INS, PACER_UNDERRUNS, PROVIDER_ERRORS,
+    TurnSpans, current_turn, observe_stage, span
+)
 
 
 # Set up logging (ensure this doesn't duplicate handlers if main.py sets it up)
@@ -28,21 +44,324 @@ SAMPLE_WIDTH = 2  # 16-bit PCM # <-- Define constants needed here
 SAMPLE_RATE = 8000 # <-- Define constants needed here
 # MIN_AUDIO_LENGTH = 8000  # About 0.5 seconds at 8kHz # This constant is defined later, keep it there
 
-# Initialize services
-# Ensure these classes are correctly implemented in their respective files
-stt = SpeechToText()
-tts = TextToSpeech()
-calendar_service = GoogleCalendarService()
+# Provider clients (streaming STT, TTS, calendar) and the agent engine come from the shared
+# registry in services.Providers and are built on first use or by the startup warm-up, not on import
+prompt_cache = PromptCache(tts)
+# Replies for recurring dialog states; hits skip the agent and play from the prompt cache
+response_cache = ResponseCache(namespace=AGENT_ENGINE)
+
+# Streaming TTS sends the first frames while synthesis is still running; set TTS_STREAMING=0 for the file-based path
+TTS_STREAMING = os.getenv("TTS_STREAMING", "1") == "1"
+# Stream agent tokens into sentence-level TTS; set AGENT_STREAMING=0 to wait for the full reply
+AGENT_STREAMING = os.getenv("AGENT_STREAMING", "1") == "1"
+# Start the agent on a stable partial transcript before the final one arrives (and synthesize
+# the first sentence with SPECULATIVE_TTS); the result is kept only if the final matches.
+# Costs an extra LLM call on every miss.
+SPECULATIVE_AGENT = os.getenv("SPECULATIVE_AGENT", "0") == "1"
+SPECULATIVE_TTS = os.getenv("SPECULATIVE_TTS", "1") == "1"
+# Recent reply time-to-first-frame measurements (seconds), per playback path
+time_to_first_frame = {"streaming": deque(maxlen=500), "file": deque(maxlen=500), "agent_streaming": deque(maxlen=500)}
+
+BOOKING_PHRASES = ("appointment confirmed", "appointment booked")
+
+# Caller speech during playback longer than this interrupts the agent (barge-in)
+BARGE_IN_MIN_MS = int(os.getenv("BARGE_IN_MIN_MS", "200"))
+NO_INPUT_TIMEOUT_S = 30.0
+
+
+def is_booking_reply(text: str) -> bool:
+    lowered = text.lower()
+    return any(phrase in lowered for phrase in BOOKING_PHRASES)
 
 GREETING = (
     "Hello! This is your real estate appointment assistant. "
     "I'm here to help you schedule a property viewing. "
     "May I know your name and what kind of property you're interested in?"
 )
+VOICE_FAILURE_MSG = "Sorry, I'm having trouble with my voice. Please try again later."
+REPROMPT_MSG = "Sorry, I didn't catch that. Could you please repeat?"
+STT_ERROR_MSG = "Sorry, I had trouble understanding you. Could you please repeat?"
+CONFIRM_DETAILS_MSG = "Could you please confirm your name, email, phone number, address, and preferred appointment time?"
+MISSING_INFO_MSG = "I seem to be missing some details like your name, email, date, or time. Could you please provide them?"
+BOOKING_ERROR_MSG = "Sorry, I was unable to book your appointment. Please try again later."
+RESUME_MSG = "Sorry, we got cut off for a moment. Where were we?"
+HOLD_MSG = "Thanks for calling. All of our lines are busy right now, so please hold for a moment."
+BUSY_MSG = "Sorry, we can't take your call right now. Please try again in a few minutes."
+DEGRADED_MSG = "Sorry, I'm having some technical trouble. I have your details, and someone from our team will follow up with you shortly."
+
+# Fixed phrases served from the prompt cache instead of being synthesized per call
+FIXED_PROMPTS = [
+    GREETING, VOICE_FAILURE_MSG, REPROMPT_MSG, STT_ERROR_MSG,
+    CONFIRM_DETAILS_MSG, MISSING_INFO_MSG, BOOKING_ERROR_MSG, RESUME_MSG,
+    HOLD_MSG, BUSY_MSG, DEGRADED_MSG,
+]
+
+
+def admission_prompts_ready() -> bool:
+    """
+    True once the hold and busy prompts are cached, or when there is no call limit. They are
+    only ever played from the cache, so a call must not be queued before they are.
+    """
+    return call_gate.max_calls <= 0 or (prompt_cache.contains(HOLD_MSG) and prompt_cache.contains(BUSY_MSG))
+
+
+async def warm_prompt_cache():
+    """Pre-renders all fixed prompts; called in the background at server startup."""
+    await tts_stage.run(prompt_cache.warm, FIXED_PROMPTS)
+    logger.info(f"Prompt cache warmed with {len(FIXED_PROMPTS)} prompts.")
+
+
+async def speak_reply(playback: TwilioPlayback, text: str):
+    """
+    Synthesizes and plays a dynamic agent reply, recording its time to first frame.
+    Returns that latency in seconds, or None if no audio was sent.
+    """
+    started = time.monotonic()
+    if TTS_STREAMING:
+        mode = "streaming"
+        first_frame_at = await stream_tts_to_twilio(playback, tts.stream_pcm(text), PCM_SAMPLE_RATE)
+    else:
+        mode = "file"
+        audio = await tts_stage.run(tts.speak, text)
+        first_frame_at = await send_audio_to_twilio(playback, audio)
+    await playback.send_mark(text)
+    if first_frame_at is None:
+        return None
+    latency = first_frame_at - started
+    time_to_first_frame[mode].append(latency)
+    logger.info(f"Time to first frame ({mode} TTS): {latency * 1000:.0f} ms")
+    return latency
+
+
+def prepare_segment(text: str) -> UlawStream:
+    """Starts synthesizing a reply segment; the stream buffers audio until it is played."""
+    return UlawStream(tts.stream_pcm(text), PCM_SAMPLE_RATE)
+
+
+async def _synthesize_segments(playback: TwilioPlayback, segments: asyncio.Queue, streams: asyncio.Queue, prepared=None):
+    """
+    Starts TTS for each segment as it arrives; the bounded streams queue limits lookahead.
+    Segments found in `prepared` (text -> UlawStream) were synthesized ahead and are used as is.
+    """
+    while True:
+        text = await segments.get()
+        if text is None:
+            break
+        if playback.interrupted.is_set():
+            continue # Caller barged in; nothing more to synthesize this turn
+        stream = prepared.pop(text, None) if prepared else None
+        await streams.put((text, stream or prepare_segment(text)))
+    await streams.put(None)
+
+
+async def _play_segments(playback: TwilioPlayback, streams: asyncio.Queue):
+    """Plays synthesized segments in order, marking each one. Returns the time the first frame went out."""
+    first_frame_at = None
+    while True:
+        item = await streams.get()
+        if item is None:
+            break
+        text, stream = item
+        if playback.interrupted.is_set():
+            stream.cancel()
+            await stream.wait()
+            continue
+        sent_at = await play_ulaw_stream(playback, stream)
+        await playback.send_mark(text)
+        if first_frame_at is None:
+            first_frame_at = sent_at
+    return first_frame_at
+
+
+async def stream_agent_reply(playback: TwilioPlayback, user_text: str, session_id: str, known=None, speculation=None):
+    """
+    Runs the streaming agent and speaks its reply segment by segment: segment N is synthesized
+    and played while the model is still writing segment N+1.
+    Once the reply turns into a booking confirmation (or a JSON block starts), the rest is held
+    back so the caller never hears raw JSON; the booking branch handles it as before.
+    With a kept `speculation`, its already running turn is played instead of starting the agent;
+    the caller commits it to memory.
+    Returns (full reply, held-back text that was not spoken, AgentTurn).
+    """
+    started = time.monotonic()
+    loop = asyncio.get_running_loop()
+    tokens = asyncio.Queue()
+    done = object()
+    result = {}
+    prepared = None
+
+    def produce():
+        first_piece = True
+
+        def on_text(piece):
+            nonlocal first_piece
+            if first_piece:
+                observe_stage("agent_first_token", time.monotonic() - started, turn)
+                first_piece = False
+            loop.call_soon_threadsafe(tokens.put_nowait, piece)
+
+        try:
+            result["turn"] = agent_service.stream_agent(user_text, session_id, on_text, known=known)
+        finally:
+            observe_stage("agent", time.monotonic() - started, turn)
+            loop.call_soon_threadsafe(tokens.put_nowait, done)
+
+    # The agent runs in a worker thread, which does not see the turn context
+    turn = current_turn()
+    if speculation is not None:
+        tokens, done, prepared = speculation.tokens, speculation.done, speculation.prepared
+        producer = speculation.task
+    else:
+        producer = asyncio.ensure_future(agent_stage.run(produce))
+    segments = asyncio.Queue()
+    streams = asyncio.Queue(maxsize=1)
+    synthesizer = asyncio.ensure_future(_synthesize_segments(playback, segments, streams, prepared))
+    player = asyncio.ensure_future(_play_segments(playback, streams))
+
+    segmenter = SentenceSegmenter()
+    full_reply = ""
+    held_back = []
+
+    def dispatch(segment):
+        if held_back or "{" in segment or is_booking_reply(full_reply):
+            held_back.append(segment)
+            return
+        segments.put_nowait(segment)
+
+    try:
+        while True:
+            piece = await tokens.get()
+            if piece is done:
+                break
+            full_reply += piece
+            for segment in segmenter.push(piece):
+                dispatch(segment)
+        tail = segmenter.flush()
+        if tail:
+            dispatch(tail)
+    finally:
+        segments.put_nowait(None)
+        await producer
+        await synthesizer
+        first_frame_at = await player
+        if prepared:
+            speculation.cancel() # Prepared audio the reply did not use (e.g. held back)
+
+    if first_frame_at is not None:
+        latency = first_frame_at - started
+        time_to_first_frame["agent_streaming"].append(latency)
+        logger.info(f"Time to first frame (streamed agent reply): {latency * 1000:.0f} ms")
+    if speculation is not None:
+        result["turn"] = speculation.turn or AgentTurn(full_reply)
+    turn = result["turn"]
+    if turn.ready_to_book:
+        # Structured booking turns are not streamed at all; nothing was spoken
+        return turn.reply, turn.reply, turn
+    return full_reply, " ".join(held_back), turn
+
+
+async def play_prompt(playback: TwilioPlayback, text: str, render=True, persist=True) -> bool:
+    """
+    Streams a fixed prompt from the cache, rendering it once on a miss unless `render` is False
+    or TTS is degraded. Dynamic text is played with persist=False so it stays out of the
+    cache's unbounded disk tier. Returns False if there was no audio to play.
+    """
+    audio = prompt_cache.get(text)
+    if audio is None and render and not breakers["tts"].is_open:
+        audio = await tts_stage.run(prompt_cache.render, text, persist=persist)
+    if not audio:
+        if not render:
+            logger.warning(f"Prompt is not cached and may not be rendered now, nothing played: '{text[:50]}'")
+        return False
+    await send_ulaw_to_twilio(playback, audio)
+    await playback.send_mark(text)
+    return True
+
+
+async def wait_until_played(playback: TwilioPlayback, timeout=10.0):
+    """Waits for Twilio to finish playing what was sent, so hanging up does not cut it off."""
+    deadline = time.monotonic() + timeout
+    while playback.is_playing and time.monotonic() < deadline:
+        await asyncio.sleep(0.1)
+
+
+async def receive_media(ws: WebSocket, playback: TwilioPlayback, endpointer: Endpointer,
+                        transcriber: StreamingTranscriber, utterances: asyncio.Queue, started: asyncio.Event,
+                        admitted: asyncio.Event):
+    """
+    Reads Twilio events for the whole call, concurrently with playback (full duplex).
+    Finished utterances are put on `utterances` with their STT stream, which was fed while the
+    caller spoke; None is put there when the stream ends. Caller audio is ignored until the call
+    is `admitted`, so a queued call costs no STT.
+    Caller speech while the agent is playing audio interrupts playback (barge-in).
+    """
+    timeout_counter = 0
+    try:
+        while True:
+            try:
+                # Wait for a message with a timeout
+                msg = await asyncio.wait_for(ws.receive_json(), timeout=2.0) # Wait 2 seconds per message
+            except asyncio.TimeoutError:
+                timeout_counter += 1
+                logger.debug(f"Timeout waiting for media. Counter: {timeout_counter}")
+                if timeout_counter * 2.0 > NO_INPUT_TIMEOUT_S:
+                    logger.info("No audio received from Twilio within timeout, ending call.")
+                    playback.ended = True
+                    break
+                continue
+            timeout_counter = 0
+            event = msg.get("event")
+
+            if event == "media":
+                FRAMES_IN.inc()
+                if not admitted.is_set():
+                    continue
+                audio_data = base64.b64decode(msg["media"]["payload"])
+                # Twilio sends 20 ms frames; the endpointer returns an utterance once the caller stops talking
+                for utterance in endpointer.push(audio_data):
+                    logger.info(f"Collected {len(utterance)} bytes of audio.")
+                    # The trailing silence the endpointer waited for is the end-of-speech detection delay
+                    endpoint_delay = endpointer.silence_ms / 1000
+                    observe_stage("endpoint", endpoint_delay)
+                    utterances.put_nowait((utterance, time.monotonic(), endpoint_delay, transcriber.take()))
+
+                if playback.is_playing and endpointer.speech_ms >= BARGE_IN_MIN_MS and not playback.interrupted.is_set():
+                    logger.info("Caller started speaking during playback, interrupting agent audio.")
+                    BARGE_INS.inc()
+                    await playback.interrupt()
+
+            elif event == "start":
+                playback.stream_sid = msg.get("streamSid") or msg.get("start", {}).get("streamSid")
+                playback.call_sid = msg.get("start", {}).get("callSid")
+                logger.info(f"Media stream started: {playback.stream_sid}")
+                started.set()
+            elif event == "mark":
+                logger.debug(f"Received mark event: {msg.get('mark')}")
+                playback.on_mark(msg.get("mark", {}).get("name"))
+            elif event == "stop":
+                logger.info("Stream stopped by Twilio.")
+                playback.ended = True
+                # A caller who hangs up mid-sentence: their last words are still transcribed and recorded
+                utterance = endpointer.flush()
+                if utterance is not None:
+                    utterances.put_nowait((utterance, time.monotonic(), 0.0, transcriber.take()))
+                break
+    except WebSocketDisconnect:
+        logger.info("Twilio closed the media WebSocket.")
+    except Exception as e:
+        logger.error(f"Error receiving message from WebSocket: {e}", exc_info=True) # Log exception details
+    finally:
+        started.set()
+        utterances.put_nowait(None)
+
 
 async def handle_twilio_websocket(ws: WebSocket):
     await ws.accept()
     logger.info("Twilio media stream connected.")
+    call_started = time.monotonic()
+    call_started_at = time.time()
+    CALLS.inc()
+    ACTIVE_CALLS.inc()
     transcript = []
     appointment_booked = False
     lead_info = {
@@ -50,155 +369,270 @@ async def handle_twilio_websocket(ws: WebSocket):
         "date": "", "time": "", "calendar_link": ""
     }
 
-    # 1. Greet and introduce
-    logger.info(f"Attempting to generate greeting audio: '{GREETING}'")
-    greeting_audio_path = tts.speak(GREETING)
-
-    if not greeting_audio_path or not os.path.exists(greeting_audio_path) or os.path.getsize(greeting_audio_path) == 0:
-        logger.error(f"TTS failed to generate greeting audio or file is empty: {greeting_audio_path}")
-        # Send a fallback message or close the connection gracefully
-        fallback_msg = "Sorry, I'm having trouble with my voice. Please try again later."
-        fallback_audio_path = tts.speak(fallback_msg)
-        if fallback_audio_path and os.path.exists(fallback_audio_path) and os.path.getsize(fallback_audio_path) > 0:
-             await send_audio_to_twilio(ws, fallback_audio_path)
-        await ws.close(code=1011) # Internal Error
-        return # Stop processing this call
-    else:
-        logger.info(f"Greeting audio generated successfully at: {greeting_audio_path}")
-        logger.info(f"File size: {os.path.getsize(greeting_audio_path)} bytes")
-
-    logger.info("Sending greeting audio to Twilio...")
-    await send_audio_to_twilio(ws, greeting_audio_path)
-    logger.info("Greeting audio sent.")
-    transcript.append(f"Agent: {GREETING}")
-
-    # Define minimum audio length for transcription (e.g., 0.5 seconds * 8000 samples/sec * 2 bytes/sample)
-    MIN_AUDIO_LENGTH_BYTES = 8000 # This constant was already here, good.
-
+    # Receive events in the background for the whole call so the caller can interrupt playback
+    playback = TwilioPlayback(ws)
+    # Fills lead_info from every transcript locally, before the agent sees it
+    slot_extractor = SlotExtractor()
+    # Speculative turns see the lead details as they would be after this utterance, without changing them
+    speculator = None
+    if SPECULATIVE_AGENT:
+        speculation_extractor = SlotExtractor()
+        speculator = Speculator(
+            lambda text, known, on_text, cancelled: agent_service.speculate_turn(text, session_id, known, on_text, cancelled),
+            lambda text: {**{field: lead_info[field] for field in SLOT_FIELDS}, **speculation_extractor.extract(text)},
+            prepare_segment if SPECULATIVE_TTS else None,
+        )
+
+    # Streaming endpointer: cuts the caller's audio on end of speech instead of fixed-size chunks.
+    # The transcriber feeds each utterance to STT as it arrives, and its partials let the endpointer
+    # cut sooner once the caller has clearly finished a sentence.
+    transcriber = StreamingTranscriber(stt_backend, speculator.on_partial if speculator else None)
+    endpointer = Endpointer(listener=transcriber)
+    utterances = asyncio.Queue()
+    started = asyncio.Event()
+    admitted = asyncio.Event()
+    receiver = asyncio.ensure_future(receive_media(ws, playback, endpointer, transcriber, utterances, started, admitted))
+
+    def agent_said(text):
+        """Records an agent turn, keeping only what the caller heard if they barged in."""
+        if playback.interrupted.is_set():
+            heard = playback.heard_text()
+            transcript.append(f"Agent (interrupted): {heard}")
+            return heard
+        transcript.append(f"Agent: {text}")
+        return text
+
+    async def end_degraded(provider):
+        """Ends the call politely from cached audio while `provider` is failing; the lead is kept for follow-up."""
+        logger.warning(f"{provider} is degraded (circuit open); ending the call with the fallback prompt.")
+        await play_prompt(playback, DEGRADED_MSG, render=False)
+        agent_said(DEGRADED_MSG)
+        await wait_until_played(playback)
+        playback.ended = True
+
+    # Outbound media needs the streamSid from Twilio's start event
     try:
+        await asyncio.wait_for(started.wait(), timeout=5.0)
+    except asyncio.TimeoutError:
+        logger.warning("No start event received from Twilio, sending audio without streamSid.")
+
+    # Admission control: over the worker's call limit, the caller hears a hold prompt and queues
+    # for a slot; if none frees up in time they are told to call back. Both prompts are cached
+    # audio, so a turned-away call costs no provider requests.
+    if not call_gate.enter():
+        granted = False
+        if not admission_prompts_ready():
+            # Queued in silence the caller would just hear dead air until ADMISSION_WAIT_S
+            logger.error(f"At the call limit and the hold prompt is not cached (warm-up failed or still running); turning away call {playback.call_sid}.")
+            call_gate.rejected += 1
+        else:
+            logger.warning(f"At the call limit ({call_gate.max_calls}); queuing call {playback.call_sid}.")
+            playback.begin_turn()
+            await play_prompt(playback, HOLD_MSG, render=False)
+            granted = await call_gate.wait()
+            if granted and receiver.done():
+                # The caller hung up while on hold; pass the slot on
+                call_gate.leave()
+                granted = False
+        if not granted:
+            if not receiver.done():
+                logger.warning(f"Turning away call {playback.call_sid}: no slot became free.")
+                playback.begin_turn()
+                await play_prompt(playback, BUSY_MSG, render=False)
+                await wait_until_played(playback)
+            receiver.cancel()
+            transcriber.close()
+            ACTIVE_CALLS.dec()
+            try:
+                await ws.close()
+            except Exception as e:
+                logger.debug(f"WebSocket already closed: {e}")
+            return
+    admitted.set()
+    # The agent keeps a separate, bounded conversation memory per call
+    session_id = playback.stream_sid or f"ws-{id(ws)}"
+
+    # Call state is checkpointed every turn under the call SID, so a call whose media stream
+    # reconnects (possibly to another worker) picks up where it left off
+    checkpoint = SessionCheckpoint(session_store, playback.call_sid or session_id)
+    saved = None
+    turn_spans = None
+    turn_number = 0
+
+    def call_state():
+        return {
+            "lead_info": dict(lead_info),
+            "transcript": list(transcript),
+            "started_at": call_started_at,
+            "turn": turn_number,
+            "playback": playback.export_state(),
+            "agent": agent_service.export_session(session_id),
+        }
+
+    # Everything from here on is torn down by the finally block, however the call ends
+    try:
+        if not agent_service.loaded:
+            # A call that beats the warm-up imports the agent engine (and LangChain) off the event loop
+            await agent_stage.run(agent_service.get)
+        saved = await storage_stage.run(session_store.load, checkpoint.key) if playback.call_sid else None
+        if saved:
+            logger.info(f"Resuming call {playback.call_sid} from saved state ({len(saved['transcript'])} transcript lines).")
+            lead_info.update(saved["lead_info"])
+            transcript.extend(saved["transcript"])
+            call_started_at = saved.get("started_at") or call_started_at
+            playback.restore_state(saved.get("playback", {}))
+            await agent_stage.run(agent_service.restore_session, session_id, saved.get("agent"))
+            turn_number = saved.get("turn", 0)
+
+        # 1. Greet and introduce (or pick the conversation back up)
+        # The greeting is normally pre-rendered at startup, so this is a cache hit
+        opening = RESUME_MSG if saved else GREETING
+        logger.info("Sending greeting audio to Twilio...")
+        playback.begin_turn()
+        if not await play_prompt(playback, opening):
+            logger.error("TTS failed to generate greeting audio or audio is empty.")
+            # Send a fallback message or close the connection gracefully
+            await play_prompt(playback, VOICE_FAILURE_MSG)
+            playback.ended = True
+            await ws.close(code=1011) # Internal Error
+            return # Stop processing this call; the finally block below tears it down
+        logger.info("Greeting audio sent.")
+        agent_said(opening)
+
         while not appointment_booked:
-            # 2. Receive user speech robustly (wait up to 30 seconds for input)
-            audio_buffer = bytearray()
-            stop_received = False
-            timeout_counter = 0
+            if turn_spans is not None:
+                turn_spans.finish(playback.turn_first_frame_at)
+                turn_spans = None
+            # Between turns nothing else touches the call state; the write happens in the background
+            checkpoint.save(call_state())
+            # 2. Wait for the next complete utterance from the receive task
             logger.info("Waiting for user audio...")
+            if speculator is not None:
+                # Speculate only from here until the agent step, so a speculative turn never overlaps a real one
+                speculator.armed = True
+            try:
+                item = await asyncio.wait_for(utterances.get(), timeout=NO_INPUT_TIMEOUT_S)
+            except asyncio.TimeoutError:
+                logger.info("No user speech detected within timeout, ending call.")
+                playback.ended = True
+                break
 
-            # Loop to collect audio chunks
-            while not stop_received:
-                try:
-                    # Wait for a message with a timeout
-                    msg = await asyncio.wait_for(ws.receive_json(), timeout=2.0) # Wait 2 seconds per chunk
-
-                    if msg.get("event") == "media":
-                        payload = msg["media"]["payload"]
-                        audio_data = base64.b64decode(payload)
-                        audio_buffer.extend(audio_data)
-                        timeout_counter = 0 # Reset timeout on receiving media
-                        # logger.debug(f"Received {len(audio_data)} bytes of audio. Total buffer: {len(audio_buffer)}")
-
-                        # Process audio if buffer is large enough (e.g., 2 seconds of audio)
-                        # Twilio streams ulaw 8kHz 1-channel. 2 seconds is 2 * 8000 * 1 = 16000 bytes
-                        if len(audio_buffer) >= 16000:
-                             logger.info(f"Collected {len(audio_buffer)} bytes of audio. Processing...")
-                             break # Exit inner loop to process audio
-
-                    elif msg.get("event") == "stop":
-                        logger.info("Stream stopped by Twilio.")
-                        stop_received = True
-                        break
-                    elif msg.get("event") == "start":
-                         logger.info("Received start event during conversation loop.")
-                    elif msg.get("event") == "mark":
-                         logger.info(f"Received mark event: {msg.get('mark')}")
-
-                except asyncio.TimeoutError:
-                    timeout_counter += 1
-                    logger.debug(f"Timeout waiting for media. Counter: {timeout_counter}")
-                    if timeout_counter * 2.0 > 30.0: # Wait up to 30 seconds for user input
-                        logger.info("No user audio received within timeout, ending call.")
-                        stop_received = True
-                        break
-                except Exception as e:
-                    logger.error(f"Error receiving message from WebSocket: {e}", exc_info=True) # Log exception details
-                    stop_received = True
-                    break # Exit inner loop on error
-
-            if stop_received:
+            if item is None:
                  logger.info("Stopping conversation loop due to stop event or error.")
                  break # Exit main conversation loop
-
-            if not audio_buffer or len(audio_buffer) < MIN_AUDIO_LENGTH_BYTES:
-                logger.info(f"Audio buffer too short ({len(audio_buffer)} bytes), waiting for more speech or ending.")
-                # If we timed out or got a stop with insufficient audio, break
-                if timeout_counter * 2.0 > 30.0 or stop_received:
-                     break
-                continue # Otherwise, continue waiting for more audio
+            audio_buffer, detected_at, endpoint_delay, stt_stream = item
+            logger.info(f"Processing {len(audio_buffer)} bytes of audio.")
+            playback.begin_turn()
+            degraded = next((name for name in ("stt", "tts") if breakers[name].is_open), None)
+            if degraded is not None:
+                await end_degraded(degraded)
+                break
+            # Times this turn's stages, from the end of the caller's speech to the first reply frame
+            turn_number += 1
+            turn_spans = TurnSpans(session_id, turn_number, detected_at - endpoint_delay).activate()
+            turn_spans.add("endpoint", endpoint_delay)
+            observe_stage("wait", time.monotonic() - detected_at)
 
             # 3. Transcribe user input
-            # Twilio streams ulaw 8kHz 1-channel. Need to convert to 16-bit PCM for Whisper STT.
+            # The stream has seen the utterance as it arrived; the final is often ready already
             try:
-                # Convert ulaw to 16-bit linear PCM
-                # Ensure audioop is imported at the top
-                pcm_audio_data = audioop.ulaw2lin(audio_buffer, SAMPLE_WIDTH)
-
-                # Save PCM to WAV for STT
-                wav_path = "temp_input.wav"
-                # Need to add WAV header to the PCM data using pydub
-                # Ensure pydub and its utilities are imported at the top
-                audio_segment = AudioSegment(
-                    pcm_audio_data,
-                    sample_width=SAMPLE_WIDTH,
-                    frame_rate=SAMPLE_RATE,
-                    channels=1
-                )
-                audio_segment.export(wav_path, format="wav")
-
-                logger.info(f"Saved user audio to {wav_path} ({os.path.getsize(wav_path)} bytes)")
-
-                user_text = stt.transcribe(wav_path)
+                with span("stt"):
+                    hypothesis = await stt_stream.finish(audio_buffer)
+                user_text = hypothesis.text
                 logger.info(f"User said: {user_text}")
                 transcript.append(f"User: {user_text}")
 
                 if not user_text.strip():
-                    reprompt = "Sorry, I didn't catch that. Could you please repeat?"
-                    reprompt_audio = tts.speak(reprompt)
-                    await send_audio_to_twilio(ws, reprompt_audio)
-                    transcript.append(f"Agent: {reprompt}")
+                    await play_prompt(playback, REPROMPT_MSG)
+                    agent_said(REPROMPT_MSG)
                     continue
 
             except Exception as e:
                  logger.error(f"Error during transcription: {e}", exc_info=True) # Log exception details
-                 reprompt = "Sorry, I had trouble understanding you. Could you please repeat?"
-                 reprompt_audio = tts.speak(reprompt)
-                 await send_audio_to_twilio(ws, reprompt_audio)
-                 transcript.append(f"Agent: {reprompt}")
+                 await play_prompt(playback, STT_ERROR_MSG)
+                 agent_said(STT_ERROR_MSG)
                  continue # Continue the loop to try again
 
-            # 4. Generate agent response and extract info
-            ai_response = run_agent(user_text)
+            # 4. Extract lead details locally, then generate the agent response
+            with span("slots"):
+                extracted, unparsed = slot_extractor.parse(user_text)
+            lead_info.update(extracted)
+            if playback.ended:
+                # Flushed on stop: the words are kept in the transcript and lead info, but nobody is left to answer
+                logger.info("Stream already stopped; recorded the caller's last utterance without replying.")
+                break
+            known = {field: lead_info[field] for field in SLOT_FIELDS}
+            intent = classify_intent(user_text, extracted)
+            cached_reply = response_cache.get(known, intent, extracted, unparsed)
+            if cached_reply is not None:
+                # Same dialog state as an earlier turn: no LLM call, and the audio is usually cached too
+                logger.info(f"Response cache hit ({intent}): {cached_reply}")
+                if speculator is not None:
+                    speculator.discard()
+                await play_prompt(playback, cached_reply, persist=False)
+                heard = agent_said(cached_reply)
+                await agent_stage.run(agent_service.remember_turn, user_text, cached_reply, session_id)
+                if playback.interrupted.is_set():
+                    agent_service.record_interruption(heard, session_id)
+                continue
+
+            if breakers["agent"].is_open:
+                if speculator is not None:
+                    speculator.discard()
+                await end_degraded("agent")
+                break
+
+            speculation = None
+            if speculator is not None:
+                with span("speculation"):
+                    speculation = await speculator.take(user_text)
+            if speculation is not None:
+                # The agent is already answering this exact transcript; play it and record the turn as if it just ran
+                ai_response, unspoken, turn = await stream_agent_reply(playback, user_text, session_id, known, speculation)
+                await agent_stage.run(agent_service.commit_turn, user_text, turn, session_id, known)
+            elif AGENT_STREAMING:
+                # Speaks the reply while it is being generated, holding back booking output
+                ai_response, unspoken, turn = await stream_agent_reply(playback, user_text, session_id, known)
+            else:
+                with span("agent"):
+                    turn = await agent_stage.run(agent_service.run_agent_turn, user_text, session_id, known)
+                ai_response = unspoken = turn.reply
             logger.info(f"Agent replied: {ai_response}")
-            transcript.append(f"Agent: {ai_response}")
+            if turn.structured:
+                # The function-calling engine returns typed slot updates every turn;
+                # the deterministic parse of this utterance still wins where both found a value
+                lead_info.update(turn.slots)
+                lead_info.update(extracted)
 
             # 5. Check for appointment intent and extract details
-            # Expecting LangChain agent to output a JSON block with appointment info when ready
-            if "appointment confirmed" in ai_response.lower() or "appointment booked" in ai_response.lower():
+            # The ReAct agent signals booking in free text with a JSON block; the function-calling engine sets a flag
+            booking = turn.ready_to_book if turn.structured else is_booking_reply(ai_response)
+            if booking:
                 logger.info("Appointment booking intent detected.")
+                transcript.append(f"Agent: {ai_response}")
+                # The confirmation itself was held back, so booking prompts start a fresh playback turn
+                playback.begin_turn()
                 # Try to extract info from the response (assume JSON block at end)
                 try:
-                    start = ai_response.index("{")
-                    end = ai_response.rindex("}") + 1
-                    info_json = ai_response[start:end]
-                    # Use json.loads if your agent outputs strict JSON, eval is risky
-                    info = json.loads(info_json)
-                    lead_info.update(info)
+                    if turn.structured:
+                        # Slots were already merged into lead_info above
+                        info = dict(lead_info)
+                    elif "{" not in ai_response and all(lead_info.get(field) for field in ("name", "email", "date", "time")):
+                        # No JSON block, but the extractor already has everything needed to book
+                        info = dict(lead_info)
+                    else:
+                        start = ai_response.index("{")
+                        end = ai_response.rindex("}") + 1
+                        info_json = ai_response[start:end]
+                        # Use json.loads if your agent outputs strict JSON, eval is risky
+                        info = json.loads(info_json)
+                        lead_info.update(info)
                     logger.info(f"Extracted lead info: {lead_info}")
                 except Exception as e:
                     logger.warning(f"Could not extract appointment info from agent response: {e}", exc_info=True) # Log exception details
                     # Fallback: Ask the user for details if extraction failed
-                    fallback_ask = "Could you please confirm your name, email, phone number, address, and preferred appointment time?"
-                    fallback_audio = tts.speak(fallback_ask)
-                    await send_audio_to_twilio(ws, fallback_audio)
-                    transcript.append(f"Agent: {fallback_ask}")
+                    await play_prompt(playback, CONFIRM_DETAILS_MSG)
+                    agent_said(CONFIRM_DETAILS_MSG)
                     continue # Continue the loop to get details
 
                 # Book appointment
@@ -206,10 +640,8 @@ async def handle_twilio_websocket(ws: WebSocket):
                     # Basic validation before booking
                     if not all([lead_info.get('name'), lead_info.get('email'), lead_info.get('date'), lead_info.get('time')]):
                          logger.warning("Missing required info for booking.")
-                         missing_info_msg = "I seem to be missing some details like your name, email, date, or time. Could you please provide them?"
-                         missing_info_audio = tts.speak(missing_info_msg)
-                         await send_audio_to_twilio(ws, missing_info_audio)
-                         transcript.append(f"Agent: {missing_info_msg}")
+                         await play_prompt(playback, MISSING_INFO_MSG)
+                         agent_said(MISSING_INFO_MSG)
                          continue # Continue the loop to get missing info
 
                     summary = f"Viewing with {lead_info.get('name', 'Lead')}"
@@ -226,64 +658,89 @@ async def handle_twilio_websocket(ws: WebSocket):
                     except ValueError:
                         logger.error(f"Could not parse date/time format: {start_time_str}. Using simple string concatenation.", exc_info=True) # Log exception details
                         end_time_str = f"{info.get('date')}T{info.get('time')}:30" # Fallback (less reliable)
+                        start_dt = None
+
+                    # Conflict check against the local index; None (not loaded or out of range) books as before
+                    if start_dt is not None and availability.is_free(start_dt, end_dt) is False:
+                        taken = describe_availability(availability, info.get('date'), info.get('time'))
+                        logger.info(f"Requested slot is taken, offering alternatives: {taken}")
+                        await speak_reply(playback, taken)
+                        agent_said(taken)
+                        # Ask for a new time; the agent sees the conflict in the index on its next turn
+                        lead_info["time"] = ""
+                        continue
 
                     attendees = [info.get('email')]
 
                     logger.info(f"Attempting to book appointment: Summary='{summary}', Start='{start_time_str}', End='{end_time_str}', Attendees='{[lead_info.get('email')]}'")
 
-                    link = calendar_service.create_appointment(
-                        summary, description, start_time_str, end_time_str, attendees
-                    )
-                    lead_info["calendar_link"] = link
-                    logger.info(f"Appointment booked successfully. Link: {link}")
+                    # Write-behind: the booking is stored locally and written to the calendar in the background,
+                    # so the caller is not kept waiting on the calendar API
+                    with span("calendar"):
+                        booking_id = await storage_stage.run(booking_queue.submit, summary, description, start_time_str, end_time_str, attendees)
+                    if start_dt is not None:
+                        availability.add_busy(start_dt, end_dt)
+                    lead_info["booking_id"] = booking_id
+                    logger.info(f"Appointment accepted as booking {booking_id}; the calendar link is available from /bookings/{booking_id} with the admin key")
 
                     closing = (
                         f"Your appointment is booked! You'll receive a confirmation at {lead_info.get('email', 'your email')}. "
                         "Thank you for your time. Goodbye!"
                     )
-                    closing_audio = tts.speak(closing)
-                    await send_audio_to_twilio(ws, closing_audio)
-                    transcript.append(f"Agent: {closing}")
+                    await speak_reply(playback, closing)
+                    agent_said(closing)
                     appointment_booked = True # Exit loop after booking
                     break # Ensure loop breaks
 
                 except Exception as e:
+                    PROVIDER_ERRORS.inc(provider="calendar")
                     logger.error(f"Failed to book appointment: {e}", exc_info=True) # Log exception details
-                    error_msg = "Sorry, I was unable to book your appointment. Please try again later."
-                    error_audio = tts.speak(error_msg)
-                    await send_audio_to_twilio(ws, error_audio)
-                    transcript.append(f"Agent: {error_msg}")
+                    await play_prompt(playback, BOOKING_ERROR_MSG)
+                    agent_said(BOOKING_ERROR_MSG)
                     # Decide whether to break or continue the conversation after booking failure
                     # For now, let's break to avoid infinite loop on booking error
                     break
 
 
-            # 6. Speak agent response (if not booking)
+            # 6. Speak agent response (if not booking and not already spoken while streaming)
             else:
-                response_audio = tts.speak(ai_response)
-                await send_audio_to_twilio(ws, response_audio)
+                response_cache.put(known, intent, ai_response, extracted, unparsed)
+                if unspoken and not playback.interrupted.is_set():
+                    await speak_reply(playback, unspoken)
+                heard = agent_said(ai_response)
+                if playback.interrupted.is_set():
+                    # Keep the agent's memory in line with what the caller actually heard
+                    logger.info(f"Caller interrupted the reply after hearing: '{heard}'")
+                    agent_service.record_interruption(heard, session_id)
 
     except Exception as e:
         logger.error(f"WebSocket error during conversation: {e}", exc_info=True) # Log exception details
 
     finally:
-        logger.info("Call ended. Saving transcript and lead info.")
-        # Save transcript and lead info
-        ts = int(time.time())
-        try:
-            with open(f"call_transcript_{ts}.txt", "w", encoding="utf-8") as f:
-                for line in transcript:
-                    f.write(line + "\n")
-            logger.info(f"Transcript saved to call_transcript_{ts}.txt")
-        except Exception as e:
-            logger.error(f"Failed to save transcript: {e}", exc_info=True) # Log exception details
-
-        try:
-            with open(f"lead_info_{ts}.json", "w", encoding="utf-8") as f:
-                json.dump(lead_info, f, indent=2)
-            logger.info(f"Lead info saved to lead_info_{ts}.json")
-        except Exception as e:
-            logger.error(f"Failed to save lead info: {e}", exc_info=True) # Log exception details
+        if turn_spans is not None:
+            turn_spans.finish(playback.turn_first_frame_at)
+        receiver.cancel()
+        transcriber.close()
+        if speculator is not None:
+            speculator.discard()
+            logger.info(f"Agent speculation: {speculation_stats.summary()}")
+        # Keep the saved state only if the connection dropped mid-call; Twilio may reconnect it
+        await checkpoint.close(delete=playback.ended or appointment_booked or not playback.call_sid)
+        if agent_service.loaded:
+            agent_service.end_session(session_id)
+        call_gate.leave()
+        ACTIVE_CALLS.dec()
+        CALL_SECONDS.observe(time.monotonic() - call_started)
+        PACER_UNDERRUNS.inc(playback.pacer.underruns)
+        logger.info(f"Outbound pacing: {playback.pacer.stats()}")
+        logger.info(f"Agent engine turns: {engine_stats[AGENT_ENGINE].summary()}")
+        logger.info(f"Response cache: {response_cache.stats()}")
+        logger.info("Call ended. Saving call record.")
+        # Queued for the batched writer; the call record store indexes it by call SID, phone, email and date
+        call_records.submit(call_record(
+            transcript, lead_info, started_at=call_started_at, call_sid=playback.call_sid,
+            stream_sid=playback.stream_sid, booked=appointment_booked,
+        ))
 
         logger.info("Full call transcript:")
         for line in transcript:
@@ -1,51 +1,93 @@
 import os
+import re
+import json
+import time
 import logging
+from datetime import datetime, timedelta
 from dotenv import load_dotenv
 # Import from langchain_community as recommended
 from langchain_community.chat_models import ChatOpenAI
 from langchain.agents import initialize_agent, Tool, AgentType
-from langchain.memory import ConversationBufferMemory
+from langchain.memory import ConversationSummaryBufferMemory, ReadOnlySharedMemory
 from langchain.prompts import MessagesPlaceholder # Needed for conversational agent prompt
-from services.GoogleCalendar import GoogleCalendarService # Import your Calendar service
+from langchain.callbacks.base import BaseCallbackHandler
+from langchain.schema import messages_from_dict, messages_to_dict
+from services.Providers import providers, calendar_service # Calendar client shared with the call handler
+from agent.agent_engine import AgentTurn, AgentSessions, JsonStringExtractor, TurnCancelled, AGENT_BUDGET_S, AGENT_ENGINE, engine_stats
+from agent.function_calling_agent import FunctionCallingAgent
+from agent.slot_extractor import summarize_slots, parse_date, parse_time
+from services.Availability import availability, describe_availability
+from services.BookingQueue import booking_queue
+from services.Metrics import PROVIDER_ERRORS
+from services.Executor import agent_stage
+from services.Resilience import breakers
 
 # Load environment variables
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 
-# Initialize Google Calendar Service
-# Note: This will be initialized once when the script is first imported.
-# Ensure it handles potential initialization errors gracefully.
-calendar_service = GoogleCalendarService()
-
 # Define the tool for booking appointments
 # The input to this tool will be a string from the LLM
 def book_appointment_tool(info_string: str) -> str:
     """
     Books a real estate appointment using extracted information.
-    Input should be a string containing appointment details (name, email, phone, address, date, time).
-    The format of the string should be parsable by GoogleCalendarService.create_appointment_from_string.
+    Input should be a JSON string with the appointment details (name, email, phone, address, date, time).
+    The booking goes on the write-behind queue, which is the only writer to the calendar: the
+    handler submits the same details again when the agent confirms, and that resolves to the
+    same booking key (and calendar event id), so the appointment is written once.
     """
     logger.info(f"Attempting to book appointment with info: {info_string}")
-    if calendar_service.service is None:
-        logger.error("Google Calendar service is not initialized. Cannot book appointment.")
-        return "Error: Calendar service not available."
+    try:
+        info = json.loads(info_string)
+        start_time = f"{info['date']}T{info['time']}:00"
+        end_time = (datetime.strptime(start_time, "%Y-%m-%dT%H:%M:%S") + timedelta(minutes=30)).strftime("%Y-%m-%dT%H:%M:%S")
+    except (ValueError, TypeError, KeyError) as e:
+        logger.error(f"Could not parse booking details {info_string!r}: {e}")
+        return "Appointment booking failed: the input must be JSON with the date as YYYY-MM-DD and the time as HH:MM."
+    if not info.get("email"):
+        return "Appointment booking failed: the caller's email is missing."
 
     try:
-        # Call the method in your GoogleCalendarService to handle parsing and booking
-        calendar_link = calendar_service.create_appointment_from_string(info_string)
-        if calendar_link:
-            logger.info(f"Appointment booked successfully. Link: {calendar_link}")
-            return f"Appointment booked successfully. Calendar link: {calendar_link}"
-        else:
-            logger.error("Appointment booking failed via GoogleCalendarService.")
-            return "Appointment booking failed."
+        # Runs on the agent stage thread, so the blocking queue write stays off the event loop
+        booking_id = booking_queue.submit(
+            f"Viewing with {info.get('name', 'Lead')}",
+            f"Phone: {info.get('phone', 'N/A')}\nAddress: {info.get('address', 'N/A')}",
+            start_time, end_time, [info.get("email")],
+        )
     except Exception as e:
-        logger.error(f"Error calling Google Calendar tool: {e}")
+        logger.error(f"Error queueing booking: {e}")
         return f"An error occurred during appointment booking: {e}"
+    logger.info(f"Appointment queued as booking {booking_id}")
+    return f"Appointment booked (booking {booking_id}); a calendar invitation will be sent to {info.get('email')}."
+
+
+def check_availability_tool(query: str) -> str:
+    """
+    Answers from the local availability index, so it costs no calendar API call.
+    Input is the requested date and/or time in any form the slot extractor understands.
+    """
+    now = calendar_service.now()
+    day = parse_date(query, now.date())
+    if day:
+        query = query[:day[1][0]] + " " + query[day[1][1]:]
+    clock = parse_time(query)
+    answer = describe_availability(
+        availability,
+        day[0].isoformat() if day else None,
+        clock[0] if clock else None,
+        now,
+    )
+    logger.info(f"Availability check for {query!r}: {answer}")
+    return answer
 
 
 tools = [
+    Tool(
+        name="CheckAvailability",
+        func=check_availability_tool,
+        description="Checks whether a viewing slot is free and lists the next open slots. Input is the requested date and time, e.g. '2025-07-10 14:30' or 'next Tuesday afternoon'; leave it empty for the earliest openings."
+    ),
     Tool(
         name="BookAppointment",
         func=book_appointment_tool,
@@ -60,12 +102,14 @@ system_message = (
     "- Greet the lead and introduce yourself. "
     "- Ask for their name and what kind of property they want to view. "
     "- Collect their email, phone number, and preferred appointment date (YYYY-MM-DD) and time (HH:MM). "
+    "- Use the CheckAvailability tool before confirming a date and time, and offer the open slots it returns if the requested one is taken. "
     "- Confirm the details back to them. "
     "- Once you have ALL required information (name, email, phone, address, date, time) AND the user confirms they want to book, use the BookAppointment tool. "
     "- The input to the BookAppointment tool MUST be a JSON string containing the collected details. Example: '{{\"name\": \"John Doe\", \"email\": \"john@example.com\", \"phone\": \"555-1234\", \"address\": \"123 Main St\", \"date\": \"2025-07-10\", \"time\": \"14:30\"}}' "
     "- After using the tool, inform the user if the booking was successful and politely end the call. "
     "- If the user declines booking, thank them and end the call politely. "
-    "Always keep the conversation natural and helpful. Do NOT book the appointment until the user explicitly confirms."
+    "Always keep the conversation natural and helpful. Do NOT book the appointment until the user explicitly confirms. "
+    "Details already captured from the caller are listed in brackets before their message; use them and only ask for what is still needed."
 )
 
 # Initialize the LLM
@@ -73,17 +117,48 @@ openai_api_key = os.getenv("OPENAI_API_KEY")
 if not openai_api_key:
     logger.error("OPENAI_API_KEY not found in environment variables. LangChain agent will not work.")
     llm = None # Or raise an error
+    summary_llm = None
 else:
-    llm = ChatOpenAI(temperature=0, openai_api_key=openai_api_key, model="gpt-4o") # Using gpt-4o for better reasoning/tool use
+    # Built on first use or by the startup warm-up; creating them imports the openai SDK
+    # streaming=True lets stream_agent receive tokens; run_agent is unaffected
+    llm = providers.register(
+        "llm", lambda: ChatOpenAI(temperature=0, openai_api_key=openai_api_key, model="gpt-4o", streaming=True, request_timeout=AGENT_BUDGET_S), # Using gpt-4o for better reasoning/tool use
+        agent_stage,
+    )
 
-# Initialize memory
-memory = ConversationBufferMemory(memory_key="chat_history", return_messages=True)
+    # Older turns are folded into a running summary by a cheaper, non-streaming model
+    summary_llm = providers.register(
+        "summary_llm", lambda: ChatOpenAI(temperature=0, openai_api_key=openai_api_key, model=os.getenv("AGENT_SUMMARY_MODEL", "gpt-4o-mini"), request_timeout=AGENT_BUDGET_S),
+        agent_stage,
+    )
 
-# Initialize the agent
-if llm:
-    agent_chain = initialize_agent(
-        tools,
-        llm,
+# Token budget for the chat history sent with every turn; older turns are summarized
+AGENT_MEMORY_MAX_TOKENS = int(os.getenv("AGENT_MEMORY_MAX_TOKENS", "1200"))
+# Sessions that were never ended (e.g. a worker crash mid-call) are dropped after this long idle
+AGENT_SESSION_TTL_S = float(os.getenv("AGENT_SESSION_TTL_S", "3600"))
+DEFAULT_SESSION = "default"
+
+
+class SpeculationAborted(Exception):
+    """Raised inside a speculative ReAct turn that tries to book; booking must wait for the final transcript."""
+
+
+def _defer_booking(info_string: str) -> str:
+    raise SpeculationAborted("BookAppointment called during a speculative turn")
+
+
+# Same tool surface for speculative turns, minus the side effect; availability checks are read-only
+speculative_tools = [
+    tool if tool.name == "CheckAvailability" else Tool(name=tool.name, func=_defer_booking, description=tool.description)
+    for tool in tools
+]
+
+
+def build_agent(memory, agent_tools=None):
+    """Creates a conversational agent bound to one conversation's memory."""
+    return initialize_agent(
+        agent_tools or tools,
+        llm.get(),
         agent=AgentType.CHAT_CONVERSATIONAL_REACT_DESCRIPTION,
         memory=memory,
         verbose=True, # Set to True to see agent's thought process
@@ -92,23 +167,326 @@ if llm:
             "extra_prompt_messages": [MessagesPlaceholder(variable_name="chat_history")],
         }
     )
-    logger.info("LangChain agent initialized.")
-else:
-    agent_chain = None
+
+
+class AgentSession:
+    """
+    One call's ReAct agent and its memory: a token-budgeted window of recent turns plus a
+    rolling summary of older ones, which keeps the prompt size flat over a long call.
+    """
+
+    def __init__(self):
+        self.memory = ConversationSummaryBufferMemory(
+            llm=summary_llm.get(),
+            max_token_limit=AGENT_MEMORY_MAX_TOKENS,
+            memory_key="chat_history",
+            return_messages=True,
+        )
+        self.agent_chain = build_agent(self.memory)
+        self._speculative_chain = None
+        self.last_used = time.monotonic()
+
+    @property
+    def speculative_chain(self):
+        """Agent that reads this session's memory without writing to it and cannot book."""
+        if self._speculative_chain is None:
+            self._speculative_chain = build_agent(ReadOnlySharedMemory(memory=self.memory), speculative_tools)
+        return self._speculative_chain
+
+    def export_state(self) -> dict:
+        return {
+            "summary": self.memory.moving_summary_buffer,
+            "messages": messages_to_dict(self.memory.chat_memory.messages),
+        }
+
+    def restore_state(self, state):
+        self.memory.moving_summary_buffer = state.get("summary", "")
+        self.memory.chat_memory.messages = messages_from_dict(state.get("messages", []))
+
+
+class TurnStatsHandler(BaseCallbackHandler):
+    """Counts LLM round trips and tokens for one ReAct turn."""
+
+    def __init__(self):
+        self.round_trips = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    def on_chat_model_start(self, serialized, messages, **kwargs):
+        self.round_trips += 1
+        try:
+            self.prompt_tokens += llm.get_num_tokens_from_messages(messages[0])
+        except Exception:
+            pass # Token counting needs tiktoken; round trips are still counted
+
+    def on_llm_new_token(self, token: str, **kwargs):
+        self.completion_tokens += 1
+
+
+class CancelHandler(BaseCallbackHandler):
+    """Stops a ReAct turn with TurnCancelled at its next LLM call, token or tool once `cancelled` is set."""
+
+    raise_error = True # LangChain otherwise logs callback exceptions and carries on
+
+    def __init__(self, cancelled):
+        self.cancelled = cancelled
+
+    def _check(self):
+        if self.cancelled.is_set():
+            raise TurnCancelled()
+
+    def on_llm_start(self, *args, **kwargs):
+        self._check()
+
+    def on_chat_model_start(self, *args, **kwargs):
+        self._check()
+
+    def on_llm_new_token(self, token: str, **kwargs):
+        # Raising here abandons the model's response stream
+        self._check()
+
+    def on_tool_start(self, *args, **kwargs):
+        self._check()
+
+
+# Initialize the agent
+if not llm:
+    sessions = None
+    function_agent = None
     logger.error("LangChain agent not initialized due to missing OpenAI API key.")
+elif AGENT_ENGINE == "function_calling":
+    sessions = None
+    function_agent = FunctionCallingAgent(ttl=AGENT_SESSION_TTL_S)
+    logger.info("Function-calling agent initialized.")
+else:
+    sessions = AgentSessions(AgentSession, AGENT_SESSION_TTL_S)
+    function_agent = None
+    logger.info("LangChain agent initialized.")
+
+
+def _with_state(user_input: str, known):
+    """Prefixes the caller's message with the details extracted so far, if any."""
+    if not known or not any(known.values()):
+        return user_input
+    return f"[{summarize_slots(known)}] {user_input}"
 
 
-def run_agent(user_input: str) -> str:
+def _run_react(user_input: str, session_id: str, callbacks=(), known=None, speculative=False):
     """
-    Runs the LangChain agent with user input.
-    Returns the agent's response.
+    Runs one ReAct turn and records its round trips, tokens and latency. Speculative turns
+    may yet be discarded, so they leave the agent breaker and engine stats alone.
     """
-    if agent_chain is None:
-        return "Sorry, the AI agent is not available."
+    user_input = _with_state(user_input, known)
+    stats = TurnStatsHandler()
+    started = time.monotonic()
+    session = sessions.get(session_id)
+    chain = session.speculative_chain if speculative else session.agent_chain
+    # The agent_chain.run method handles the conversation and tool calls
     try:
-        # The agent_chain.run method handles the conversation and tool calls
-        response = agent_chain.run(input=user_input)
+        response = chain.run(input=user_input, callbacks=[stats, *callbacks])
+    except (SpeculationAborted, TurnCancelled):
+        raise
+    except Exception:
+        if not speculative:
+            breakers["agent"].failure()
+        raise
+    if speculative:
         return response
+    breakers["agent"].success()
+    engine_stats["react"].record(stats.round_trips, stats.prompt_tokens, stats.completion_tokens, time.monotonic() - started)
+    return response
+
+
+def run_agent_turn(user_input: str, session_id: str = DEFAULT_SESSION, known=None) -> AgentTurn:
+    """
+    Runs one agent turn with the configured engine.
+    `known` is the lead details extracted locally so far; the agent gets them as a compact summary.
+    The function-calling engine fills in slots and ready_to_book; the ReAct engine only sets reply.
+    """
+    if function_agent is not None:
+        return function_agent.run_turn(user_input, session_id, known=known)
+    if sessions is None:
+        return AgentTurn("Sorry, the AI agent is not available.")
+    try:
+        return AgentTurn(_run_react(user_input, session_id, known=known))
     except Exception as e:
+        PROVIDER_ERRORS.inc(provider="agent")
         logger.error(f"Error running LangChain agent: {e}")
-        return "Sorry, I encountered an error. Could you please try again?"
+        return AgentTurn("Sorry, I encountered an error. Could you please try again?")
+
+
+def speculate_turn(user_input: str, session_id: str = DEFAULT_SESSION, known=None, on_text=None, cancelled=None):
+    """
+    Runs an agent turn on a partial transcript without touching the call's memory.
+    With `on_text`, the reply is streamed to it as in stream_agent. Setting `cancelled` (a
+    threading.Event) stops the model request at its next streamed token.
+    Returns the AgentTurn, or None if the turn cannot be taken ahead of time (the ReAct agent
+    tried to book, the agent failed or the turn was cancelled). Apply a kept result with
+    `commit_turn`. Blocking.
+    """
+    if function_agent is None and sessions is None:
+        return None
+    try:
+        if function_agent is not None:
+            return function_agent.run_turn(user_input, session_id, on_text=on_text, known=known, commit=False, cancelled=cancelled)
+        callbacks = [FinalAnswerStreamHandler(on_text)] if on_text is not None else []
+        if cancelled is not None:
+            callbacks.append(CancelHandler(cancelled))
+        return AgentTurn(_run_react(user_input, session_id, callbacks, known=known, speculative=True))
+    except TurnCancelled:
+        logger.debug("Speculative turn cancelled; its model request was closed.")
+    except SpeculationAborted:
+        logger.info("Speculative turn wants to book; leaving it to the final transcript.")
+    except Exception as e:
+        logger.warning(f"Speculative agent turn failed: {e}")
+    return None
+
+
+def commit_turn(user_input: str, turn: AgentTurn, session_id: str = DEFAULT_SESSION, known=None):
+    """Records a speculative turn in the call's memory as if it had just run. Blocking."""
+    if function_agent is not None:
+        function_agent.commit_turn(user_input, turn, session_id, known)
+    elif sessions is not None:
+        sessions.get(session_id).memory.save_context({"input": _with_state(user_input, known)}, {"output": turn.reply})
+
+
+def run_agent(user_input: str, session_id: str = DEFAULT_SESSION) -> str:
+    """
+    Runs the agent with user input in the given call's conversation.
+    Returns the agent's response.
+    """
+    return run_agent_turn(user_input, session_id).reply
+
+
+def remember_turn(user_input: str, reply: str, session_id: str = DEFAULT_SESSION):
+    """
+    Adds an exchange that was answered without the agent (e.g. from the response cache) to the
+    call's memory, so the agent knows what was already said. Blocking.
+    """
+    if function_agent is not None:
+        function_agent.remember_turn(user_input, reply, session_id)
+    elif sessions is not None:
+        sessions.get(session_id).memory.save_context({"input": user_input}, {"output": reply})
+
+
+def export_session(session_id: str = DEFAULT_SESSION):
+    """The call's conversation memory as JSON-ready data, or None if it has none. Blocking."""
+    if function_agent is not None:
+        return function_agent.export_session(session_id)
+    if sessions is not None:
+        return sessions.export(session_id)
+    return None
+
+
+def restore_session(session_id: str, state):
+    """
+    Restores memory saved by `export_session`, e.g. when a call moves to this worker. Blocking.
+    State from the other engine is ignored.
+    """
+    if not state:
+        return
+    if function_agent is not None and "slots" in state:
+        function_agent.restore_session(session_id, state)
+    elif sessions is not None and "messages" in state:
+        sessions.restore(session_id, state)
+
+
+def end_session(session_id: str):
+    """Releases a call's conversation memory. Call when the call ends."""
+    if function_agent is not None:
+        function_agent.end_session(session_id)
+    elif sessions is not None:
+        sessions.end(session_id)
+
+
+def record_interruption(heard_text: str, session_id: str = DEFAULT_SESSION):
+    """
+    Rewrites the agent's last reply in memory to what the caller actually heard before
+    barging in, so the next turn does not assume the rest of the reply was delivered.
+    """
+    if function_agent is not None:
+        function_agent.record_interruption(heard_text, session_id)
+        return
+    session = sessions.peek(session_id) if sessions is not None else None
+    if session is None:
+        return
+    for message in reversed(session.memory.chat_memory.messages):
+        if message.type == "ai":
+            if heard_text:
+                message.content = f"{heard_text} [interrupted by the caller]"
+            else:
+                message.content = "[interrupted by the caller before hearing the reply]"
+            break
+
+# The conversational ReAct agent answers with {"action": "Final Answer", "action_input": "..."}
+_FINAL_ANSWER_START = re.compile(r'"action"\s*:\s*"Final Answer"\s*,\s*"action_input"\s*:\s*"')
+
+
+class FinalAnswerExtractor(JsonStringExtractor):
+    """
+    Incrementally decodes the Final Answer string out of the agent's streamed JSON output.
+    Tool-call outputs never match, so only the text meant for the caller is emitted.
+    """
+
+    def __init__(self):
+        super().__init__(_FINAL_ANSWER_START)
+
+
+class FinalAnswerStreamHandler(BaseCallbackHandler):
+    """LangChain callback that forwards Final Answer text to `emit` as tokens arrive."""
+
+    def __init__(self, emit):
+        # Not `on_text`: that name is LangChain's hook for agent log text, which must not be spoken
+        self.emit = emit
+        self.extractor = FinalAnswerExtractor()
+
+    def on_llm_start(self, *args, **kwargs):
+        # Every LLM call in the ReAct loop starts a fresh JSON blob
+        self.extractor.reset()
+
+    def on_llm_new_token(self, token: str, **kwargs):
+        text = self.extractor.feed(token)
+        if text:
+            self.emit(text)
+
+
+def stream_agent(user_input: str, session_id: str = DEFAULT_SESSION, on_text=None, known=None) -> AgentTurn:
+    """
+    Streaming variant of run_agent_turn: passes the agent's reply to `on_text` in pieces as the
+    model writes it and returns the finished AgentTurn. Tool calls run as usual; only the final
+    answer is streamed, and booking turns are not spoken. Blocking; `on_text` is called on the
+    calling thread (an agent stage worker), so a turn occupies no thread beyond its stage slot.
+    """
+    if function_agent is None and sessions is None:
+        turn = AgentTurn("Sorry, the AI agent is not available.")
+        on_text(turn.reply)
+        return turn
+
+    streamed = []
+
+    def forward(piece):
+        streamed.append(piece)
+        on_text(piece)
+
+    try:
+        if function_agent is not None:
+            turn = function_agent.run_turn(user_input, session_id, on_text=forward, known=known)
+        else:
+            turn = AgentTurn(_run_react(user_input, session_id, [FinalAnswerStreamHandler(forward)], known=known))
+    except Exception as e:
+        PROVIDER_ERRORS.inc(provider="agent")
+        logger.error(f"Error running LangChain agent: {e}")
+        turn = AgentTurn("Sorry, I encountered an error. Could you please try again?")
+    if turn.ready_to_book:
+        return turn # Booking turns are confirmed by the handler, not spoken
+
+    # Emit whatever the stream missed (e.g. output the parser fixed up after the fact)
+    so_far = "".join(streamed)
+    if not so_far:
+        on_text(turn.reply)
+    elif turn.reply.startswith(so_far):
+        if len(turn.reply) > len(so_far):
+            on_text(turn.reply[len(so_far):])
+    else:
+        logger.warning("Streamed agent output differs from the final response.")
+    return turn
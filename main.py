@@ -1,4 +1,5 @@
 import uvicorn
+import argparse
 import logging
 import os
 from dotenv import load_dotenv
@@ -15,5 +16,21 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 if __name__ == "__main__":
-    logger.info("Starting FastAPI server...")
-    uvicorn.run("api.server:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Run the voice agent server.")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", "0")),
+                        help="Production mode with this many worker processes (no auto-reload)")
+    args = parser.parse_args()
+
+    if args.workers:
+        # Calls move between workers only through the shared session store; provider clients,
+        # caches and metrics stay per worker
+        if args.workers > 1 and os.getenv("SESSION_STORE", "memory") == "memory":
+            logger.warning("SESSION_STORE=memory with several workers: a reconnected call may land on a worker "
+                           "that has none of its state. Set SESSION_STORE=sqlite.")
+        logger.info(f"Starting FastAPI server with {args.workers} worker(s)...")
+        uvicorn.run("api.server:app", host=args.host, port=args.port, workers=args.workers)
+    else:
+        logger.info("Starting FastAPI server in development mode (auto-reload)...")
+        uvicorn.run("api.server:app", host=args.host, port=args.port, reload=True)
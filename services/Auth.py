@@ -0,0 +1,50 @@
+import os
+import hmac
+import logging
+from fastapi import Request, HTTPException
+
+logger = logging.getLogger(__name__)
+
+TWILIO_AUTH_TOKEN = os.getenv("TWILIO_AUTH_TOKEN")
+# Twilio signs the URL it requested; behind a proxy or tunnel set the public origin, e.g. https://voice.example.com
+PUBLIC_BASE_URL = os.getenv("PUBLIC_BASE_URL", "").rstrip("/")
+# Key for the routes exposing call records, transcripts and bookings; unset keeps them closed
+ADMIN_API_KEY = os.getenv("ADMIN_API_KEY")
+
+
+def _public_url(request: Request) -> str:
+    if not PUBLIC_BASE_URL:
+        return str(request.url)
+    query = f"?{request.url.query}" if request.url.query else ""
+    return f"{PUBLIC_BASE_URL}{request.url.path}{query}"
+
+
+async def verify_twilio_signature(request: Request):
+    """
+    FastAPI dependency for Twilio webhooks: checks X-Twilio-Signature against the request URL
+    and form parameters with the account's auth token, and answers 403 on a mismatch.
+    """
+    from twilio.request_validator import RequestValidator # Only webhook requests need the SDK
+
+    signature = request.headers.get("X-Twilio-Signature", "")
+    if not TWILIO_AUTH_TOKEN:
+        logger.error("TWILIO_AUTH_TOKEN is not set; rejecting webhook that cannot be verified.")
+        raise HTTPException(status_code=403, detail="Webhook signature cannot be verified")
+    form = await request.form()
+    if not signature or not RequestValidator(TWILIO_AUTH_TOKEN).validate(_public_url(request), dict(form), signature):
+        logger.warning(f"Rejected webhook with an invalid Twilio signature from {request.client.host if request.client else 'unknown'}")
+        raise HTTPException(status_code=403, detail="Invalid Twilio signature")
+
+
+async def require_admin(request: Request):
+    """
+    FastAPI dependency for routes exposing callers' personal data: requires ADMIN_API_KEY as a
+    bearer token or in X-API-Key, and answers 403 otherwise, including when no key is configured.
+    """
+    supplied = request.headers.get("X-API-Key", "")
+    authorization = request.headers.get("Authorization", "")
+    if authorization.lower().startswith("bearer "):
+        supplied = authorization[7:].strip()
+    if not ADMIN_API_KEY or not supplied or not hmac.compare_digest(supplied.encode(), ADMIN_API_KEY.encode()):
+        logger.warning(f"Rejected unauthenticated request for {request.url.path} from {request.client.host if request.client else 'unknown'}")
+        raise HTTPException(status_code=403, detail="Admin API key required")
@@ -0,0 +1,251 @@
+import os
+import time
+import asyncio
+import bisect
+import logging
+import threading
+from datetime import datetime, timedelta
+from services.Executor import calendar_stage
+from services.Resilience import breakers
+
+logger = logging.getLogger(__name__)
+
+SLOT_MINUTES = int(os.getenv("APPOINTMENT_MINUTES", "30"))
+# Viewing hours in the calendar's time zone, and weekdays (Monday is 0) that take bookings
+BUSINESS_HOURS = os.getenv("BUSINESS_HOURS", "09:00-18:00")
+BUSINESS_DAYS = os.getenv("BUSINESS_DAYS", "0,1,2,3,4,5")
+AVAILABILITY_HORIZON_DAYS = int(os.getenv("AVAILABILITY_HORIZON_DAYS", "14"))
+AVAILABILITY_REFRESH_S = float(os.getenv("AVAILABILITY_REFRESH_S", "60"))
+
+_EPOCH = datetime(2000, 1, 1)
+_MINUTE = timedelta(minutes=1)
+
+
+def _minutes(moment: datetime) -> int:
+    return (moment - _EPOCH) // _MINUTE
+
+
+def _moment(minutes: int) -> datetime:
+    return _EPOCH + minutes * _MINUTE
+
+
+def _clock(text):
+    hour, minute = text.strip().split(":")
+    return int(hour) * 60 + int(minute)
+
+
+class AvailabilityIndex:
+    """
+    Local copy of the appointment calendar's busy time, so availability is answered without an
+    API call mid-conversation. Busy time is kept as merged, sorted, disjoint intervals in two
+    parallel lists of minute offsets; conflict checks are a bisect and "next free slots" walks
+    forward from one. All times are naive datetimes in the calendar's time zone.
+
+    The intervals are replaced wholesale by each free/busy refresh (see `refresh_forever`) and
+    updated incrementally by `add_busy` when we book, so a booking is visible before the next
+    refresh. Until the first refresh, and beyond the refreshed horizon, answers are None.
+    """
+
+    def __init__(self, slot_minutes=SLOT_MINUTES, business_hours=BUSINESS_HOURS, business_days=BUSINESS_DAYS):
+        self.slot_minutes = slot_minutes
+        opens, closes = business_hours.split("-")
+        self.opens = _clock(opens)
+        self.closes = _clock(closes)
+        self.business_days = {int(day) for day in business_days.split(",") if day.strip()}
+        self._starts = []
+        self._ends = []
+        self._covered = None  # (start, end) minutes the last refresh covered
+        self._recent = []  # Local bookings (start, end, booked_at) not yet seen by a refresh
+        self._lock = threading.Lock()
+        self.refreshes = 0
+        self.refresh_errors = 0
+        self.refreshed_at = None
+        self.bookings = 0
+        self.now = datetime.now  # Replaced by the calendar's clock once refreshing starts
+
+    @property
+    def loaded(self) -> bool:
+        return self._covered is not None
+
+    @property
+    def covered_until(self):
+        """End of the window the last refresh covered, or None before the first refresh."""
+        return _moment(self._covered[1]) if self._covered is not None else None
+
+    def _insert(self, start, end):
+        # Merge [start, end) with every interval it touches, then insert it in order
+        i = bisect.bisect_left(self._ends, start)
+        j = bisect.bisect_right(self._starts, end)
+        if i < j:
+            start = min(start, self._starts[i])
+            end = max(end, self._ends[j - 1])
+        self._starts[i:j] = [start]
+        self._ends[i:j] = [end]
+
+    def replace(self, busy, window_start: datetime, window_end: datetime, queried_at=None):
+        """
+        Installs a free/busy snapshot for [window_start, window_end). Local bookings made after
+        `queried_at` (a time.monotonic() value) are kept, since the snapshot may predate them.
+        """
+        with self._lock:
+            self._starts, self._ends = [], []
+            for start, end in sorted(busy):
+                self._insert(_minutes(start), _minutes(end))
+            if queried_at is not None:
+                self._recent = [booking for booking in self._recent if booking[2] >= queried_at]
+            for start, end, _ in self._recent:
+                self._insert(start, end)
+            self._covered = (_minutes(window_start), _minutes(window_end))
+            self.refreshes += 1
+            self.refreshed_at = time.time()
+
+    def add_busy(self, start: datetime, end: datetime):
+        """Marks [start, end) busy right away, e.g. after we booked it."""
+        start, end = _minutes(start), _minutes(end)
+        with self._lock:
+            self._insert(start, end)
+            self._recent.append((start, end, time.monotonic()))
+            self.bookings += 1
+
+    def _covers(self, start, end):
+        return self._covered is not None and self._covered[0] <= start and end <= self._covered[1]
+
+    def _conflict(self, start, end):
+        i = bisect.bisect_right(self._starts, start) - 1
+        if i >= 0 and self._ends[i] > start:
+            return True
+        return i + 1 < len(self._starts) and self._starts[i + 1] < end
+
+    def is_free(self, start: datetime, end: datetime = None):
+        """True if [start, end) is free, False on a conflict, None if the index does not cover it."""
+        start = _minutes(start)
+        end = _minutes(end) if end is not None else start + self.slot_minutes
+        with self._lock:
+            if not self._covers(start, end):
+                return None
+            return not self._conflict(start, end)
+
+    def in_business_hours(self, start: datetime, end: datetime = None) -> bool:
+        end = end or start + timedelta(minutes=self.slot_minutes)
+        day_start = _minutes(datetime.combine(start.date(), datetime.min.time()))
+        return (
+            start.weekday() in self.business_days
+            and end.date() == start.date()
+            and self.opens <= _minutes(start) - day_start
+            and _minutes(end) - day_start <= self.closes
+        )
+
+    def next_free_slots(self, after: datetime, count=3):
+        """
+        Start times of the next `count` free slots at or after `after`, aligned to the slot length
+        and within business hours. Returns fewer near the end of the covered window, None if not loaded.
+        """
+        slot = self.slot_minutes
+        found = []
+        with self._lock:
+            if self._covered is None:
+                return None
+            window_end = self._covered[1]
+            t = max(_minutes(after), self._covered[0])
+            t += -t % slot
+            while len(found) < count and t + slot <= window_end:
+                day = t - _minutes(datetime.combine(_moment(t).date(), datetime.min.time()))
+                day_start = t - day
+                if _moment(t).weekday() not in self.business_days or day + slot > self.closes:
+                    t = day_start + 24 * 60 + self.opens
+                    continue
+                if day < self.opens:
+                    t = day_start + self.opens
+                    continue
+                i = bisect.bisect_right(self._starts, t) - 1
+                if i >= 0 and self._ends[i] > t:
+                    t = self._ends[i]
+                elif i + 1 < len(self._starts) and self._starts[i + 1] < t + slot:
+                    t = self._ends[i + 1]
+                else:
+                    found.append(_moment(t))
+                    t += slot
+                    continue
+                t += -t % slot
+        return found
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "loaded": self._covered is not None,
+                "busy_intervals": len(self._starts),
+                "refreshes": self.refreshes,
+                "refresh_errors": self.refresh_errors,
+                "refreshed_at": self.refreshed_at,
+                "bookings": self.bookings,
+            }
+
+    async def refresh_forever(self, calendar_service, interval=AVAILABILITY_REFRESH_S, horizon_days=AVAILABILITY_HORIZON_DAYS):
+        """Refreshes from `calendar_service.query_busy` every `interval` seconds; run as a background task."""
+        self.now = calendar_service.now
+        while True:
+            queried_at = time.monotonic()
+            window_start = self.now().replace(second=0, microsecond=0)
+            window_end = window_start + timedelta(days=horizon_days)
+            if breakers["calendar"].is_open:
+                # Keep serving the last window rather than adding load to a failing calendar
+                await asyncio.sleep(interval)
+                continue
+            try:
+                busy = await calendar_stage.run(calendar_service.query_busy, window_start, window_end)
+            except Exception as e:
+                busy = None
+                logger.error(f"Free/busy refresh failed: {e}")
+            if busy is None:
+                self.refresh_errors += 1
+                breakers["calendar"].failure()
+            else:
+                breakers["calendar"].success()
+                self.replace(busy, window_start, window_end, queried_at)
+                logger.debug(f"Availability index refreshed: {len(busy)} busy intervals")
+            await asyncio.sleep(interval)
+
+
+def _spoken(moment: datetime) -> str:
+    return moment.strftime("%A %B %d at %I:%M %p").replace(" 0", " ")
+
+
+def describe_availability(index: AvailabilityIndex, day=None, clock=None, now: datetime = None, count=3) -> str:
+    """
+    One-line availability answer for the agent: whether the requested time (`day` as
+    YYYY-MM-DD, `clock` as HH:MM) is open, and the next open slots.
+    """
+    if not index.loaded:
+        return "The calendar is not available right now; do not promise a specific time is free."
+    now = now or index.now()
+    requested = None
+    if day:
+        try:
+            requested = datetime.strptime(f"{day} {clock or '00:00'}", "%Y-%m-%d %H:%M")
+        except ValueError:
+            requested = None
+    answer = ""
+    search_from = now
+    if requested is not None and clock:
+        free = index.is_free(requested)
+        if requested < now:
+            answer = f"{_spoken(requested)} is in the past. "
+        elif not index.in_business_hours(requested):
+            answer = f"{_spoken(requested)} is outside viewing hours. "
+        elif free:
+            return f"{_spoken(requested)} is available."
+        elif free is False:
+            answer = f"{_spoken(requested)} is already taken. "
+        search_from = max(now, requested)
+    elif requested is not None:
+        search_from = max(now, requested)
+    slots = index.next_free_slots(search_from, count)
+    if not slots:
+        # The index only knows the refreshed window (AVAILABILITY_HORIZON_DAYS); say how far that is
+        until = index.covered_until
+        days = max(1, round((until - search_from) / timedelta(days=1)))
+        return answer + f"There are no open slots in the next {days} day{'s' if days != 1 else ''}, up to {until.strftime('%A %B %d').replace(' 0', ' ')}."
+    return answer + "Next open slots: " + "; ".join(_spoken(slot) for slot in slots) + "."
+
+
+availability = AvailabilityIndex()
@@ -0,0 +1,235 @@
+import os
+import json
+import time
+import random
+import asyncio
+import hashlib
+import logging
+import sqlite3
+import threading
+from services.Metrics import PROVIDER_ERRORS
+from services.Executor import calendar_stage, storage_stage
+from services.Resilience import breakers
+
+logger = logging.getLogger(__name__)
+
+BOOKING_DB_PATH = os.getenv("BOOKING_DB_PATH", "bookings.db")
+BOOKING_MAX_ATTEMPTS = int(os.getenv("BOOKING_MAX_ATTEMPTS", "8"))
+# Retry delay doubles from this, capped at BOOKING_RETRY_MAX_S, with jitter
+BOOKING_RETRY_BASE_S = float(os.getenv("BOOKING_RETRY_BASE_S", "5"))
+BOOKING_RETRY_MAX_S = float(os.getenv("BOOKING_RETRY_MAX_S", "600"))
+# A claimed booking is hidden from other workers this long; if its worker dies it becomes due again
+BOOKING_CLAIM_S = float(os.getenv("BOOKING_CLAIM_S", "120"))
+
+PENDING = "pending"
+BOOKED = "booked"
+FAILED = "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS bookings (
+    id TEXT PRIMARY KEY,
+    summary TEXT NOT NULL,
+    description TEXT NOT NULL,
+    start_time TEXT NOT NULL,
+    end_time TEXT NOT NULL,
+    attendees TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    calendar_link TEXT,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS bookings_due ON bookings (status, next_attempt_at);
+"""
+
+
+def booking_key(start_time: str, attendees) -> str:
+    """
+    Idempotency key for a booking: the same attendees at the same start time are one booking.
+    Hex digits are valid Google Calendar event ids, so the key doubles as the event id and a
+    retried insert after a lost response is rejected as a duplicate instead of booking twice.
+    """
+    who = ",".join(sorted(email.strip().lower() for email in attendees if email))
+    return hashlib.sha1(f"{who}|{start_time}".encode("utf-8")).hexdigest()
+
+
+class BookingQueue:
+    """
+    Durable write-behind queue for calendar bookings.
+    `submit` records the booking in SQLite and returns at once, so the caller can be told it is
+    booked without waiting on the calendar API (it, `lookup` and `stats` block on the database,
+    so call them on the storage stage); `run_forever` writes pending bookings to the
+    calendar in the background, retrying with backoff until BOOKING_MAX_ATTEMPTS. Pending rows
+    survive a restart and are picked up again. `lookup` returns the final status and calendar_link.
+    Several worker processes can share the database: each claims due rows before writing them.
+    """
+
+    def __init__(self, path=None, max_attempts=None, retry_base=None, retry_max=None):
+        self.path = path or BOOKING_DB_PATH
+        self.max_attempts = max_attempts if max_attempts is not None else BOOKING_MAX_ATTEMPTS
+        self.retry_base = retry_base if retry_base is not None else BOOKING_RETRY_BASE_S
+        self.retry_max = retry_max if retry_max is not None else BOOKING_RETRY_MAX_S
+        self._db = None
+        self._lock = threading.Lock()
+        self._wakeup = None
+        self._loop = None
+        self.submitted = 0
+        self.duplicates = 0
+        self.written = 0
+        self.retries = 0
+        self.failed = 0
+
+    def _connection(self):
+        # Opened lazily so importing the handler does not create the database file
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._db.row_factory = sqlite3.Row
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.executescript(_SCHEMA)
+        return self._db
+
+    def submit(self, summary, description, start_time, end_time, attendees) -> str:
+        """
+        Queues a booking and returns its id. Submitting the same booking again returns the
+        existing id without queueing a second write, unless the earlier one gave up.
+        """
+        key = booking_key(start_time, attendees)
+        now = time.time()
+        with self._lock:
+            cursor = self._connection().execute(
+                "INSERT INTO bookings (id, summary, description, start_time, end_time, attendees,"
+                " status, next_attempt_at, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT (id) DO UPDATE SET status = excluded.status, attempts = 0,"
+                " next_attempt_at = excluded.next_attempt_at, updated_at = excluded.updated_at"
+                " WHERE bookings.status = ?",
+                (key, summary, description, start_time, end_time, json.dumps(list(attendees)), PENDING, now, now, now, FAILED),
+            )
+        if cursor.rowcount:
+            self.submitted += 1
+            logger.info(f"Booking {key} queued for {start_time}")
+        else:
+            self.duplicates += 1
+            logger.info(f"Booking {key} was already queued")
+        if self._wakeup is not None:
+            # Submitted from a worker thread (the agent's booking tool, the storage stage)
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+        return key
+
+    def lookup(self, key):
+        """The booking's status ("pending", "booked" or "failed"), calendar_link and attempts, or None."""
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT id, status, calendar_link, attempts, last_error, start_time, updated_at FROM bookings WHERE id = ?",
+                (key,),
+            ).fetchone()
+        return dict(row) if row is not None else None
+
+    def _due(self, limit=16):
+        """Claims up to `limit` due bookings for this worker by moving their next attempt past the claim window."""
+        now = time.time()
+        with self._lock:
+            db = self._connection()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                rows = db.execute(
+                    "SELECT * FROM bookings WHERE status = ? AND next_attempt_at <= ? ORDER BY next_attempt_at LIMIT ?",
+                    (PENDING, now, limit),
+                ).fetchall()
+                db.executemany(
+                    "UPDATE bookings SET next_attempt_at = ? WHERE id = ?",
+                    [(now + BOOKING_CLAIM_S, row["id"]) for row in rows],
+                )
+                db.execute("COMMIT")
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+            return rows
+
+    def _next_due_in(self):
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT MIN(next_attempt_at) FROM bookings WHERE status = ?", (PENDING,)
+            ).fetchone()
+        return None if row[0] is None else max(0.0, row[0] - time.time())
+
+    def _record(self, key, status, attempts, next_attempt_at=None, calendar_link=None, error=None):
+        with self._lock:
+            self._connection().execute(
+                "UPDATE bookings SET status = ?, attempts = ?, next_attempt_at = COALESCE(?, next_attempt_at),"
+                " calendar_link = ?, last_error = ?, updated_at = ? WHERE id = ?",
+                (status, attempts, next_attempt_at, calendar_link, error, time.time(), key),
+            )
+
+    def _write(self, calendar_service, row):
+        """Blocking: one insert attempt. Returns the calendar link, or None on failure."""
+        return calendar_service.create_appointment(
+            row["summary"], row["description"], row["start_time"], row["end_time"],
+            json.loads(row["attendees"]), event_id=row["id"],
+        )
+
+    async def _attempt(self, calendar_service, row):
+        attempts = row["attempts"] + 1
+        try:
+            link = await calendar_stage.run(self._write, calendar_service, row)
+            error = None if link else "calendar insert failed"
+        except Exception as e:
+            link, error = None, str(e)
+        if link:
+            breakers["calendar"].success()
+            self.written += 1
+            await storage_stage.run(self._record, row["id"], BOOKED, attempts, calendar_link=link)
+            logger.info(f"Booking {row['id']} written to the calendar after {attempts} attempt(s): {link}")
+            return
+        PROVIDER_ERRORS.inc(provider="calendar")
+        breakers["calendar"].failure()
+        if attempts >= self.max_attempts:
+            self.failed += 1
+            await storage_stage.run(self._record, row["id"], FAILED, attempts, error=error)
+            logger.error(f"Booking {row['id']} failed after {attempts} attempts: {error}")
+            return
+        self.retries += 1
+        delay = min(self.retry_max, self.retry_base * 2 ** (attempts - 1)) * random.uniform(0.8, 1.2)
+        await storage_stage.run(self._record, row["id"], PENDING, attempts, next_attempt_at=time.time() + delay, error=error)
+        logger.warning(f"Booking {row['id']} attempt {attempts} failed ({error}); retrying in {delay:.0f} s")
+
+    async def run_forever(self, calendar_service, idle_s=60.0):
+        """Writes due bookings to `calendar_service`; run as a background task."""
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        while True:
+            self._wakeup.clear()
+            if breakers["calendar"].is_open:
+                # Bookings stay pending (the caller has already been told) until the calendar recovers
+                await asyncio.sleep(breakers["calendar"].reset_s)
+                continue
+            for row in await storage_stage.run(self._due):
+                if breakers["calendar"].is_open:
+                    break # The rest of the claimed batch becomes due again when its claim lapses
+                await self._attempt(calendar_service, row)
+            due_in = await storage_stage.run(self._next_due_in)
+            if due_in == 0.0:
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), min(idle_s, due_in) if due_in is not None else idle_s)
+            except asyncio.TimeoutError:
+                pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            counts = dict(self._connection().execute("SELECT status, COUNT(*) FROM bookings GROUP BY status").fetchall())
+        return {
+            "pending": counts.get(PENDING, 0),
+            "booked": counts.get(BOOKED, 0),
+            "failed": counts.get(FAILED, 0),
+            "submitted": self.submitted,
+            "duplicates": self.duplicates,
+            "written": self.written,
+            "retries": self.retries,
+            "write_failures": self.failed,
+        }
+
+
+booking_queue = BookingQueue()
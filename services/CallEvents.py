@@ -0,0 +1,122 @@
+import os
+import time
+import logging
+from collections import deque, Counter, OrderedDict
+
+logger = logging.getLogger(__name__)
+
+CALL_EVENTS_RING_SIZE = int(os.getenv("CALL_EVENTS_RING_SIZE", "10000"))
+# Calls with no final status after this long are dropped from the live counts
+CALL_EVENTS_STALE_S = float(os.getenv("CALL_EVENTS_STALE_S", "7200"))
+
+# Progress order of Twilio call statuses; an event older than the call's current status is ignored
+_RANK = {"queued": 0, "initiated": 1, "ringing": 2, "in-progress": 3, "answered": 3,
+         "completed": 4, "busy": 4, "no-answer": 4, "failed": 4, "canceled": 4}
+LIVE_STATUSES = ("queued", "initiated", "ringing", "in-progress")
+FINAL_STATUSES = ("completed", "busy", "no-answer", "failed", "canceled")
+
+
+class CallEventAggregator:
+    """
+    Live view of call progress from Twilio status callbacks. Each event is O(1): it is appended
+    to a bounded ring of recent events, moves its call between live states, and updates running
+    totals, so `snapshot` (calls ringing / in progress, outcomes, answer rate, average duration)
+    costs the same no matter how many events have arrived. Runs on the event loop; nothing here
+    blocks, and persistence is left to the caller's batched writer.
+    """
+
+    def __init__(self, ring_size=None, stale_s=None):
+        self.events = deque(maxlen=ring_size or CALL_EVENTS_RING_SIZE)
+        self.stale_s = stale_s if stale_s is not None else CALL_EVENTS_STALE_S
+        self._calls = {}  # Live call SID -> (status, last event time); insertion order is age order
+        self._done = OrderedDict()  # Recently finished call SIDs, so a redelivered final event is not counted twice
+        self.live = Counter()
+        self.finished = Counter()
+        self.answered = 0
+        self.duration_total = 0
+        self.duration_count = 0
+        self.received = 0
+        self.ignored = 0
+
+    def ingest(self, params, received_at=None):
+        """
+        Applies one status callback (Twilio's form fields). Returns the event row stored in the
+        ring, or None for an event without a call SID or status.
+        """
+        sid = params.get("CallSid")
+        status = params.get("CallStatus")
+        if not sid or status not in _RANK:
+            self.ignored += 1
+            return None
+        if status == "answered":
+            status = "in-progress"
+        received_at = received_at or time.time()
+        duration = params.get("CallDuration")
+        duration = int(duration) if duration and str(duration).isdigit() else None
+        sequence = params.get("SequenceNumber")
+        event = (
+            sid, status, received_at, int(sequence) if sequence and str(sequence).isdigit() else None,
+            duration, params.get("Direction"), params.get("To"), params.get("From"),
+        )
+        self.received += 1
+        self.events.append(event)
+
+        current = self._calls.get(sid)
+        if sid in self._done or (current is not None and _RANK[current[0]] >= _RANK[status]):
+            # Out of order or repeated (e.g. "ringing" after "in-progress"); totals already reflect it
+            return event
+        if current is not None:
+            self.live[current[0]] -= 1
+        if status in FINAL_STATUSES:
+            self._calls.pop(sid, None)
+            self._done[sid] = None
+            if len(self._done) > self.events.maxlen:
+                self._done.popitem(last=False)
+            self.finished[status] += 1
+            # An answered call ends "completed" with a duration; unanswered ones end busy/no-answer/failed
+            if status == "completed" and (duration or (current is not None and current[0] == "in-progress")):
+                self.answered += 1
+            if duration is not None and status == "completed":
+                self.duration_total += duration
+                self.duration_count += 1
+        else:
+            self._calls.pop(sid, None)
+            self._calls[sid] = (status, received_at)
+            self.live[status] += 1
+        self._expire(received_at)
+        return event
+
+    def _expire(self, now):
+        # Oldest first, and at most a couple per event, so expiry stays O(1) amortized
+        for _ in range(2):
+            if not self._calls:
+                return
+            sid, (status, seen) = next(iter(self._calls.items()))
+            if now - seen < self.stale_s:
+                return
+            del self._calls[sid]
+            self.live[status] -= 1
+            self.finished["stale"] += 1
+
+    def snapshot(self) -> dict:
+        # Calls that went stale have no known outcome, so they do not count towards the answer rate
+        finished = sum(self.finished.values()) - self.finished["stale"]
+        return {
+            "live": {status: self.live[status] for status in LIVE_STATUSES},
+            "finished": dict(self.finished),
+            "answer_rate": round(self.answered / finished, 3) if finished else 0.0,
+            "avg_duration_s": round(self.duration_total / self.duration_count, 1) if self.duration_count else 0.0,
+            "events_received": self.received,
+            "events_ignored": self.ignored,
+        }
+
+    def recent(self, limit=100):
+        """The most recent events, newest first."""
+        limit = max(0, min(limit, len(self.events)))
+        return [
+            dict(zip(("call_sid", "status", "received_at", "sequence", "duration", "direction", "to", "from"), event))
+            for event in (self.events[-1 - i] for i in range(limit))
+        ]
+
+
+call_events = CallEventAggregator()
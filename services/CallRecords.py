@@ -0,0 +1,326 @@
+import os
+import re
+import json
+import time
+import uuid
+import asyncio
+import logging
+import sqlite3
+import argparse
+import threading
+from services.Executor import storage_stage
+
+logger = logging.getLogger(__name__)
+
+CALL_RECORDS_DB_PATH = os.getenv("CALL_RECORDS_DB_PATH", "call_records.db")
+# Records are written in one transaction per batch, at least this often
+CALL_RECORDS_FLUSH_S = float(os.getenv("CALL_RECORDS_FLUSH_S", "1.0"))
+CALL_RECORDS_BATCH = int(os.getenv("CALL_RECORDS_BATCH", "64"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS calls (
+    id TEXT PRIMARY KEY,
+    call_sid TEXT,
+    stream_sid TEXT,
+    started_at REAL,
+    ended_at REAL NOT NULL,
+    date TEXT NOT NULL,
+    name TEXT,
+    email TEXT,
+    phone TEXT,
+    address TEXT,
+    appointment_date TEXT,
+    appointment_time TEXT,
+    booking_id TEXT,
+    booked INTEGER NOT NULL DEFAULT 0,
+    lead_info TEXT NOT NULL,
+    transcript TEXT NOT NULL,
+    source TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS calls_call_sid ON calls (call_sid);
+CREATE INDEX IF NOT EXISTS calls_phone ON calls (phone);
+CREATE INDEX IF NOT EXISTS calls_email ON calls (email);
+CREATE INDEX IF NOT EXISTS calls_date ON calls (date, ended_at);
+CREATE TABLE IF NOT EXISTS call_events (
+    call_sid TEXT NOT NULL,
+    status TEXT NOT NULL,
+    received_at REAL NOT NULL,
+    sequence INTEGER,
+    duration INTEGER,
+    direction TEXT,
+    to_number TEXT,
+    from_number TEXT
+);
+CREATE INDEX IF NOT EXISTS call_events_call_sid ON call_events (call_sid, received_at);
+"""
+
+_COLUMNS = (
+    "id", "call_sid", "stream_sid", "started_at", "ended_at", "date", "name", "email", "phone", "address",
+    "appointment_date", "appointment_time", "booking_id", "booked", "lead_info", "transcript", "source",
+)
+# A call resumed on another connection is written again when it ends; the later record wins
+_INSERT = (
+    f"INSERT INTO calls ({', '.join(_COLUMNS)}) VALUES ({', '.join('?' * len(_COLUMNS))})"
+    f" ON CONFLICT (id) DO UPDATE SET {', '.join(f'{c} = excluded.{c}' for c in _COLUMNS[1:])}"
+    " WHERE excluded.ended_at > calls.ended_at"
+)
+_INSERT_EVENT = (
+    "INSERT INTO call_events (call_sid, status, received_at, sequence, duration, direction, to_number, from_number)"
+    " VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+)
+_NON_DIGIT = re.compile(r"\D")
+
+
+def normalize_phone(phone) -> str:
+    """Digits only, without a leading US country code, so "(555) 201-3344" and "+15552013344" match."""
+    digits = _NON_DIGIT.sub("", phone or "")
+    return digits[1:] if len(digits) == 11 and digits.startswith("1") else digits
+
+
+def normalize_email(email) -> str:
+    return (email or "").strip().lower()
+
+
+def call_record(transcript, lead_info, ended_at=None, started_at=None, call_sid=None, stream_sid=None,
+                booked=False, source="call", record_id=None) -> tuple:
+    """Builds the row for one call; lookup fields are taken from lead_info and normalized."""
+    ended_at = ended_at if ended_at is not None else time.time()
+    return (
+        record_id or call_sid or stream_sid or uuid.uuid4().hex,
+        call_sid,
+        stream_sid,
+        started_at,
+        ended_at,
+        time.strftime("%Y-%m-%d", time.localtime(started_at or ended_at)),
+        lead_info.get("name") or None,
+        normalize_email(lead_info.get("email")) or None,
+        normalize_phone(lead_info.get("phone")) or None,
+        lead_info.get("address") or None,
+        lead_info.get("date") or None,
+        lead_info.get("time") or None,
+        lead_info.get("booking_id") or None,
+        int(bool(booked)),
+        json.dumps(lead_info),
+        json.dumps(list(transcript)),
+        source,
+    )
+
+
+class CallRecordStore:
+    """
+    Indexed store for finished calls (transcript plus lead info), replacing the per-call
+    call_transcript_*.txt / lead_info_*.json files. `submit` only queues the record; a writer
+    task inserts queued records in batches, one transaction each, on the storage stage, so a
+    call's teardown never waits on disk. Records are keyed by call SID (falling back to the
+    stream SID) and indexed by call SID, phone, email and date for `find`. Twilio status
+    callback events are stored alongside in call_events, through the same writer.
+    """
+
+    def __init__(self, path=None, flush_interval=None, batch_size=None):
+        self.path = path or CALL_RECORDS_DB_PATH
+        self.flush_interval = flush_interval if flush_interval is not None else CALL_RECORDS_FLUSH_S
+        self.batch_size = batch_size if batch_size is not None else CALL_RECORDS_BATCH
+        self._db = None
+        self._lock = threading.Lock()
+        self._pending = []
+        self._events = []
+        self._wakeup = None
+        self._writer = None
+        self.submitted = 0
+        self.written = 0
+        self.events_submitted = 0
+        self.events_written = 0
+        self.batches = 0
+        self.write_errors = 0
+
+    def _connection(self):
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._db.row_factory = sqlite3.Row
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.executescript(_SCHEMA)
+        return self._db
+
+    def _insert(self, rows, events=()) -> int:
+        """Blocking: inserts call rows and status events in one transaction; returns how many calls were new or updated."""
+        with self._lock:
+            db = self._connection()
+            db.execute("BEGIN")
+            try:
+                before = db.total_changes
+                db.executemany(_INSERT, rows)
+                added = db.total_changes - before
+                db.executemany(_INSERT_EVENT, events)
+                db.execute("COMMIT")
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+            return added
+
+    def _queued(self):
+        if self._writer is None or self._writer.done():
+            self._wakeup = asyncio.Event()
+            self._writer = asyncio.ensure_future(self._write_forever())
+        if len(self._pending) + len(self._events) >= self.batch_size:
+            self._wakeup.set()
+
+    def submit(self, row):
+        """Queues a row from `call_record` for the writer task, starting it if needed."""
+        self._pending.append(row)
+        self.submitted += 1
+        self._queued()
+
+    def submit_event(self, event):
+        """Queues a status event row (see services.CallEvents) for the writer task."""
+        self._events.append(event)
+        self.events_submitted += 1
+        self._queued()
+
+    async def flush(self):
+        """Writes everything queued so far."""
+        while self._pending or self._events:
+            batch, self._pending = self._pending[:self.batch_size], self._pending[self.batch_size:]
+            # Events are small; they go in the same transaction, a few batches' worth at a time
+            events, self._events = self._events[:self.batch_size * 16], self._events[self.batch_size * 16:]
+            try:
+                await storage_stage.run(self._insert, batch, events)
+            except Exception as e:
+                # Keep the batch for the next flush rather than losing the calls
+                self._pending[:0] = batch
+                self._events[:0] = events
+                self.write_errors += 1
+                logger.error(f"Failed to write {len(batch)} call records and {len(events)} status events: {e}")
+                return
+            self.written += len(batch)
+            self.events_written += len(events)
+            self.batches += 1
+            logger.debug(f"Wrote {len(batch)} call records and {len(events)} status events")
+
+    async def _write_forever(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.cancel()
+            self._writer = None
+        await self.flush()
+
+    def _query(self, sql, args):
+        with self._lock:
+            return [self._row(row) for row in self._connection().execute(sql, args).fetchall()]
+
+    @staticmethod
+    def _row(row) -> dict:
+        record = dict(row)
+        record["booked"] = bool(record["booked"])
+        record["lead_info"] = json.loads(record["lead_info"])
+        record["transcript"] = json.loads(record["transcript"])
+        return record
+
+    def find(self, call_sid=None, phone=None, email=None, date=None, since=None, until=None, limit=50, transcripts=True):
+        """
+        Blocking: calls matching every given filter, newest first. `date` is YYYY-MM-DD (the day
+        the call started); `since`/`until` are the same form and bound it inclusively.
+        """
+        where, args = [], []
+        for column, value in (("call_sid", call_sid), ("phone", normalize_phone(phone)),
+                              ("email", normalize_email(email)), ("date", date)):
+            if value:
+                where.append(f"{column} = ?")
+                args.append(value)
+        if since:
+            where.append("date >= ?")
+            args.append(since)
+        if until:
+            where.append("date <= ?")
+            args.append(until)
+        columns = "*" if transcripts else ", ".join(column for column in _COLUMNS if column != "transcript") + ", '[]' AS transcript"
+        sql = f"SELECT {columns} FROM calls"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY ended_at DESC LIMIT ?"
+        args.append(int(limit))
+        return self._query(sql, args)
+
+    def get(self, record_id):
+        """Blocking: one call by record id (its call SID for live calls), or None."""
+        rows = self._query("SELECT * FROM calls WHERE id = ?", (record_id,))
+        return rows[0] if rows else None
+
+    def events(self, call_sid):
+        """Blocking: a call's status events in the order they were received."""
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT * FROM call_events WHERE call_sid = ? ORDER BY received_at", (call_sid,)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def stats(self) -> dict:
+        return {
+            "queued": len(self._pending),
+            "submitted": self.submitted,
+            "written": self.written,
+            "events_queued": len(self._events),
+            "events_written": self.events_written,
+            "batches": self.batches,
+            "write_errors": self.write_errors,
+        }
+
+    def import_files(self, directory=".") -> int:
+        """
+        Blocking: imports call_transcript_<ts>.txt / lead_info_<ts>.json pairs written before
+        this store existed. Files sharing a timestamp are assumed to be one call. Safe to rerun.
+        Returns the number of calls added.
+        """
+        found = {}
+        pattern = re.compile(r"^(call_transcript|lead_info)_(\d+)\.(txt|json)$")
+        for filename in os.listdir(directory):
+            match = pattern.match(filename)
+            if match:
+                found.setdefault(int(match.group(2)), {})[match.group(1)] = os.path.join(directory, filename)
+        rows = []
+        for ts, files in sorted(found.items()):
+            transcript, lead_info = [], {}
+            try:
+                if "call_transcript" in files:
+                    with open(files["call_transcript"], encoding="utf-8") as f:
+                        transcript = [line.rstrip("\n") for line in f]
+                if "lead_info" in files:
+                    with open(files["lead_info"], encoding="utf-8") as f:
+                        lead_info = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Skipping call files for {ts}: {e}")
+                continue
+            booked = bool(lead_info.get("calendar_link") or lead_info.get("booking_id"))
+            # The old files carry no call SID; the timestamp is when the call ended
+            rows.append(call_record(transcript, lead_info, ended_at=ts, booked=booked, source="import", record_id=f"import-{ts}"))
+        added = self._insert(rows) if rows else 0
+        logger.info(f"Imported {added} of {len(rows)} calls from {directory}")
+        return added
+
+
+call_records = CallRecordStore()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    parser = argparse.ArgumentParser(description="Import or query stored call records.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    importer = commands.add_parser("import", help="Import call_transcript_*.txt / lead_info_*.json files")
+    importer.add_argument("directory", nargs="?", default=".")
+    query = commands.add_parser("find", help="Print matching calls as JSON")
+    for option in ("call-sid", "phone", "email", "date", "since", "until"):
+        query.add_argument(f"--{option}")
+    query.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+    if args.command == "import":
+        call_records.import_files(args.directory)
+    else:
+        print(json.dumps(call_records.find(args.call_sid, args.phone, args.email, args.date, args.since, args.until, args.limit), indent=2))
@@ -0,0 +1,55 @@
+import os
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class StageExecutor:
+    """
+    Runs blocking pipeline work (provider SDK calls, transcoding) off the asyncio event loop.
+    Each stage owns a bounded thread pool; callers beyond the limit wait on a semaphore
+    in the event loop, so waiting stays cancellable and never blocks other calls' media.
+    """
+
+    def __init__(self, name, max_concurrency):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self._pool = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix=f"{name}-stage")
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.in_flight = 0
+        self.waiting = 0
+
+    async def run(self, func, *args, **kwargs):
+        """Runs func(*args, **kwargs) in this stage's pool and returns its result."""
+        loop = asyncio.get_running_loop()
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        try:
+            return await loop.run_in_executor(self._pool, functools.partial(func, *args, **kwargs))
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _limit(env_name, default):
+    return int(os.getenv(env_name, str(default)))
+
+
+# Per-stage concurrency limits for one server process
+stt_stage = StageExecutor("stt", _limit("STT_MAX_CONCURRENCY", 16))
+agent_stage = StageExecutor("agent", _limit("AGENT_MAX_CONCURRENCY", 16))
+tts_stage = StageExecutor("tts", _limit("TTS_MAX_CONCURRENCY", 16))
+calendar_stage = StageExecutor("calendar", _limit("CALENDAR_MAX_CONCURRENCY", 4))
+audio_stage = StageExecutor("audio", _limit("AUDIO_MAX_CONCURRENCY", os.cpu_count() or 4))
+# Local database writes; one thread keeps SQLite writers from contending
+storage_stage = StageExecutor("storage", _limit("STORAGE_MAX_CONCURRENCY", 1))
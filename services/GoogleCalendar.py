@@ -1,12 +1,18 @@
 import os
 from google.oauth2 import service_account
 from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
 import datetime
 import logging
 import json
+from zoneinfo import ZoneInfo
+from services.Availability import availability
 
 logger = logging.getLogger(__name__)
 
+# Appointments are booked, and availability reported, in this time zone
+CALENDAR_TIMEZONE = os.getenv("GOOGLE_CALENDAR_TIMEZONE", "America/New_York")
+
 class GoogleCalendarService:
     def __init__(self):
         SCOPES = ['https://www.googleapis.com/auth/calendar']
@@ -32,10 +38,12 @@ class GoogleCalendarService:
             self.service = None
 
 
-    def create_appointment(self, summary, description, start_time, end_time, attendees):
+    def create_appointment(self, summary, description, start_time, end_time, attendees, event_id=None):
         """
         Creates an event on the Google Calendar.
         start_time and end_time should be in RFC3339 format (e.g., '2025-07-02T10:00:00-05:00' or '2025-07-02T10:00:00').
+        With `event_id` the insert is idempotent: if that event already exists (an earlier attempt
+        succeeded but its response was lost), its link is returned instead of booking twice.
         """
         if not self.service:
             logger.error("Google Calendar service is not initialized.")
@@ -44,8 +52,8 @@ class GoogleCalendarService:
         event = {
             'summary': summary,
             'description': description,
-            'start': {'dateTime': start_time, 'timeZone': 'America/New_York'}, # Use your desired timezone
-            'end': {'dateTime': end_time, 'timeZone': 'America/New_York'},     # Use your desired timezone
+            'start': {'dateTime': start_time, 'timeZone': CALENDAR_TIMEZONE},
+            'end': {'dateTime': end_time, 'timeZone': CALENDAR_TIMEZONE},
             'attendees': [{'email': email} for email in attendees if email],
             'reminders': {
                 'useDefault': False,
@@ -55,16 +63,74 @@ class GoogleCalendarService:
                 ],
             },
         }
+        if event_id:
+            event['id'] = event_id
 
         logger.info(f"Attempting to create calendar event: {event}")
 
         try:
             event = self.service.events().insert(calendarId=self.calendar_id, body=event).execute()
             logger.info(f"Event created: {event.get('htmlLink')}")
-            return event.get('htmlLink')
+        except HttpError as e:
+            if not event_id or e.resp.status != 409:
+                logger.error(f"Error creating calendar event: {e}")
+                return None
+            try:
+                event = self.service.events().get(calendarId=self.calendar_id, eventId=event_id).execute()
+                logger.info(f"Event {event_id} already exists: {event.get('htmlLink')}")
+                return event.get('htmlLink')
+            except Exception as e:
+                logger.error(f"Error fetching existing calendar event {event_id}: {e}")
+                return None
         except Exception as e:
             logger.error(f"Error creating calendar event: {e}")
             return None
+        if event_id:
+            # Queued bookings were marked busy when they were accepted
+            return event.get('htmlLink')
+        try:
+            # Visible to the availability index now rather than at its next refresh
+            availability.add_busy(self._local(start_time), self._local(end_time))
+        except ValueError:
+            logger.warning(f"Could not add booking to the availability index: {start_time} - {end_time}")
+        return event.get('htmlLink')
+
+    def now(self):
+        """Current time in the calendar's time zone, as a naive datetime."""
+        return datetime.datetime.now(ZoneInfo(CALENDAR_TIMEZONE)).replace(tzinfo=None)
+
+    @staticmethod
+    def _local(value):
+        """Parses an RFC3339 string into a naive datetime in the calendar's time zone."""
+        moment = datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+        if moment.tzinfo is not None:
+            moment = moment.astimezone(ZoneInfo(CALENDAR_TIMEZONE)).replace(tzinfo=None)
+        return moment
+
+    def query_busy(self, time_min, time_max):
+        """
+        Busy intervals between two naive local datetimes, as (start, end) naive local datetimes,
+        from the free/busy API. Returns None if the query fails.
+        """
+        if not self.service:
+            return None
+        zone = ZoneInfo(CALENDAR_TIMEZONE)
+        body = {
+            'timeMin': time_min.replace(tzinfo=zone).isoformat(),
+            'timeMax': time_max.replace(tzinfo=zone).isoformat(),
+            'timeZone': CALENDAR_TIMEZONE,
+            'items': [{'id': self.calendar_id}],
+        }
+        try:
+            result = self.service.freebusy().query(body=body).execute()
+        except Exception as e:
+            logger.error(f"Error querying free/busy: {e}")
+            return None
+        calendar = result.get('calendars', {}).get(self.calendar_id, {})
+        if calendar.get('errors'):
+            logger.error(f"Free/busy query returned errors: {calendar['errors']}")
+            return None
+        return [(self._local(period['start']), self._local(period['end'])) for period in calendar.get('busy', [])]
 
     # This method was called in langchain_agent.py but not defined.
     # You need to implement logic here to parse the 'info' string/dict
@@ -0,0 +1,251 @@
+import time
+import bisect
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Latency buckets in seconds, from per-frame work up to slow provider calls
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 10.0, 30.0)
+CALL_BUCKETS = (10, 30, 60, 120, 180, 300, 600, 1200, 1800)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)] + list(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labels):
+            raise ValueError(f"{self.name} expects labels {self.labels}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def render(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}" for key, value in items]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class CallbackGauge(_Metric):
+    """Gauge read at scrape time; `func` returns a number, or a dict of label value -> number."""
+    kind = "gauge"
+
+    def __init__(self, name, help_text, func, label=None):
+        super().__init__(name, help_text, (label,) if label else ())
+        self.func = func
+
+    def render(self):
+        try:
+            value = self.func()
+        except Exception as e:
+            logger.warning(f"Metric {self.name} could not be read: {e}")
+            return []
+        if isinstance(value, dict):
+            lines = [f"{self.name}{_format_labels(self.labels, (key,))} {_format_value(v)}" for key, v in sorted(value.items())]
+        else:
+            lines = [f"{self.name} {_format_value(value)}"]
+        return self.header() + lines
+
+
+class CallbackCounter(CallbackGauge):
+    """Counter read at scrape time from a running total kept elsewhere (e.g. a cache's hit count)."""
+    kind = "counter"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][bisect.bisect_left(self.buckets, value)] += 1
+            state[1] += value
+            state[2] += 1
+
+    def render(self):
+        with self._lock:
+            items = sorted((key, ([*state[0]], state[1], state[2])) for key, state in self._values.items())
+        lines = self.header()
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(float(bound)) if bound != float("inf") else "+Inf"}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, (le,))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {count}")
+        return lines
+
+
+class Registry:
+    """Process-wide metric registry rendered in the Prometheus text exposition format."""
+
+    def __init__(self):
+        self._metrics = []
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text, labels=()):
+        return self._add(Counter(name, help_text, labels))
+
+    def gauge(self, name, help_text, labels=()):
+        return self._add(Gauge(name, help_text, labels))
+
+    def callback_gauge(self, name, help_text, func, label=None):
+        return self._add(CallbackGauge(name, help_text, func, label))
+
+    def callback_counter(self, name, help_text, func, label=None):
+        return self._add(CallbackCounter(name, help_text, func, label))
+
+    def histogram(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(name, help_text, labels, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+ACTIVE_CALLS = registry.gauge("voice_active_calls", "Media streams currently connected")
+CALLS = registry.counter("voice_calls_total", "Media streams handled")
+CALL_SECONDS = registry.histogram("voice_call_duration_seconds", "Media stream duration", buckets=CALL_BUCKETS)
+TURNS = registry.counter("voice_turns_total", "Caller utterances processed")
+FRAMES_IN = registry.counter("voice_media_frames_in_total", "Inbound media messages received from Twilio")
+FRAMES_OUT = registry.counter("voice_media_frames_out_total", "Outbound 20 ms media frames sent to Twilio")
+BARGE_INS = registry.counter("voice_barge_ins_total", "Agent playback interrupted by caller speech")
+PACER_UNDERRUNS = registry.counter("voice_pacer_underruns_total", "Outbound frames sent after they were due")
+PROVIDER_ERRORS = registry.counter("voice_provider_errors_total", "Failed provider calls", ("provider",))
+PROVIDER_RETRIES = registry.counter("voice_provider_retries_total", "Retried provider calls", ("provider",))
+STT_FINALS = registry.counter("voice_stt_finals_total", "Final transcripts by source: a reused partial or a new transcription", ("source",))
+SPECULATIONS = registry.counter("voice_agent_speculations_total", "Speculative agent turns by outcome", ("outcome",))
+SPECULATION_SAVED_SECONDS = registry.histogram("voice_agent_speculation_saved_seconds", "Agent time already spent when a speculative turn was kept")
+STAGE_SECONDS = registry.histogram("voice_stage_seconds", "Time spent per pipeline stage", ("stage",))
+TURN_SECONDS = registry.histogram("voice_turn_response_seconds", "End of caller speech to first reply frame sent")
+
+_current_turn = contextvars.ContextVar("current_turn", default=None)
+
+
+class TurnSpans:
+    """
+    Stage timings for one caller turn, from end of speech to the first reply frame.
+    While a turn is active (see `activate`), `observe_stage` and `span` in the same asyncio task
+    and the tasks it starts also add to it, so helpers need no extra parameters.
+    """
+
+    def __init__(self, call_id, number, speech_ended_at=None):
+        self.call_id = call_id
+        self.number = number
+        self.speech_ended_at = speech_ended_at if speech_ended_at is not None else time.monotonic()
+        self.stages = {}
+
+    def activate(self):
+        _current_turn.set(self)
+        return self
+
+    def add(self, stage, seconds):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def finish(self, first_frame_at=None):
+        """Records the turn's response time and logs its breakdown."""
+        TURNS.inc()
+        response = None
+        if first_frame_at is not None:
+            response = max(0.0, first_frame_at - self.speech_ended_at)
+            TURN_SECONDS.observe(response)
+        breakdown = " ".join(f"{stage}={seconds * 1000:.0f}ms" for stage, seconds in self.stages.items())
+        total = f"{response * 1000:.0f} ms" if response is not None else "no audio"
+        logger.info(f"Turn {self.number} ({self.call_id}): first frame after {total}; {breakdown}")
+        if _current_turn.get() is self:
+            _current_turn.set(None)
+        return response
+
+
+def current_turn():
+    return _current_turn.get()
+
+
+def observe_stage(stage, seconds, turn=None):
+    """Records a stage duration in the histogram and in the active (or given) turn."""
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    turn = turn or _current_turn.get()
+    if turn is not None:
+        turn.add(stage, seconds)
+
+
+@contextmanager
+def span(stage, turn=None):
+    """Times the enclosed block as `stage`."""
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.monotonic() - started, turn)
+
+
+def count_retry(provider):
+    """Returns a tenacity `before_sleep` hook that counts retries for `provider`."""
+    def before_sleep(retry_state):
+        PROVIDER_RETRIES.inc(provider=provider)
+        logger.warning(f"Retrying {provider} call (attempt {retry_state.attempt_number}): {retry_state.outcome.exception()}")
+    return before_sleep
@@ -0,0 +1,122 @@
+import os
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from agent.send_audio_to_twilio import convert_audio_to_ulaw
+
+logger = logging.getLogger(__name__)
+
+
+class PromptCache:
+    """
+    Content-addressed cache of pre-rendered prompts as ready-to-stream 8kHz μ-law audio.
+    Entries are keyed by (text, voice, model) and kept in an in-memory LRU bounded by
+    total bytes, backed by a persistent on-disk tier that survives restarts. The disk tier
+    has no eviction, so only fixed prompts go there; dynamic text (e.g. cached agent replies)
+    is rendered with persist=False and lives in the LRU only.
+    """
+
+    def __init__(self, tts, cache_dir=None, max_bytes=None):
+        self.tts = tts
+        self.cache_dir = cache_dir or os.getenv("PROMPT_CACHE_DIR", "prompt_cache")
+        self.max_bytes = max_bytes if max_bytes is not None else int(os.getenv("PROMPT_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(text, voice, model):
+        return hashlib.sha256(f"{model}\0{voice}\0{text}".encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.ulaw")
+
+    def contains(self, text, voice="alloy", model=None) -> bool:
+        """True if the prompt is cached in memory or on disk; does not count as a hit or a miss."""
+        key = self.key(text, voice, model or self.tts.model)
+        with self._lock:
+            if key in self._entries:
+                return True
+        return os.path.exists(self._path(key))
+
+    def get(self, text, voice="alloy", model=None):
+        """Returns the cached μ-law audio for a prompt, or None. Never synthesizes."""
+        key = self.key(text, voice, model or self.tts.model)
+        with self._lock:
+            audio = self._entries.get(key)
+            if audio is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return audio
+
+        path = self._path(key)
+        if os.path.exists(path):
+            try:
+                with open(path, "rb") as f:
+                    audio = f.read()
+            except OSError as e:
+                logger.warning(f"Could not read cached prompt {path}: {e}")
+                audio = None
+            if audio:
+                self._store(key, audio)
+                with self._lock:
+                    self.disk_hits += 1
+                return audio
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, text, audio, voice="alloy", model=None, persist=True):
+        """Stores rendered μ-law audio in memory and, with `persist`, on disk."""
+        key = self.key(text, voice, model or self.tts.model)
+        self._store(key, audio)
+        if not persist:
+            return
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = f"{self._path(key)}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(audio)
+            os.replace(tmp_path, self._path(key))
+        except OSError as e:
+            logger.warning(f"Could not persist cached prompt: {e}")
+
+    def _store(self, key, audio):
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous)
+            self._entries[key] = audio
+            self._size += len(audio)
+            while self._size > self.max_bytes and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def render(self, text, voice="alloy", persist=True):
+        """
+        Returns the prompt's μ-law audio, synthesizing and transcoding it on a miss.
+        Blocking; run it in the TTS stage from async code.
+        """
+        audio = self.get(text, voice=voice)
+        if audio is not None:
+            return audio
+        speech = self.tts.speak(text, voice=voice)
+        if not speech:
+            return None
+        audio = convert_audio_to_ulaw(speech)
+        self.put(text, audio, voice=voice, persist=persist)
+        logger.info(f"Rendered prompt into cache ({len(audio)} bytes): '{text[:50]}'")
+        return audio
+
+    def warm(self, texts, voice="alloy"):
+        """Renders every prompt that is not cached yet. Blocking."""
+        for text in texts:
+            try:
+                self.render(text, voice=voice)
+            except Exception as e:
+                logger.error(f"Failed to warm prompt '{text[:50]}': {e}")
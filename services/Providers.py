@@ -0,0 +1,129 @@
+import time
+import asyncio
+import logging
+import threading
+from services.Executor import stt_stage, tts_stage, calendar_stage, agent_stage
+
+logger = logging.getLogger(__name__)
+
+
+class LazyService:
+    """
+    A provider client built on first use and then shared by every module that imports it.
+    Attribute access is forwarded to the client, so it stands in for the client itself;
+    `get` returns the real object where one is required (e.g. for type checks). Its own
+    fields are underscored so they never hide the client's. Building happens once even if
+    several threads ask at the same time.
+    """
+
+    def __init__(self, name, factory, stage=None, warm=None):
+        self._name = name
+        self._factory = factory
+        self._stage = stage  # Where `ServiceRegistry.warm` builds it
+        self._warm = warm  # Optional blocking hook run on the client after warm-up builds it
+        self._build_s = None
+        self._instance = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._instance is not None
+
+    def get(self):
+        if self._instance is None:
+            with self._lock:
+                if self._instance is None:
+                    started = time.perf_counter()
+                    instance = self._factory()
+                    self._build_s = time.perf_counter() - started
+                    logger.info(f"Built {self._name} client in {self._build_s * 1000:.0f} ms")
+                    self._instance = instance
+        return self._instance
+
+    def override(self, instance):
+        """Uses `instance` instead of building the client, e.g. a stub in a benchmark."""
+        with self._lock:
+            self._instance = instance
+            self._build_s = 0.0
+
+    def __getattr__(self, attr):
+        return getattr(self.get(), attr)
+
+
+class ServiceRegistry:
+    """
+    Provider clients shared by the handler and the agent. Nothing is built at import time;
+    `warm` builds every client in the background at startup, in its pipeline stage, and runs
+    their warm hooks (e.g. opening connection pools), so the first call finds them ready.
+    A call that arrives earlier builds what it needs on first use.
+    """
+
+    def __init__(self):
+        self._services = {}
+        self.warm_s = None
+
+    def register(self, name, factory, stage=None, warm=None) -> LazyService:
+        service = self._services[name] = LazyService(name, factory, stage, warm)
+        return service
+
+    def __getitem__(self, name) -> LazyService:
+        return self._services[name]
+
+    async def _warm_one(self, service):
+        async def run(func, *args):
+            if service._stage is not None:
+                return await service._stage.run(func, *args)
+            return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+        try:
+            instance = await run(service.get)
+            if service._warm is not None:
+                await run(service._warm, instance)
+        except Exception as e:
+            logger.warning(f"Warm-up of {service._name} failed: {e}")
+
+    async def warm(self, names=None):
+        """Builds and warms the named services (all by default) concurrently."""
+        started = time.perf_counter()
+        services = [self._services[name] for name in names] if names else list(self._services.values())
+        await asyncio.gather(*(self._warm_one(service) for service in services))
+        self.warm_s = time.perf_counter() - started
+        logger.info(f"Provider clients warmed in {self.warm_s * 1000:.0f} ms")
+
+    def stats(self) -> dict:
+        return {
+            "warm_ms": round(self.warm_s * 1000, 1) if self.warm_s is not None else None,
+            "services": {
+                name: {"loaded": service.loaded, "build_ms": round(service._build_s * 1000, 1) if service._build_s is not None else None}
+                for name, service in self._services.items()
+            },
+        }
+
+
+# The SDKs behind these (openai, googleapiclient, langchain) are imported by the factories, not here
+def _calendar():
+    from services.GoogleCalendar import GoogleCalendarService
+    return GoogleCalendarService()
+
+
+def _tts():
+    from services.TTS import TextToSpeech
+    return TextToSpeech()
+
+
+def _stt():
+    from services.StreamingSTT import create_stt_backend
+    return create_stt_backend()
+
+
+def _agent():
+    # The module is the engine: run_agent_turn, stream_agent, speculate_turn and the session calls
+    import langchain_agent
+    return langchain_agent
+
+
+providers = ServiceRegistry()
+calendar_service = providers.register("calendar", _calendar, calendar_stage)
+tts = providers.register("tts", _tts, tts_stage, warm=lambda client: client.warm())
+stt_backend = providers.register("stt", _stt, stt_stage)
+agent_service = providers.register("agent", _agent, agent_stage)
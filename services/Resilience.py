@@ -0,0 +1,162 @@
+import os
+import time
+import random
+import asyncio
+import logging
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# Calls handled at once per worker; 0 admits every call
+MAX_ACTIVE_CALLS = int(os.getenv("MAX_ACTIVE_CALLS", "0"))
+# Calls beyond the limit hear the hold prompt and wait this long for a slot, at most this many at a time
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", "10"))
+ADMISSION_WAIT_S = float(os.getenv("ADMISSION_WAIT_S", "20"))
+# A provider's breaker opens after this many consecutive failures and stays open this long
+CIRCUIT_FAILURES = int(os.getenv("CIRCUIT_FAILURES", "5"))
+CIRCUIT_RESET_S = float(os.getenv("CIRCUIT_RESET_S", "30"))
+# A retry is not started with less than this much of the latency budget left
+MIN_ATTEMPT_S = float(os.getenv("PROVIDER_MIN_ATTEMPT_S", "0.5"))
+
+
+class AdmissionGate:
+    """
+    Caps the calls one worker handles at once. `enter` admits a call at once if a slot is free;
+    otherwise `wait` queues it (first come, first served) for up to `wait_s`, or turns it away
+    straight away when `queue_size` calls are already waiting. Runs on the event loop.
+    """
+
+    def __init__(self, max_calls=None, queue_size=None, wait_s=None):
+        self.max_calls = max_calls if max_calls is not None else MAX_ACTIVE_CALLS
+        self.queue_size = queue_size if queue_size is not None else ADMISSION_QUEUE_SIZE
+        self.wait_s = wait_s if wait_s is not None else ADMISSION_WAIT_S
+        self.active = 0
+        self._waiters = deque()
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = 0
+
+    def enter(self) -> bool:
+        """Takes a slot if one is free and nobody is queued ahead."""
+        if self.max_calls <= 0 or (self.active < self.max_calls and not self._waiters):
+            self.active += 1
+            self.admitted += 1
+            return True
+        return False
+
+    async def wait(self) -> bool:
+        """Queues for a slot; True once admitted, False if the queue is full or the wait times out."""
+        if len(self._waiters) >= self.queue_size:
+            self.rejected += 1
+            return False
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self.queued += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.wait_s)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+        if waiter.done() and not waiter.cancelled():
+            self.admitted += 1
+            return True
+        waiter.cancel()
+        self.rejected += 1
+        return False
+
+    def leave(self):
+        """Frees the slot, handing it straight to the longest-waiting call if any."""
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(True) # The slot passes over; `active` is unchanged
+                return
+        self.active -= 1
+
+    def stats(self) -> dict:
+        return {
+            "max_calls": self.max_calls,
+            "active": self.active,
+            "waiting": len(self._waiters),
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected": self.rejected,
+        }
+
+
+class CircuitBreaker:
+    """
+    Tracks one provider's health from the outcome of its calls. After `failures` consecutive
+    failures it opens for `reset_s`: callers check `is_open` and use fallback audio instead of
+    waiting on a provider that is down. Once that passes calls go through again; the first
+    failure re-opens it and the first success closes it. Safe to update from worker threads.
+    """
+
+    def __init__(self, name, failures=None, reset_s=None):
+        self.name = name
+        self.failures = failures if failures is not None else CIRCUIT_FAILURES
+        self.reset_s = reset_s if reset_s is not None else CIRCUIT_RESET_S
+        self._consecutive = 0
+        self._open_until = 0.0
+        self._lock = threading.Lock()
+        self.opened = 0
+
+    @property
+    def is_open(self) -> bool:
+        return time.monotonic() < self._open_until
+
+    @property
+    def state(self) -> str:
+        if self.is_open:
+            return "open"
+        return "half_open" if self._consecutive >= self.failures else "closed"
+
+    def success(self):
+        with self._lock:
+            if self._consecutive >= self.failures:
+                logger.info(f"{self.name} circuit closed; provider recovered")
+            self._consecutive = 0
+            self._open_until = 0.0
+
+    def failure(self):
+        with self._lock:
+            self._consecutive += 1
+            if self._consecutive >= self.failures and not self.is_open:
+                self._open_until = time.monotonic() + self.reset_s
+                self.opened += 1
+                logger.warning(f"{self.name} circuit opened after {self._consecutive} consecutive failures")
+
+    def stats(self) -> dict:
+        return {"state": self.state, "consecutive_failures": self._consecutive, "opened": self.opened}
+
+
+class LatencyBudget:
+    """A deadline for one provider call including its retries, in place of a fixed retry count."""
+
+    def __init__(self, seconds):
+        self.deadline = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.deadline - time.monotonic())
+
+    def timeout(self, cap) -> float:
+        """Timeout for the next attempt: what is left of the budget, at most `cap`."""
+        return min(cap, self.remaining())
+
+
+def budget_spent(retry_state) -> bool:
+    """tenacity `stop`: gives up when too little of the call's `budget` keyword argument is left for another attempt."""
+    return retry_state.kwargs["budget"].remaining() < MIN_ATTEMPT_S
+
+
+def backoff_within_budget(retry_state) -> float:
+    """tenacity `wait`: jittered exponential backoff from 0.25 s, capped at 2 s and at what the budget can spare."""
+    delay = min(2.0, 0.25 * 2 ** (retry_state.attempt_number - 1)) * random.uniform(0.8, 1.2)
+    return max(0.0, min(delay, retry_state.kwargs["budget"].remaining() - MIN_ATTEMPT_S))
+
+
+call_gate = AdmissionGate()
+breakers = {name: CircuitBreaker(name) for name in ("stt", "agent", "tts", "calendar")}
@@ -0,0 +1,189 @@
+import os
+import re
+import time
+import logging
+import threading
+from collections import OrderedDict, Counter
+
+logger = logging.getLogger(__name__)
+
+REQUIRED_FIELDS = ("name", "email", "date", "time")
+
+_GREETING = re.compile(r"^\s*(hi|hello|hey|good (morning|afternoon|evening))\b")
+_GOODBYE = re.compile(r"\b(bye|goodbye|that's all|no thanks|not interested|hang up)\b")
+_AFFIRM = re.compile(r"^\s*(yes|yeah|yep|sure|correct|that's (right|correct)|sounds good|ok(ay)?|perfect|please do|go ahead)\b")
+_DENY = re.compile(r"^\s*(no|nope|not really|wrong|that's not)\b")
+_QUESTION = re.compile(r"\?\s*$|^\s*(what|when|where|who|why|how|can|could|do|does|is|are|will|would)\b")
+# Words that carry no detail of their own in a reply like "my email is ... and you can call me on ...";
+# anything else the slot extractor left unparsed is something the caller told us that a shared reply
+# could not reflect ("a two-bedroom condo near the park")
+_FILLER_WORDS = set("""
+a an the and or but so then also just um uh er hmm oh well yes yeah yep sure ok okay alright right
+please thanks thank you hi hello hey it it's its is was be been i i'm im i'd id me my mine myself
+we we're our us name name's called call this that that's there here am are at on in of for to by
+with from as dot underscore dash hyphen period point email e-mail address mail phone number cell
+mobile reach can could would will should shall do does make set book put down change instead
+actually like let's lets how what about maybe works work fine good great
+sounds perfect next coming day time morning afternoon evening night tonight today tomorrow o'clock
+oclock pm a.m p.m half quarter past after noon midday spelled spell double triple plus area code
+zero oh one two three four five six seven eight nine ten eleven twelve thirteen fourteen fifteen
+sixteen seventeen eighteen nineteen twenty thirty forty fifty sixty seventy eighty ninety
+first second third fourth fifth sixth seventh eighth ninth tenth twentieth thirtieth
+monday tuesday wednesday thursday friday saturday sunday january february march april may june
+july august september october november december
+""".split())
+_WORD = re.compile(r"[a-z][a-z'.-]*")
+_BOOKING_TEXT = re.compile(r"appointment (confirmed|booked)|\{")
+# Replies with numbers, addresses, dates or emails are about one caller and are never shared
+_SPECIFIC_TEXT = re.compile(
+    r"\d|@|\b(monday|tuesday|wednesday|thursday|friday|saturday|sunday|today|tomorrow|"
+    r"january|february|march|april|june|july|august|september|october|november|december)\b"
+)
+
+
+def classify_intent(text: str, extracted=None) -> str:
+    """
+    Coarse intent of a caller utterance: greeting, provide_info, affirm, deny, question, goodbye or other.
+    `extracted` is the slot extractor's result for the same utterance.
+    """
+    lowered = (text or "").lower()
+    if _GOODBYE.search(lowered):
+        return "goodbye"
+    if extracted:
+        return "provide_info"
+    if _QUESTION.search(lowered):
+        return "question"
+    if _AFFIRM.search(lowered):
+        return "affirm"
+    if _DENY.search(lowered):
+        return "deny"
+    if _GREETING.search(lowered):
+        return "greeting"
+    return "other"
+
+
+def _has_uncaptured_content(rest: str) -> bool:
+    """True if the words the slot extractor left over say more than filler."""
+    return any(word.strip(".'-") not in _FILLER_WORDS for word in _WORD.findall((rest or "").lower()))
+
+
+def _bypass_complete(known, intent):
+    # With every required detail known the next reply is a personalized confirmation
+    return all(known.get(field) for field in REQUIRED_FIELDS)
+
+
+class ResponseCache:
+    """
+    Agent reply cache keyed by normalized dialog state: which lead fields are filled, the
+    intent class of the last utterance and, for provide_info, which fields it gave. Scripted turns ("What's your email?") are answered
+    without an LLM call. Entries expire after `ttl` seconds and the cache holds at most
+    `max_entries`, evicting the least recently used.
+
+    A lookup is bypassed when the intent is in `bypass_intents` or any `bypass_rules`
+    predicate (known, intent) returns True, and for a provide_info utterance that says more
+    than the slot extractor captured (`rest`, its unparsed words). Replies that mention one of
+    the caller's details or look like a booking are never stored, so nothing personal is
+    replayed to another caller.
+    """
+
+    def __init__(self, ttl=None, max_entries=None, bypass_intents=None, bypass_rules=None, namespace=""):
+        self.enabled = os.getenv("RESPONSE_CACHE_ENABLED", "1") == "1"
+        self.ttl = ttl if ttl is not None else float(os.getenv("RESPONSE_CACHE_TTL_S", "86400"))
+        self.max_entries = max_entries if max_entries is not None else int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "256"))
+        if bypass_intents is None:
+            bypass_intents = os.getenv("RESPONSE_CACHE_BYPASS_INTENTS", "question,affirm,deny,goodbye,other").split(",")
+        self.bypass_intents = {intent.strip() for intent in bypass_intents if intent.strip()}
+        self.bypass_rules = list(bypass_rules) if bypass_rules is not None else [_bypass_complete]
+        self.namespace = namespace
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bypasses = Counter()
+        self.stores = 0
+        self.rejected = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def key(self, known, intent, extracted=None):
+        filled = ",".join(sorted(field for field, value in known.items() if value))
+        key = f"{self.namespace}|{intent}|{filled}"
+        if intent == "provide_info":
+            key += "|" + ",".join(sorted(extracted or ()))
+        return key
+
+    def _bypass_reason(self, known, intent, rest=None):
+        if not self.enabled:
+            return "disabled"
+        if intent in self.bypass_intents:
+            return f"intent:{intent}"
+        if intent == "provide_info" and _has_uncaptured_content(rest):
+            return "uncaptured_content"
+        for rule in self.bypass_rules:
+            if rule(known, intent):
+                return getattr(rule, "__name__", "rule").lstrip("_")
+        return None
+
+    def get(self, known, intent, extracted=None, rest=None):
+        """
+        Returns the cached reply for this dialog state, or None (miss or bypass). `extracted`
+        and `rest` are SlotExtractor.parse's result for the utterance.
+        """
+        reason = self._bypass_reason(known, intent, rest)
+        with self._lock:
+            if reason:
+                self.bypasses[reason] += 1
+                return None
+            key = self.key(known, intent, extracted)
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[1] > self.ttl:
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, known, intent, reply, extracted=None, rest=None):
+        """Stores an agent reply for this dialog state if it is cacheable. Returns True if stored."""
+        reply = (reply or "").strip()
+        if not reply or self._bypass_reason(known, intent, rest):
+            return False
+        lowered = reply.lower()
+        if _BOOKING_TEXT.search(lowered) or _SPECIFIC_TEXT.search(lowered) or any(
+            value and str(value).lower() in lowered for value in known.values()
+        ):
+            with self._lock:
+                self.rejected += 1
+            return False
+        key = self.key(known, intent, extracted)
+        with self._lock:
+            self._entries[key] = (reply, time.monotonic())
+            self._entries.move_to_end(key)
+            self.stores += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return True
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "bypasses": dict(self.bypasses),
+                "stores": self.stores,
+                "rejected": self.rejected,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
@@ -1,40 +1,69 @@
+import io
 import os
+import wave
 from dotenv import load_dotenv
-import openai
 import logging
+from services.Metrics import PROVIDER_ERRORS
+from services.Resilience import breakers
 
 logger = logging.getLogger(__name__)
 
+# Longest a transcription may take before the turn gives up on it
+STT_BUDGET_S = float(os.getenv("STT_BUDGET_S", "8"))
+
 class SpeechToText:
     def __init__(self):
+        import openai # Imported with the client, not the module, to keep server start fast
         load_dotenv()
         openai.api_key = os.getenv("OPENAI_API_KEY")
         if not openai.api_key:
             logger.error("OPENAI_API_KEY not found in environment variables.")
 
-    def transcribe(self, audio_file_path):
+    def transcribe(self, audio):
         """
-        Transcribes audio from a file using OpenAI's Whisper API.
-        audio_file_path should be a path to a WAV or other supported audio file.
+        Transcribes audio using OpenAI's Whisper API.
+        audio is WAV (or other supported format) data as bytes, bytearray, memoryview or a
+        BytesIO buffer; a file path is still accepted for offline use.
         """
-        if not os.path.exists(audio_file_path):
-            logger.error(f"Audio file not found for transcription: {audio_file_path}")
-            return ""
-        if os.path.getsize(audio_file_path) == 0:
-             logger.warning(f"Audio file is empty, cannot transcribe: {audio_file_path}")
+        import openai
+        if isinstance(audio, str):
+            if not os.path.exists(audio):
+                logger.error(f"Audio file not found for transcription: {audio}")
+                return ""
+            with open(audio, "rb") as audio_file:
+                audio = audio_file.read()
+        elif isinstance(audio, io.BytesIO):
+            audio = audio.getbuffer()
+
+        if not audio or len(audio) == 0:
+             logger.warning("Audio buffer is empty, cannot transcribe.")
              return ""
 
         try:
-            with open(audio_file_path, "rb") as audio_file:
-                # Use the whisper-1 model
-                response = openai.audio.transcriptions.create(
-                    model="whisper-1",
-                    file=audio_file
-                )
-                # The response object has a 'text' attribute
-                transcribed_text = response.text
-                logger.info(f"Transcription successful: {transcribed_text}")
-                return transcribed_text
+            # Use the whisper-1 model; the SDK takes an in-memory (filename, content) tuple
+            response = openai.audio.transcriptions.create(
+                model="whisper-1",
+                file=("audio.wav", bytes(audio), "audio/wav"),
+                timeout=STT_BUDGET_S,
+            )
+            breakers["stt"].success()
+            # The response object has a 'text' attribute
+            transcribed_text = response.text
+            logger.info(f"Transcription successful: {transcribed_text}")
+            return transcribed_text
         except Exception as e:
+            PROVIDER_ERRORS.inc(provider="stt")
+            breakers["stt"].failure()
             logger.error(f"Error during transcription: {e}")
             return ""
+
+
+def pcm_to_wav(pcm_data, sample_rate=8000, sample_width=2, channels=1) -> bytes:
+    """Wraps raw PCM in a WAV header in memory, without touching the filesystem."""
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav_file:
+        wav_file.setnchannels(channels)
+        wav_file.setsampwidth(sample_width)
+        wav_file.setframerate(sample_rate)
+        wav_file.writeframes(pcm_data)
+    return buffer.getvalue()
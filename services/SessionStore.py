@@ -0,0 +1,173 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import sqlite3
+import threading
+from services.Executor import storage_stage
+
+logger = logging.getLogger(__name__)
+
+SESSION_TTL_S = float(os.getenv("SESSION_TTL_S", "3600"))
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", "sessions.db")
+
+
+class SessionStore:
+    """
+    Per-call state (dialog memory, lead info, transcript, playback position) keyed by call SID,
+    stored as JSON so any worker can pick a call up where another left it. Methods block;
+    call them on the storage stage (see SessionCheckpoint).
+    """
+
+    name = "base"
+    shared = False  # True if other worker processes see the same state
+
+    def load(self, key):
+        """The saved state for `key`, or None if there is none or it expired."""
+        raise NotImplementedError
+
+    def save(self, key, state: dict):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+
+class InProcessSessionStore(SessionStore):
+    """Single-process backend; state is still round-tripped through JSON so both backends behave alike."""
+
+    name = "memory"
+
+    def __init__(self, ttl=SESSION_TTL_S):
+        self.ttl = ttl
+        self._states = {}
+        self._lock = threading.Lock()
+
+    def load(self, key):
+        with self._lock:
+            entry = self._states.get(key)
+            if entry is None:
+                return None
+            if entry[1] < time.time():
+                del self._states[key]
+                return None
+            return json.loads(entry[0])
+
+    def save(self, key, state):
+        encoded = json.dumps(state)
+        now = time.time()
+        with self._lock:
+            self._states[key] = (encoded, now + self.ttl)
+            if len(self._states) % 256 == 0:
+                for stale in [k for k, (_, expires_at) in self._states.items() if expires_at < now]:
+                    del self._states[stale]
+
+    def delete(self, key):
+        with self._lock:
+            self._states.pop(key, None)
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    Shared backend for several workers on one host: a WAL-mode SQLite file that every worker
+    process opens. Expired rows are ignored on load and purged periodically.
+    """
+
+    name = "sqlite"
+    shared = True
+
+    def __init__(self, path=SESSION_DB_PATH, ttl=SESSION_TTL_S):
+        self.path = path
+        self.ttl = ttl
+        self._db = None
+        self._lock = threading.Lock()
+        self._saves = 0
+
+    def _connection(self):
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=10)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS sessions (key TEXT PRIMARY KEY, state TEXT NOT NULL,"
+                " updated_at REAL NOT NULL, expires_at REAL NOT NULL)"
+            )
+        return self._db
+
+    def load(self, key):
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT state FROM sessions WHERE key = ? AND expires_at >= ?", (key, time.time())
+            ).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def save(self, key, state):
+        encoded = json.dumps(state)
+        now = time.time()
+        with self._lock:
+            db = self._connection()
+            db.execute(
+                "INSERT INTO sessions (key, state, updated_at, expires_at) VALUES (?, ?, ?, ?)"
+                " ON CONFLICT (key) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at,"
+                " expires_at = excluded.expires_at",
+                (key, encoded, now, now + self.ttl),
+            )
+            self._saves += 1
+            if self._saves % 256 == 0:
+                db.execute("DELETE FROM sessions WHERE expires_at < ?", (now,))
+
+    def delete(self, key):
+        with self._lock:
+            self._connection().execute("DELETE FROM sessions WHERE key = ?", (key,))
+
+
+def create_session_store(name=None) -> SessionStore:
+    """Backend named by SESSION_STORE: "memory" (default, one worker) or "sqlite" (shared by workers)."""
+    name = name or os.getenv("SESSION_STORE", "memory")
+    if name == "memory":
+        return InProcessSessionStore()
+    if name == "sqlite":
+        return SQLiteSessionStore()
+    raise ValueError(f"Unknown session store: {name}")
+
+
+class SessionCheckpoint:
+    """
+    Saves one call's state in the background. `save` never waits: if a write is already in
+    flight the newer state replaces any queued one, so only the latest state is written.
+    """
+
+    def __init__(self, store, key):
+        self.store = store
+        self.key = key
+        self._latest = None
+        self._task = None
+        self.writes = 0
+
+    def save(self, state: dict):
+        self._latest = state
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._drain())
+
+    async def _drain(self):
+        while self._latest is not None:
+            state, self._latest = self._latest, None
+            try:
+                await storage_stage.run(self.store.save, self.key, state)
+                self.writes += 1
+            except Exception as e:
+                logger.error(f"Failed to save session state for {self.key}: {e}")
+
+    async def close(self, delete=False):
+        """Waits for pending writes; with `delete`, removes the state (the call is over for good)."""
+        if self._task is not None:
+            await self._task
+        if delete:
+            try:
+                await storage_stage.run(self.store.delete, self.key)
+            except Exception as e:
+                logger.error(f"Failed to delete session state for {self.key}: {e}")
+
+
+session_store = create_session_store()
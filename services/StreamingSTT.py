@@ -0,0 +1,288 @@
+import os
+import asyncio
+import logging
+import itertools
+from agent.audio_codec import ulaw_decode
+from services.STT import SpeechToText, pcm_to_wav
+from services.Executor import stt_stage
+from services.Metrics import STT_FINALS, span
+
+logger = logging.getLogger(__name__)
+
+FRAME_MS = 20
+FRAME_BYTES = 160  # 20 ms of 8kHz μ-law
+_SENTENCE_END = (".", "?", "!")
+
+
+class Hypothesis:
+    """One recognition result for an utterance. Partials may still change; a final does not."""
+
+    __slots__ = ("text", "final", "audio_ms")
+
+    def __init__(self, text, final=False, audio_ms=0):
+        self.text = text
+        self.final = final
+        self.audio_ms = audio_ms
+
+    @property
+    def complete(self) -> bool:
+        """True when the text reads as a finished sentence."""
+        return self.text.rstrip().endswith(_SENTENCE_END)
+
+    def __repr__(self):
+        return f"Hypothesis({self.text!r}, final={self.final}, audio_ms={self.audio_ms})"
+
+
+class STTStream:
+    """
+    Recognition of one utterance, fed with 20 ms μ-law frames as they arrive.
+    `feed` runs on the event loop for every frame and must not block; backends do their
+    blocking work in the STT stage. Partials are passed to `on_partial` as they appear.
+    """
+
+    def __init__(self, on_partial=None):
+        self.on_partial = on_partial
+        self.partial = None  # Latest partial Hypothesis
+        self.partial_covers_speech = False  # No voiced audio arrived after the latest partial
+
+    def on_speech_start(self, audio: bytes):
+        """Receives the pre-roll and onset frames the endpointer collected before speech was confirmed."""
+
+    def feed(self, frame: bytes, speech: bool):
+        raise NotImplementedError
+
+    async def finish(self, utterance: bytes) -> Hypothesis:
+        """Returns the final hypothesis once the endpointer has cut `utterance`."""
+        raise NotImplementedError
+
+    def cancel(self):
+        """Abandons the utterance (noise burst or end of call)."""
+
+    def _emit(self, hypothesis, covers_speech):
+        self.partial = hypothesis
+        self.partial_covers_speech = covers_speech
+        logger.debug(f"Partial transcript: {hypothesis.text!r}")
+        if self.on_partial is not None:
+            self.on_partial(hypothesis)
+
+
+class STTBackend:
+    """Creates one STTStream per utterance."""
+
+    name = "base"
+
+    def open_stream(self, on_partial=None) -> STTStream:
+        raise NotImplementedError
+
+
+class WhisperStream(STTStream):
+    """
+    Whisper has no streaming API, so the adapter transcribes speculatively: once the caller
+    has paused for `pause_ms`, the audio so far is sent while the endpointer is still waiting
+    out its hangover. If the caller does not speak again, that result becomes the final and
+    the turn skips the post-endpoint transcription entirely.
+    """
+
+    def __init__(self, backend, on_partial=None):
+        super().__init__(on_partial)
+        self.backend = backend
+        self._audio = bytearray()
+        self._voiced_bytes = 0  # Audio up to and including the last voiced frame
+        self._silence_frames = 0
+        self._pending = None  # (task, voiced bytes covered by its snapshot)
+        self._partials = 0  # Speculative requests sent for this utterance
+
+    def feed(self, frame: bytes, speech: bool):
+        self._audio.extend(frame)
+        if speech:
+            self._voiced_bytes = len(self._audio)
+            self._silence_frames = 0
+            self.partial_covers_speech = False
+            return
+        self._silence_frames += 1
+        if (self._silence_frames == self.backend.pause_frames and self._pending is None
+                and self._partials < self.backend.max_partials):
+            self._partials += 1
+            snapshot = bytes(self._audio)
+            task = asyncio.ensure_future(self._transcribe_partial(snapshot, self._voiced_bytes))
+            self._pending = (task, self._voiced_bytes)
+
+    def on_speech_start(self, audio: bytes):
+        self._audio.extend(audio)
+        self._voiced_bytes = len(self._audio)
+
+    async def _transcribe_partial(self, snapshot, voiced_bytes):
+        try:
+            text = await stt_stage.run(self.backend.transcribe_ulaw, snapshot)
+        finally:
+            self._pending = None
+        if text:
+            self._emit(Hypothesis(text, False, len(snapshot) // FRAME_BYTES * FRAME_MS), voiced_bytes == self._voiced_bytes)
+        return text, voiced_bytes
+
+    async def finish(self, utterance: bytes) -> Hypothesis:
+        audio_ms = len(utterance) // FRAME_BYTES * FRAME_MS
+        pending = self._pending
+        if pending is not None and pending[1] == self._voiced_bytes:
+            # The speculative request already holds all of the speech; wait for it
+            try:
+                text, _ = await pending[0]
+            except Exception as e:
+                logger.warning(f"Speculative transcription failed: {e}")
+                text = ""
+            if text:
+                STT_FINALS.inc(source="partial")
+                return Hypothesis(text, True, audio_ms)
+        elif pending is not None:
+            pending[0].cancel()
+        if self.partial is not None and self.partial_covers_speech:
+            STT_FINALS.inc(source="partial")
+            return Hypothesis(self.partial.text, True, audio_ms)
+        STT_FINALS.inc(source="transcribed")
+        text = await stt_stage.run(self.backend.transcribe_ulaw, utterance)
+        return Hypothesis(text, True, audio_ms)
+
+    def cancel(self):
+        if self._pending is not None:
+            self._pending[0].cancel()
+            self._pending = None
+
+
+class WhisperBackend(STTBackend):
+    """
+    Adapter for the batch Whisper API behind the streaming interface.
+    Each speculative partial is a billed request for the whole utterance so far, so at most
+    STT_MAX_PARTIALS (default 1) are sent per utterance; an utterance then costs at most two
+    requests. Set STT_PARTIAL_PAUSE_MS=0 to disable speculative partials.
+    """
+
+    name = "whisper"
+
+    def __init__(self, stt=None, pause_ms=None, max_partials=None):
+        self.stt = stt or SpeechToText()
+        pause_ms = pause_ms if pause_ms is not None else int(os.getenv("STT_PARTIAL_PAUSE_MS", "120"))
+        # 0 never matches a silence run, so no partial is ever requested
+        self.pause_frames = pause_ms // FRAME_MS if pause_ms > 0 else 0
+        self.max_partials = max_partials if max_partials is not None else int(os.getenv("STT_MAX_PARTIALS", "1"))
+
+    def transcribe_ulaw(self, ulaw: bytes) -> str:
+        """Blocking: decodes μ-law to 16-bit PCM, wraps it in an in-memory WAV and transcribes it."""
+        with span("decode"):
+            wav_audio = pcm_to_wav(ulaw_decode(ulaw).tobytes(), sample_rate=8000, sample_width=2)
+        return self.stt.transcribe(wav_audio)
+
+    def open_stream(self, on_partial=None) -> STTStream:
+        return WhisperStream(self, on_partial)
+
+
+class ScriptedStream(STTStream):
+    def __init__(self, backend, text, on_partial=None):
+        super().__init__(on_partial)
+        self.backend = backend
+        self.text = text
+        self._words = text.split()
+        self._voiced_frames = 0
+        self._silence_frames = 0
+        self._emitted = 0
+
+    def on_speech_start(self, audio: bytes):
+        self._voiced_frames = len(audio) // FRAME_BYTES
+
+    def feed(self, frame: bytes, speech: bool):
+        if speech:
+            self._voiced_frames += 1
+            self._silence_frames = 0
+            self.partial_covers_speech = False
+            # Words appear at a steady speaking rate; the last one waits for a pause
+            words = min(len(self._words) - 1, self._voiced_frames * FRAME_MS // self.backend.ms_per_word)
+            if words > self._emitted:
+                self._emitted = words
+                self._emit(Hypothesis(" ".join(self._words[:words]), False, self._voiced_frames * FRAME_MS), False)
+            return
+        self._silence_frames += 1
+        if self._silence_frames == self.backend.pause_frames and self._words:
+            self._emitted = len(self._words)
+            self._emit(Hypothesis(self.text, False, self._voiced_frames * FRAME_MS), True)
+
+    async def finish(self, utterance: bytes) -> Hypothesis:
+        if self.backend.latency:
+            await asyncio.sleep(self.backend.latency)
+        STT_FINALS.inc(source="partial" if self.partial_covers_speech else "transcribed")
+        return Hypothesis(self.text, True, len(utterance) // FRAME_BYTES * FRAME_MS)
+
+
+class ScriptedBackend(STTBackend):
+    """
+    Deterministic local backend for tests and load runs: each utterance is "recognized" as the
+    next line of `lines`, with a partial for each `ms_per_word` of speech, the whole line as a
+    partial after a `pause_ms` pause, and the final `latency` seconds after the endpoint.
+    """
+
+    name = "stub"
+
+    def __init__(self, lines=None, latency=0.0, pause_ms=100, ms_per_word=250):
+        if lines is None:
+            lines = os.getenv("STT_STUB_LINES", "Hello.").split("|")
+        self._lines = itertools.cycle(lines)
+        self.latency = latency
+        self.pause_frames = max(1, pause_ms // FRAME_MS)
+        self.ms_per_word = ms_per_word
+
+    def open_stream(self, on_partial=None) -> STTStream:
+        return ScriptedStream(self, next(self._lines), on_partial)
+
+
+def create_stt_backend(name=None) -> STTBackend:
+    """Backend named by STT_BACKEND: "whisper" (default) or "stub"."""
+    name = name or os.getenv("STT_BACKEND", "whisper")
+    if name == "whisper":
+        return WhisperBackend()
+    if name == "stub":
+        return ScriptedBackend()
+    raise ValueError(f"Unknown STT backend: {name}")
+
+
+class StreamingTranscriber:
+    """
+    Connects one call's endpointer to the STT backend (it is the endpointer's listener).
+    Every utterance gets its own stream from the moment speech starts; streams for finished
+    utterances are handed out with `take` in the order the endpointer returned them.
+    """
+
+    def __init__(self, backend, on_partial=None):
+        self.backend = backend
+        self.on_partial = on_partial
+        self._stream = None
+        self._finished = []
+
+    def on_speech_start(self, audio: bytes):
+        self._stream = self.backend.open_stream(self.on_partial)
+        self._stream.on_speech_start(audio)
+
+    def on_frame(self, frame: bytes, speech: bool):
+        if self._stream is not None:
+            self._stream.feed(frame, speech)
+
+    def on_speech_end(self, utterance):
+        stream, self._stream = self._stream, None
+        if stream is None:
+            return
+        if utterance is None:
+            stream.cancel()
+        else:
+            self._finished.append(stream)
+
+    def transcript_complete(self) -> bool:
+        """True when the latest partial covers all speech so far and reads as a finished sentence."""
+        stream = self._stream
+        return stream is not None and stream.partial is not None and stream.partial_covers_speech and stream.partial.complete
+
+    def take(self) -> STTStream:
+        """The stream for the oldest utterance returned by the endpointer but not taken yet."""
+        return self._finished.pop(0)
+
+    def close(self):
+        for stream in self._finished + ([self._stream] if self._stream is not None else []):
+            stream.cancel()
+        self._finished.clear()
+        self._stream = None
@@ -1,39 +1,60 @@
 import os
-import tempfile
 import logging
 from dotenv import load_dotenv
-import openai
-from tenacity import retry, stop_after_attempt, wait_exponential # Import retry decorators
+from services.Metrics import PROVIDER_ERRORS, count_retry
+from services.Resilience import LatencyBudget, budget_spent, backoff_within_budget, breakers
 
 logger = logging.getLogger(__name__)
 
+PCM_SAMPLE_RATE = 24000 # OpenAI TTS "pcm" response format is 24kHz 16-bit mono
+# Time one synthesis may take, retries included, before the caller gets fallback audio instead
+TTS_BUDGET_S = float(os.getenv("TTS_BUDGET_S", "6"))
+
 class TextToSpeech:
     def __init__(self):
+        # The SDKs are imported here rather than at module level: openai alone takes about half a
+        # second to import, which every server start would otherwise pay before serving anything
+        import openai
+        from tenacity import retry # Import retry decorator
         load_dotenv()
         openai.api_key = os.getenv("OPENAI_API_KEY")
         if not openai.api_key:
             logger.error("OPENAI_API_KEY not found in environment variables.")
+        self.model = os.getenv("OPENAI_TTS_MODEL", "tts-1")
+        # Retries stop when the latency budget runs out rather than after a fixed count, so a
+        # struggling provider cannot keep the caller in silence through long backoffs
+        self._generate_speech_with_retry = retry(
+            stop=budget_spent, wait=backoff_within_budget, before_sleep=count_retry("tts")
+        )(self._generate_speech)
+
+    def warm(self):
+        """Opens the HTTPS connection to OpenAI ahead of the first call, with a model lookup (no synthesis)."""
+        import openai
+        if openai.api_key:
+            openai.models.retrieve(self.model, timeout=5)
 
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=2, max=10))
-    def _generate_speech_with_retry(self, text, voice="alloy"):
-        """Internal method with retry logic for OpenAI API call."""
+    def _generate_speech(self, text, voice="alloy", response_format="wav", *, budget):
+        """Internal method for the OpenAI API call; called through _generate_speech_with_retry."""
+        import openai
         logger.debug(f"Attempting OpenAI TTS for text: '{text[:50]}...'")
-        # Add explicit timeout as suggested by boss
         response = openai.audio.speech.create(
-            model="tts-1", # Using tts-1 as in your code, boss suggested tts-1-hd (can change if needed)
+            model=self.model, # tts-1 by default, boss suggested tts-1-hd (set OPENAI_TTS_MODEL)
             voice=voice,
             input=text,
-            timeout=10 # Add explicit timeout in seconds
+            response_format=response_format,
+            timeout=budget.timeout(10) # Explicit timeout, never past the budget
         )
         logger.debug("OpenAI TTS call successful.")
         return response
 
-    def speak(self, text, output_path=None, voice="alloy"):
+    def speak(self, text, output_path=None, voice="alloy", response_format="wav", budget_s=None):
         """
-        Generate speech from text using OpenAI TTS, save to output_path (mp3), and return the file path.
-        If output_path is None, a temp file is created and its path is returned.
-        Includes retry logic.
+        Generate speech from text using OpenAI TTS and return the audio (WAV by default) as bytes.
+        WAV converts to μ-law in-process; mp3 needs ffmpeg.
+        If output_path is given, the audio is written to that file and the path is returned instead.
+        Retries within a latency budget of `budget_s` (TTS_BUDGET_S by default).
         """
+        import openai
         if not openai.api_key:
             logger.error("OpenAI API key is not set. Cannot generate speech.")
             return None
@@ -44,25 +65,57 @@ class TextToSpeech:
 
         try:
             # Call the internal method with retry logic
-            response = self._generate_speech_with_retry(text, voice=voice)
-
-            if output_path is None:
-                # Create a temporary file with .mp3 suffix
-                fd, temp_path = tempfile.mkstemp(suffix=".mp3")
-                os.close(fd) # Close the file descriptor immediately
-                output_path = temp_path
-                logger.debug(f"Created temporary file for TTS: {output_path}")
+            budget = LatencyBudget(budget_s if budget_s is not None else TTS_BUDGET_S)
+            response = self._generate_speech_with_retry(text, voice=voice, response_format=response_format, budget=budget)
+            breakers["tts"].success()
 
-            # Write the audio content to the file
-            response.write_to_file(output_path)
-            logger.debug(f"TTS audio saved to {output_path}")
+            if output_path is not None:
+                # Write the audio content to the file
+                response.write_to_file(output_path)
+                logger.debug(f"TTS audio saved to {output_path}")
+                return output_path
 
-            return output_path
+            audio = response.content
+            logger.debug(f"TTS audio generated in memory ({len(audio)} bytes)")
+            return audio
 
         except Exception as e:
             # The retry decorator will handle retries, this catch is for final failure
+            PROVIDER_ERRORS.inc(provider="tts")
+            breakers["tts"].failure()
             logger.error(f"Final attempt failed: Error generating speech with OpenAI TTS: {e}")
             return None
 
+    def stream_pcm(self, text, voice="alloy", chunk_size=4800):
+        """
+        Streams speech as raw PCM (24kHz, 16-bit, mono) while OpenAI is still synthesizing it.
+        Yields byte chunks as they arrive; blocking, so async callers drive it from the TTS stage.
+        """
+        import openai
+        if not openai.api_key:
+            logger.error("OpenAI API key is not set. Cannot generate speech.")
+            return
+        if not text:
+            logger.warning("No text provided for TTS.")
+            return
+
+        # Not retried: audio may already be playing. The consumer counts the error; the breaker is updated here
+        try:
+            with openai.audio.speech.with_streaming_response.create(
+                model=self.model,
+                voice=voice,
+                input=text,
+                response_format="pcm",
+                timeout=TTS_BUDGET_S
+            ) as response:
+                for chunk in response.iter_bytes(chunk_size):
+                    yield chunk
+        except GeneratorExit:
+            raise # Closed by the consumer (e.g. barge-in); says nothing about the provider
+        except Exception:
+            breakers["tts"].failure()
+            raise
+        breakers["tts"].success()
+
     # Removed play_audio as it's not needed for the Twilio pipeline
     # Removed pygame imports as they are not needed for server-side TTS
\ No newline at end of file
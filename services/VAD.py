@@ -0,0 +1,170 @@
+import os
+import logging
+from collections import deque
+from agent.audio_codec import rms, ulaw_decode
+
+logger = logging.getLogger(__name__)
+
+# Twilio media streams carry 8kHz, 8-bit μ-law mono audio.
+# One 20 ms frame is therefore 160 bytes.
+SAMPLE_RATE = 8000
+FRAME_MS = 20
+FRAME_BYTES = SAMPLE_RATE * FRAME_MS // 1000
+
+
+class EnergyVAD:
+    """
+    Frame-level voice activity detector for μ-law audio.
+    A frame counts as speech when its RMS energy is above both a fixed threshold
+    and a multiple of the running noise floor, so line noise does not trigger it.
+    """
+
+    def __init__(self, threshold=None, noise_ratio=None, adapt_rate=0.05):
+        self.threshold = threshold if threshold is not None else int(os.getenv("VAD_ENERGY_THRESHOLD", "500"))
+        self.noise_ratio = noise_ratio if noise_ratio is not None else float(os.getenv("VAD_NOISE_RATIO", "3.0"))
+        self.adapt_rate = adapt_rate
+        self.noise_floor = 0.0
+
+    def frame_energy(self, frame: bytes) -> float:
+        """Returns the RMS energy of a μ-law frame after decoding to 16-bit PCM."""
+        return rms(ulaw_decode(frame))
+
+    def is_speech(self, frame: bytes) -> bool:
+        energy = self.frame_energy(frame)
+        speech = energy >= max(self.threshold, self.noise_floor * self.noise_ratio)
+        if not speech:
+            # Only non-speech frames update the noise estimate
+            self.noise_floor += self.adapt_rate * (energy - self.noise_floor)
+        return speech
+
+
+class Endpointer:
+    """
+    Streaming endpointing stage run once per 20 ms frame.
+    Collects caller audio into utterances: speech starts after `start_ms` of voiced frames,
+    ends after `hangover_ms` of trailing silence, and is force-cut at `max_utterance_ms`.
+    `pre_roll_ms` of audio before the detected onset is kept so first syllables are not clipped.
+
+    An optional `listener` (see services.StreamingSTT.StreamingTranscriber) sees the utterance
+    as it is collected: on_speech_start(audio), on_frame(frame, speech) and on_speech_end(utterance
+    or None if discarded). When its transcript_complete() returns True, the shorter
+    `complete_hangover_ms` ends the utterance.
+    """
+
+    def __init__(self, vad=None, start_ms=None, hangover_ms=None, max_utterance_ms=None,
+                 min_utterance_ms=None, pre_roll_ms=None, listener=None, complete_hangover_ms=None):
+        self.vad = vad or EnergyVAD()
+        self.listener = listener
+        self.start_frames = self._frames(start_ms, "VAD_START_MS", 60)
+        self.hangover_frames = self._frames(hangover_ms, "VAD_HANGOVER_MS", 300)
+        # A partial transcript that reads as a finished sentence needs less silence to confirm
+        self.complete_hangover_frames = self._frames(complete_hangover_ms, "VAD_COMPLETE_HANGOVER_MS", 160)
+        self.max_frames = self._frames(max_utterance_ms, "VAD_MAX_UTTERANCE_MS", 15000)
+        self.min_voiced_frames = self._frames(min_utterance_ms, "VAD_MIN_UTTERANCE_MS", 200)
+        self.pre_roll = deque(maxlen=self._frames(pre_roll_ms, "VAD_PRE_ROLL_MS", 200))
+        self._remainder = b""
+        self.reset()
+
+    @staticmethod
+    def _frames(value, env_name, default_ms):
+        ms = value if value is not None else int(os.getenv(env_name, str(default_ms)))
+        return max(1, ms // FRAME_MS)
+
+    def reset(self):
+        """Drops any in-progress utterance and returns to the silence state."""
+        self.in_speech = False
+        self._utterance = bytearray()
+        self._onset_run = 0
+        self._silence_run = 0
+        self._voiced_frames = 0
+        self._frames_in_utterance = 0
+        self.silence_ms = 0  # Time since the caller last spoke, in ms
+        self.pre_roll.clear()
+
+    @property
+    def speech_ms(self) -> int:
+        """Voiced audio in the utterance currently in progress, in ms (0 when silent)."""
+        return self._voiced_frames * FRAME_MS if self.in_speech else 0
+
+    def push(self, audio: bytes) -> list:
+        """
+        Feeds raw μ-law audio of any length and returns the list of utterances completed by it.
+        Partial frames are kept until the next call.
+        """
+        data = self._remainder + audio
+        usable = len(data) - len(data) % FRAME_BYTES
+        self._remainder = data[usable:]
+        utterances = []
+        for i in range(0, usable, FRAME_BYTES):
+            utterance = self.process_frame(data[i:i + FRAME_BYTES])
+            if utterance:
+                utterances.append(utterance)
+        return utterances
+
+    def process_frame(self, frame: bytes):
+        """Processes one 20 ms frame. Returns the finished utterance as μ-law bytes, or None."""
+        speech = self.vad.is_speech(frame)
+
+        if not self.in_speech:
+            self.pre_roll.append(frame)
+            if speech:
+                self._onset_run += 1
+                if self._onset_run >= self.start_frames:
+                    self.in_speech = True
+                    for buffered in self.pre_roll:
+                        self._utterance.extend(buffered)
+                    self._frames_in_utterance = len(self.pre_roll)
+                    self._voiced_frames = self._onset_run
+                    self._silence_run = 0
+                    self.pre_roll.clear()
+                    self.silence_ms = 0
+                    if self.listener is not None:
+                        self.listener.on_speech_start(bytes(self._utterance))
+            else:
+                self._onset_run = 0
+                self.silence_ms += FRAME_MS
+            return None
+
+        self._utterance.extend(frame)
+        self._frames_in_utterance += 1
+        if speech:
+            self._voiced_frames += 1
+            self._silence_run = 0
+        else:
+            self._silence_run += 1
+        if self.listener is not None:
+            self.listener.on_frame(frame, speech)
+
+        hangover = self.hangover_frames
+        if self.listener is not None and self.listener.transcript_complete():
+            hangover = min(hangover, self.complete_hangover_frames)
+        if self._silence_run >= hangover:
+            # Trim the trailing silence; STT does not need it
+            trailing = (self._silence_run - 1) * FRAME_BYTES
+            return self._finish(trim=trailing)
+        if self._frames_in_utterance >= self.max_frames:
+            logger.info(f"Utterance reached max length ({self.max_frames * FRAME_MS} ms), cutting.")
+            return self._finish()
+        return None
+
+    def flush(self):
+        """Ends the current utterance early (e.g. on a stop event). Returns it if long enough."""
+        if not self.in_speech:
+            return None
+        return self._finish()
+
+    def _finish(self, trim=0):
+        utterance = bytes(self._utterance[:len(self._utterance) - trim]) if trim else bytes(self._utterance)
+        voiced = self._voiced_frames
+        silence_run = self._silence_run
+        self.reset()
+        self.silence_ms = silence_run * FRAME_MS
+        if voiced < self.min_voiced_frames:
+            logger.debug(f"Discarding short noise burst ({voiced * FRAME_MS} ms voiced).")
+            utterance = None
+        if self.listener is not None:
+            self.listener.on_speech_end(utterance)
+        if utterance is None:
+            return None
+        logger.info(f"Endpoint detected: {len(utterance)} bytes ({len(utterance) // FRAME_BYTES * FRAME_MS} ms).")
+        return utterance
@@ -0,0 +1,74 @@
+"""Webhook signature and admin key checks."""
+from fastapi import FastAPI, Depends, Request
+from fastapi.testclient import TestClient
+from twilio.request_validator import RequestValidator
+from services import Auth
+
+TOKEN = "test-auth-token"
+URL = "http://testserver/status"
+FORM = {"CallSid": "CA123", "CallStatus": "completed"}
+
+
+def client(monkeypatch):
+    monkeypatch.setattr(Auth, "TWILIO_AUTH_TOKEN", TOKEN)
+    app = FastAPI()
+
+    @app.post("/status", dependencies=[Depends(Auth.verify_twilio_signature)])
+    async def status(request: Request):
+        return dict(await request.form())
+
+    return TestClient(app)
+
+
+def test_signed_webhook_is_accepted(monkeypatch):
+    signature = RequestValidator(TOKEN).compute_signature(URL, FORM)
+    response = client(monkeypatch).post("/status", data=FORM, headers={"X-Twilio-Signature": signature})
+    assert response.status_code == 200
+    assert response.json() == FORM
+
+
+def test_unsigned_or_tampered_webhook_is_refused(monkeypatch):
+    test_client = client(monkeypatch)
+    assert test_client.post("/status", data=FORM).status_code == 403
+    signature = RequestValidator(TOKEN).compute_signature(URL, FORM)
+    tampered = {**FORM, "CallStatus": "busy"}
+    assert test_client.post("/status", data=tampered, headers={"X-Twilio-Signature": signature}).status_code == 403
+
+
+def test_webhook_is_refused_without_an_auth_token(monkeypatch):
+    test_client = client(monkeypatch)
+    monkeypatch.setattr(Auth, "TWILIO_AUTH_TOKEN", None)
+    signature = RequestValidator(TOKEN).compute_signature(URL, FORM)
+    assert test_client.post("/status", data=FORM, headers={"X-Twilio-Signature": signature}).status_code == 403
+
+
+ADMIN_KEY = "test-admin-key"
+
+
+def admin_client(monkeypatch, key=ADMIN_KEY):
+    monkeypatch.setattr(Auth, "ADMIN_API_KEY", key)
+    app = FastAPI()
+
+    @app.get("/calls", dependencies=[Depends(Auth.require_admin)])
+    async def calls():
+        return []
+
+    return TestClient(app)
+
+
+def test_admin_route_accepts_the_key_as_bearer_token_or_header(monkeypatch):
+    test_client = admin_client(monkeypatch)
+    assert test_client.get("/calls", headers={"Authorization": f"Bearer {ADMIN_KEY}"}).status_code == 200
+    assert test_client.get("/calls", headers={"X-API-Key": ADMIN_KEY}).status_code == 200
+
+
+def test_admin_route_refuses_missing_or_wrong_key(monkeypatch):
+    test_client = admin_client(monkeypatch)
+    assert test_client.get("/calls").status_code == 403
+    assert test_client.get("/calls", headers={"Authorization": "Bearer wrong"}).status_code == 403
+
+
+def test_admin_route_is_closed_without_a_configured_key(monkeypatch):
+    test_client = admin_client(monkeypatch, key=None)
+    assert test_client.get("/calls", headers={"X-API-Key": ""}).status_code == 403
+    assert test_client.get("/calls", headers={"Authorization": "Bearer "}).status_code == 403
@@ -0,0 +1,53 @@
+"""Outbound frame pacing against a simulated clock."""
+import asyncio
+from agent.frame_pacer import FramePacer
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.now += seconds
+
+
+def send(pacer, messages, frames=1):
+    async def run():
+        for _ in range(messages):
+            await pacer.wait(frames)
+    asyncio.run(run())
+
+
+def test_sender_ahead_of_real_time_is_held_back_without_overruns():
+    clock = FakeClock()
+    pacer = FramePacer(lead_ms=100, clock=clock, sleep=clock.sleep)
+    # All the audio is available at once, as with a cached prompt
+    send(pacer, 250)
+    assert pacer.frames_sent == 250
+    assert pacer.overruns == 0
+    assert pacer.underruns == 0
+    # The last frame goes out one lead ahead of its play time, 249 frames after the first
+    assert abs(clock.now - (250 * 0.02 - 0.1 - 0.02)) < 1e-9
+    assert pacer.buffered_ms <= 100 + 20 + 1e-6
+
+
+def test_packed_messages_beyond_the_tolerance_are_overruns():
+    clock = FakeClock()
+    pacer = FramePacer(lead_ms=100, clock=clock, sleep=clock.sleep, tolerance_ms=40)
+    send(pacer, 10, frames=5)
+    # 100 ms per message on top of the 100 ms lead; only the first finds the queue empty
+    assert pacer.overruns == 9
+
+
+def test_late_frames_are_underruns_and_rebase_the_schedule():
+    clock = FakeClock()
+    pacer = FramePacer(lead_ms=100, clock=clock, sleep=clock.sleep)
+    send(pacer, 10)
+    clock.now += 1.0  # The sender stalled for a second
+    send(pacer, 10)
+    assert pacer.underruns == 1
+    assert pacer.late_seconds > 0.8
+    assert pacer.overruns == 0
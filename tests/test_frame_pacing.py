@@ -0,0 +1,31 @@
+"""
+Outbound media pacing with several calls in flight at once.
+
+Runs concurrent simulated Twilio streams through the real /media handler, with the providers
+replaced by the load test's stubs (which block their stage threads like the real SDKs do), and
+checks that every call's reply frames still arrive on the 20 ms cadence.
+"""
+import asyncio
+from benchmarks import load_test
+
+CALLS = 6
+# RFC 3550 interarrival jitter, worst over all calls; half a frame leaves Twilio's buffer untouched
+MAX_JITTER_MS = 10.0
+
+
+def test_concurrent_calls_keep_frame_pacing(tmp_path, monkeypatch):
+    # Call records, bookings and rendered prompts are written to the working directory
+    monkeypatch.chdir(tmp_path)
+    args = load_test.build_parser().parse_args(["--calls", str(CALLS), "--ramp", "0.5"])
+    utterances = load_test.default_utterances()[:2]
+    args.turns = len(utterances)
+    load_test.install_stubs(args, str(tmp_path))
+
+    report = asyncio.run(load_test.run_load(args, utterances))
+
+    assert report["errors"] == []
+    assert report["completed"] == CALLS
+    pacing = report["pacing"]
+    assert pacing["frames_received"] > 0
+    assert pacing["jitter_ms_max"] <= MAX_JITTER_MS, pacing
+    assert pacing["underruns"] == 0, pacing
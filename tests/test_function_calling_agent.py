@@ -0,0 +1,45 @@
+"""Streaming the function-calling agent's reply out of its tool-call arguments."""
+import json
+from types import SimpleNamespace
+import pytest
+from agent.function_calling_agent import FunctionCallingAgent
+
+
+def chunks(arguments, size=7):
+    for start in range(0, len(arguments), size):
+        call = SimpleNamespace(function=SimpleNamespace(arguments=arguments[start:start + size]))
+        yield SimpleNamespace(usage=None, choices=[SimpleNamespace(delta=SimpleNamespace(tool_calls=[call]))])
+
+
+def streamed(arguments):
+    agent = FunctionCallingAgent()
+    agent._request = lambda messages, **kwargs: chunks(arguments)
+    spoken = []
+    turn = agent.run_turn("Yes, book it", "call", on_text=spoken.append)
+    return "".join(spoken), turn
+
+
+@pytest.mark.parametrize("reply_first", [False, True])
+def test_booking_turn_is_never_spoken(reply_first):
+    fields = {"slots": {}, "ready_to_book": True, "reply": "Booking that for you now."}
+    if reply_first:
+        fields = {"reply": fields["reply"], "slots": {}, "ready_to_book": True}
+    spoken, turn = streamed(json.dumps(fields))
+    assert turn.ready_to_book
+    assert spoken == ""
+
+
+@pytest.mark.parametrize("reply_first", [False, True])
+def test_ordinary_reply_is_spoken_whatever_the_property_order(reply_first):
+    fields = {"slots": {"name": "Sarah"}, "ready_to_book": False, "reply": "Thanks Sarah, what's your email?"}
+    if reply_first:
+        fields = {"reply": fields["reply"], "ready_to_book": False, "slots": {"name": "Sarah"}}
+    spoken, turn = streamed(json.dumps(fields))
+    assert not turn.ready_to_book
+    assert spoken == "Thanks Sarah, what's your email?"
+
+
+def test_slots_after_the_reply_are_kept():
+    spoken, turn = streamed(json.dumps({"reply": "Got it.", "ready_to_book": False, "slots": {"email": "sarah@example.com"}}))
+    assert spoken == "Got it."
+    assert turn.slots == {"email": "sarah@example.com"}
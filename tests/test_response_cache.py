@@ -0,0 +1,41 @@
+"""Reply caching by dialog state, and what must never be shared between callers."""
+from agent.slot_extractor import SlotExtractor
+from services.ResponseCache import ResponseCache, classify_intent
+
+ASK_EMAIL = "Thanks! What's the best email to send the details to?"
+
+
+def turn(text, known):
+    extracted, rest = SlotExtractor().parse(text)
+    known = {**known, **extracted}
+    return known, classify_intent(text, extracted), extracted, rest
+
+
+def test_scripted_reply_is_reused_for_the_same_dialog_state():
+    cache = ResponseCache(ttl=60, max_entries=8)
+    known, intent, extracted, rest = turn("My name is Sarah Connor", {})
+    assert cache.put(known, intent, ASK_EMAIL, extracted, rest)
+    known, intent, extracted, rest = turn("Hi, my name is John Smith.", {})
+    assert cache.get(known, intent, extracted, rest) == ASK_EMAIL
+
+
+def test_utterance_with_uncaptured_content_bypasses_the_cache():
+    cache = ResponseCache(ttl=60, max_entries=8)
+    known, intent, extracted, rest = turn("My name is Sarah and I want a two-bedroom condo near the park", {})
+    reply = "Great, a two-bedroom condo near the park. What's your email?"
+    assert intent == "provide_info"
+    assert not cache.put(known, intent, reply, extracted, rest)
+    assert cache.get(known, intent, extracted, rest) is None
+    assert cache.stats()["bypasses"] == {"uncaptured_content": 1}
+
+
+def test_key_includes_the_fields_the_utterance_gave():
+    cache = ResponseCache(ttl=60, max_entries=8)
+    known = {"name": "Sarah Connor", "email": None, "phone": None}
+    gave_phone = turn("my number is five five five, two oh one, three three four four", known)
+    assert cache.put(*gave_phone[:2], ASK_EMAIL, *gave_phone[2:])
+    # Same filled fields, but this caller's last words were their name, not their number
+    known = {"name": None, "email": None, "phone": "5552013344"}
+    gave_name = turn("my name is Sarah Connor", known)
+    assert gave_name[0].keys() == gave_phone[0].keys()
+    assert cache.get(*gave_name[:2], *gave_name[2:]) is None
@@ -0,0 +1,53 @@
+"""Local lead-field extraction from caller transcripts."""
+from datetime import date
+import pytest
+from agent.slot_extractor import SlotExtractor
+
+TODAY = date(2026, 10, 17)  # A Saturday
+
+
+def extract(text):
+    return SlotExtractor().extract(text, today=TODAY)
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("Could we do next Tuesday at three in the afternoon?", "15:00"),
+    ("at four", "16:00"),
+    ("Make it four, actually.", "16:00"),
+    ("at three tomorrow", "15:00"),
+    ("around three thirty", "15:30"),
+    ("say five o'clock", "17:00"),
+    ("at 2 pm", "14:00"),
+    ("half past four", "16:30"),
+    ("I'd like 3:30", "15:30"),
+])
+def test_spoken_times(text, expected):
+    assert extract(text)["time"] == expected
+
+
+@pytest.mark.parametrize("text", [
+    "I am looking at one of the units, it was around two hundred thousand",
+    "around two hundred thousand",
+    "we looked at two houses",
+    "about three bedrooms",
+    "at 3 hundred dollars",
+    "about one fifty thousand",
+])
+def test_numbers_in_small_talk_are_not_times(text):
+    assert "time" not in extract(text)
+
+
+def test_date_and_time_in_one_utterance():
+    assert extract("Could we do next Tuesday at three in the afternoon?") == {"date": "2026-10-20", "time": "15:00"}
+
+
+def test_spoken_email_and_phone():
+    found = extract("My email is sarah dot connor at example dot com and my number is five five five, two oh one, three three four four")
+    assert found["email"] == "sarah.connor@example.com"
+    assert found["phone"] == "5552013344"
+
+
+def test_parse_returns_the_words_no_field_consumed():
+    found, rest = SlotExtractor().parse("My name is Sarah and I want a condo near the park", today=TODAY)
+    assert found == {"name": "Sarah"}
+    assert rest.split() == ["and", "I", "want", "a", "condo", "near", "the", "park"]